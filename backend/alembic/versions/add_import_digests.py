@@ -0,0 +1,42 @@
+"""add import_digests table to answer repeated import requests
+
+Revision ID: add_import_digests
+Revises: add_import_watermarks
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_import_digests"
+down_revision: str | None = "add_import_watermarks"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_digests",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("owner", sa.String(100), nullable=False),
+        sa.Column("digest", sa.String(64), nullable=False),
+        sa.Column("total_records", sa.Integer(), nullable=False),
+        sa.Column("imported", sa.Integer(), nullable=False),
+        sa.Column("skipped", sa.Integer(), nullable=False),
+        sa.Column("errors", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("owner", "digest", name="uq_import_digests_owner_digest"),
+    )
+    op.create_index("ix_import_digests_id", "import_digests", ["id"])
+    op.create_index("ix_import_digests_expires_at", "import_digests", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_digests_expires_at", table_name="import_digests")
+    op.drop_index("ix_import_digests_id", table_name="import_digests")
+    op.drop_table("import_digests")
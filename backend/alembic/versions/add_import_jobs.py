@@ -0,0 +1,52 @@
+"""add import_jobs table for background imports
+
+Revision ID: add_import_jobs
+Revises: unique_health_metric_key
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_import_jobs"
+down_revision: str | None = "unique_health_metric_key"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("owner", sa.String(100), nullable=False),
+        sa.Column("filename", sa.String(255), nullable=False),
+        sa.Column("file_path", sa.Text(), nullable=False),
+        sa.Column("aggregate_days", sa.Integer(), nullable=False),
+        sa.Column("reference_time", sa.DateTime(), nullable=False),
+        sa.Column("phase", sa.String(20), nullable=False),
+        sa.Column("rows_parsed", sa.Integer(), nullable=False),
+        sa.Column("rows_written", sa.Integer(), nullable=False),
+        sa.Column("rows_skipped", sa.Integer(), nullable=False),
+        sa.Column("rows_errored", sa.Integer(), nullable=False),
+        sa.Column("batches_committed", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_import_jobs_id", "import_jobs", ["id"])
+    op.create_index("ix_import_jobs_owner", "import_jobs", ["owner"])
+    op.create_index("ix_import_jobs_phase", "import_jobs", ["phase"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_jobs_phase", table_name="import_jobs")
+    op.drop_index("ix_import_jobs_owner", table_name="import_jobs")
+    op.drop_index("ix_import_jobs_id", table_name="import_jobs")
+    op.drop_table("import_jobs")
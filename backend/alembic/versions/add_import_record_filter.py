@@ -0,0 +1,25 @@
+"""add record filter to import_jobs
+
+Revision ID: add_import_record_filter
+Revises: add_metric_rollup_columns
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_import_record_filter"
+down_revision: str | None = "add_metric_rollup_columns"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("import_jobs", sa.Column("record_filter", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "record_filter")
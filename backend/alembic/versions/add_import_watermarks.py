@@ -0,0 +1,42 @@
+"""add import_watermarks table for incremental imports
+
+Revision ID: add_import_watermarks
+Revises: add_import_record_filter
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_import_watermarks"
+down_revision: str | None = "add_import_record_filter"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "import_watermarks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("owner", sa.String(100), nullable=False),
+        sa.Column("metric_type", sa.String(100), nullable=False),
+        sa.Column("source", sa.String(50), nullable=False),
+        sa.Column("measured_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "owner",
+            "metric_type",
+            "source",
+            name="uq_import_watermarks_owner_metric_type_source",
+        ),
+    )
+    op.create_index("ix_import_watermarks_id", "import_watermarks", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_import_watermarks_id", table_name="import_watermarks")
+    op.drop_table("import_watermarks")
@@ -0,0 +1,29 @@
+"""add (owner, metric_type, measured_at DESC, id) index for keyset pagination
+
+Revision ID: add_metric_listing_index
+Revises: partition_health_metrics
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_metric_listing_index"
+down_revision: str | None = "partition_health_metrics"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INDEX = "ix_health_metrics_owner_metric_type_measured_at_id"
+
+
+def upgrade() -> None:
+    op.create_index(
+        INDEX, "health_metrics", ["owner", "metric_type", sa.text("measured_at DESC"), "id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name="health_metrics")
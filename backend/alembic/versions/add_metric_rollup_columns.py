@@ -0,0 +1,36 @@
+"""add rollup statistics to health_metrics and retention policy to import_jobs
+
+Revision ID: add_metric_rollup_columns
+Revises: add_import_jobs
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_metric_rollup_columns"
+down_revision: str | None = "add_import_jobs"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "health_metrics",
+        sa.Column("resolution_seconds", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column("health_metrics", sa.Column("sample_count", sa.Integer(), nullable=True))
+    op.add_column("health_metrics", sa.Column("value_min", sa.Float(), nullable=True))
+    op.add_column("health_metrics", sa.Column("value_max", sa.Float(), nullable=True))
+    op.add_column("import_jobs", sa.Column("retention_policy", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("import_jobs", "retention_policy")
+    op.drop_column("health_metrics", "value_max")
+    op.drop_column("health_metrics", "value_min")
+    op.drop_column("health_metrics", "sample_count")
+    op.drop_column("health_metrics", "resolution_seconds")
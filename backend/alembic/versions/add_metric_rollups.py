@@ -0,0 +1,246 @@
+"""add health_metric_rollups kept up to date by triggers on health_metrics
+
+Revision ID: add_metric_rollups
+Revises: add_metric_listing_index
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "add_metric_rollups"
+down_revision: str | None = "add_metric_listing_index"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TABLE = "health_metric_rollups"
+KEY = "uq_health_metric_rollups_key"
+PERIODS = "(VALUES ('hour'), ('day'), ('week')) AS p(period)"
+# Rows of these metrics hold the sum of their samples when rolled up (retention.SUM_METRICS).
+SUM_METRICS = "('steps')"
+KEY_COLUMNS = "owner, metric_type, period, bucket_start"
+KEY_MATCH = " AND ".join(f"r.{c} = d.{c}" for c in KEY_COLUMNS.split(", "))
+KEY_ORDER = ", ".join(f"r.{c}" for c in KEY_COLUMNS.split(", "))
+
+
+def _contributions(table: str, sign: int) -> str:
+    """What each row of ``table`` adds to (sign 1) or takes from (-1) its buckets.
+
+    A rolled-up row stands for ``sample_count`` samples; their sum of squares
+    is taken as if every sample had the bucket's mean (or share of the sum).
+    """
+    return f"""
+        SELECT owner, metric_type, p.period, date_trunc(p.period, measured_at) AS bucket_start,
+               {sign} * coalesce(sample_count, 1) AS n,
+               {sign} * CASE WHEN sample_count IS NULL OR metric_type IN {SUM_METRICS}
+                             THEN value ELSE value * sample_count END AS total,
+               {sign} * CASE WHEN sample_count IS NULL THEN value * value
+                             WHEN metric_type IN {SUM_METRICS} THEN value * value / sample_count
+                             ELSE value * value * sample_count END AS squares,
+               {sign} AS sign,
+               coalesce(value_min, value) AS lo,
+               coalesce(value_max, value) AS hi
+        FROM {table} CROSS JOIN {PERIODS}
+    """
+
+
+def _delta(old: str | None, new: str | None) -> str:
+    """Per bucket: net count, sum and squares, and the extremes removed and added."""
+    changes = " UNION ALL ".join(
+        _contributions(table, sign) for table, sign in ((old, -1), (new, 1)) if table
+    )
+    return f"""
+        WITH d AS (
+            SELECT {KEY_COLUMNS},
+                   sum(n) AS n, sum(total) AS total, sum(squares) AS squares,
+                   min(lo) FILTER (WHERE sign < 0) AS removed_lo,
+                   max(hi) FILTER (WHERE sign < 0) AS removed_hi,
+                   min(lo) FILTER (WHERE sign > 0) AS added_lo,
+                   max(hi) FILTER (WHERE sign > 0) AS added_hi
+            FROM ({changes}) AS c
+            GROUP BY {KEY_COLUMNS}
+        )
+    """
+
+
+def _apply(old: str | None, new: str | None) -> str:
+    delta = _delta(old, new)
+    statements = [
+        # Every bucket gets a row first, so concurrent writers meet on it below.
+        f"""{delta}
+        INSERT INTO {TABLE} ({KEY_COLUMNS}, sample_count, value_sum, sum_squares, updated_at)
+        SELECT {KEY_COLUMNS}, 0, 0, 0, now() AT TIME ZONE 'utc' FROM d
+        ORDER BY {KEY_COLUMNS}
+        ON CONFLICT ON CONSTRAINT {KEY} DO NOTHING""",
+        # Rows are locked in key order before any is changed, so writers sharing
+        # buckets queue on the first one rather than deadlocking. A removed
+        # extreme leaves min/max unknown (NULL) unless an added value covers it.
+        f"""{delta}, locked AS MATERIALIZED (
+            SELECT r.id, d.* FROM {TABLE} AS r JOIN d ON {KEY_MATCH}
+            ORDER BY {KEY_ORDER}
+            FOR UPDATE OF r
+        )
+        UPDATE {TABLE} AS r
+        SET sample_count = r.sample_count + d.n,
+            value_sum = r.value_sum + d.total,
+            sum_squares = r.sum_squares + d.squares,
+            value_min = CASE
+                WHEN r.sample_count = 0 THEN d.added_lo
+                WHEN d.removed_lo IS NULL OR d.removed_lo > r.value_min
+                    THEN least(r.value_min, d.added_lo)
+                WHEN d.added_lo <= r.value_min THEN d.added_lo
+            END,
+            value_max = CASE
+                WHEN r.sample_count = 0 THEN d.added_hi
+                WHEN d.removed_hi IS NULL OR d.removed_hi < r.value_max
+                    THEN greatest(r.value_max, d.added_hi)
+                WHEN d.added_hi >= r.value_max THEN d.added_hi
+            END,
+            updated_at = now() AT TIME ZONE 'utc'
+        FROM locked AS d
+        WHERE r.id = d.id""",
+    ]
+    if old:
+        statements += [
+            f"""{delta}
+            DELETE FROM {TABLE} AS r USING d
+            WHERE {KEY_MATCH} AND r.sample_count <= 0""",
+            f"""{delta}
+            UPDATE {TABLE} AS r
+            SET value_min = s.lo, value_max = s.hi
+            FROM d, LATERAL (
+                SELECT min(coalesce(m.value_min, m.value)) AS lo,
+                       max(coalesce(m.value_max, m.value)) AS hi
+                FROM health_metrics m
+                WHERE m.owner = d.owner AND m.metric_type = d.metric_type
+                  AND m.measured_at >= d.bucket_start
+                  AND m.measured_at < d.bucket_start + ('1 ' || d.period)::interval
+            ) AS s
+            WHERE {KEY_MATCH} AND (r.value_min IS NULL OR r.value_max IS NULL)""",
+        ]
+    return ";\n".join(statements) + ";"
+
+
+APPLY_FUNCTION = f"""
+CREATE FUNCTION health_metric_rollups_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Set by writes that keep totals as they are, such as retention compaction.
+    IF current_setting('health_buddy.skip_rollups', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        {_apply(None, "new_rows")}
+    ELSIF TG_OP = 'UPDATE' THEN
+        {_apply("old_rows", "new_rows")}
+    ELSE
+        {_apply("old_rows", None)}
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+REBUILD_FUNCTION = f"""
+CREATE FUNCTION health_metric_rollups_rebuild(target_owner text) RETURNS bigint
+LANGUAGE plpgsql AS $$
+DECLARE
+    written bigint;
+BEGIN
+    -- Writers wait in their triggers and apply their rows on top of the rebuilt totals.
+    LOCK TABLE {TABLE} IN EXCLUSIVE MODE;
+    DELETE FROM {TABLE} WHERE target_owner IS NULL OR owner = target_owner;
+    INSERT INTO {TABLE} (
+        {KEY_COLUMNS}, sample_count, value_sum, sum_squares, value_min, value_max, updated_at
+    )
+    SELECT {KEY_COLUMNS}, sum(n), sum(total), sum(squares), min(lo), max(hi),
+           now() AT TIME ZONE 'utc'
+    FROM ({_contributions("health_metrics", 1)}
+          WHERE target_owner IS NULL OR owner = target_owner) AS c
+    GROUP BY {KEY_COLUMNS};
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END
+$$
+"""
+
+
+# Recomputes, for one owner and metric, the buckets of every period that overlap
+# [since, until), e.g. after writes made with the triggers off.
+REBUILD_RANGE_FUNCTION = f"""
+CREATE FUNCTION health_metric_rollups_rebuild_range(
+    target_owner text, target_metric text, since timestamp, until timestamp
+) RETURNS bigint
+LANGUAGE plpgsql AS $$
+DECLARE
+    written bigint;
+BEGIN
+    LOCK TABLE {TABLE} IN EXCLUSIVE MODE;
+    DELETE FROM {TABLE}
+    WHERE owner = target_owner AND metric_type = target_metric
+      AND bucket_start >= date_trunc(period, since) AND bucket_start < until;
+    INSERT INTO {TABLE} (
+        {KEY_COLUMNS}, sample_count, value_sum, sum_squares, value_min, value_max, updated_at
+    )
+    SELECT {KEY_COLUMNS}, sum(n), sum(total), sum(squares), min(lo), max(hi),
+           now() AT TIME ZONE 'utc'
+    FROM ({_contributions("health_metrics", 1)}
+          WHERE owner = target_owner AND metric_type = target_metric
+            AND measured_at >= date_trunc('week', since)
+            AND measured_at < date_trunc('week', until) + interval '1 week') AS c
+    WHERE bucket_start >= date_trunc(period, since) AND bucket_start < until
+    GROUP BY {KEY_COLUMNS};
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        TABLE,
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("owner", sa.String(100), nullable=False),
+        sa.Column("metric_type", sa.String(100), nullable=False),
+        sa.Column("period", sa.String(10), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("sample_count", sa.BigInteger(), nullable=False),
+        sa.Column("value_sum", sa.Float(), nullable=False),
+        sa.Column("sum_squares", sa.Float(), nullable=False),
+        sa.Column("value_min", sa.Float(), nullable=True),
+        sa.Column("value_max", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("owner", "metric_type", "period", "bucket_start", name=KEY),
+    )
+    op.create_index("ix_health_metric_rollups_id", TABLE, ["id"])
+    op.execute(APPLY_FUNCTION)
+    op.execute(REBUILD_FUNCTION)
+    op.execute(REBUILD_RANGE_FUNCTION)
+    for event, transition in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        op.execute(
+            f"CREATE TRIGGER health_metric_rollups_{event.lower()} AFTER {event} "
+            f"ON health_metrics REFERENCING {transition} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION health_metric_rollups_apply()"
+        )
+    op.execute("SELECT health_metric_rollups_rebuild(NULL)")
+
+
+def downgrade() -> None:
+    for event in ("insert", "update", "delete"):
+        op.execute(f"DROP TRIGGER health_metric_rollups_{event} ON health_metrics")
+    op.execute(
+        "DROP FUNCTION health_metric_rollups_rebuild_range(text, text, timestamp, timestamp)"
+    )
+    op.execute("DROP FUNCTION health_metric_rollups_rebuild(text)")
+    op.execute("DROP FUNCTION health_metric_rollups_apply()")
+    op.drop_index("ix_health_metric_rollups_id", table_name=TABLE)
+    op.drop_table(TABLE)
@@ -0,0 +1,140 @@
+"""partition health_metrics by month of measured_at
+
+Revision ID: partition_health_metrics
+Revises: add_import_digests
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+from datetime import UTC, date, datetime
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision: str = "partition_health_metrics"
+down_revision: str | None = "add_import_digests"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TABLE = "health_metrics"
+OLD_TABLE = "health_metrics_old"
+DEFAULT_PARTITION = "health_metrics_default"
+UNIQUE_KEY = "uq_health_metrics_owner_metric_type_measured_at"
+INDEXED = ("id", "measured_at", "metric_type", "owner", "source")
+# Partitions created for the months after the current one; maintenance keeps it so.
+MONTHS_AHEAD = 3
+
+COLUMNS = (
+    "id",
+    "metric_type",
+    "value",
+    "unit",
+    "measured_at",
+    "owner",
+    "notes",
+    "is_active",
+    "created_at",
+    "updated_at",
+    "source",
+    "resolution_seconds",
+    "sample_count",
+    "value_min",
+    "value_max",
+)
+
+
+def _columns() -> list[sa.Column]:
+    return [
+        sa.Column(
+            "id",
+            sa.Integer(),
+            nullable=False,
+            server_default=sa.text("nextval('health_metrics_id_seq'::regclass)"),
+        ),
+        sa.Column("metric_type", sa.String(100), nullable=False),
+        sa.Column("value", sa.Float(), nullable=False),
+        sa.Column("unit", sa.String(50), nullable=False),
+        sa.Column("measured_at", sa.DateTime(), nullable=False),
+        sa.Column("owner", sa.String(100), nullable=False),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("source", sa.String(50), nullable=False, server_default="manual"),
+        sa.Column("resolution_seconds", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sample_count", sa.Integer(), nullable=True),
+        sa.Column("value_min", sa.Float(), nullable=True),
+        sa.Column("value_max", sa.Float(), nullable=True),
+    ]
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _detach_keys(table: str) -> None:
+    """Free the sequence, index and constraint names of ``table`` for its replacement."""
+    op.execute("ALTER SEQUENCE health_metrics_id_seq OWNED BY NONE")
+    op.rename_table(TABLE, table)
+    for column in INDEXED:
+        op.drop_index(f"ix_health_metrics_{column}", table_name=table)
+    op.drop_constraint(UNIQUE_KEY, table, type_="unique")
+    op.drop_constraint("health_metrics_pkey", table, type_="primary")
+
+
+def _create_keys() -> None:
+    op.execute("ALTER SEQUENCE health_metrics_id_seq OWNED BY health_metrics.id")
+    for column in INDEXED:
+        op.create_index(f"ix_health_metrics_{column}", TABLE, [column])
+
+
+def _copy_rows(source: str) -> None:
+    columns = ", ".join(COLUMNS)
+    op.execute(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {source}")
+    op.drop_table(source)
+
+
+def upgrade() -> None:
+    _detach_keys(OLD_TABLE)
+    op.create_table(
+        TABLE,
+        *_columns(),
+        sa.PrimaryKeyConstraint("id", "measured_at"),
+        sa.UniqueConstraint("owner", "metric_type", "measured_at", name=UNIQUE_KEY),
+        postgresql_partition_by="RANGE (measured_at)",
+    )
+    _create_keys()
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+    # One partition per month that has rows, and for the current and coming months.
+    months = {
+        row[0]
+        for row in op.get_bind().execute(
+            sa.text(f"SELECT DISTINCT date_trunc('month', measured_at)::date FROM {OLD_TABLE}")
+        )
+    }
+    month = datetime.now(UTC).date().replace(day=1)
+    for _ in range(MONTHS_AHEAD + 1):
+        months.add(month)
+        month = _next_month(month)
+    for month in sorted(months):
+        op.execute(
+            f"CREATE TABLE health_metrics_p{month:%Y_%m} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month}') TO ('{_next_month(month)}')"
+        )
+    _copy_rows(OLD_TABLE)
+
+
+def downgrade() -> None:
+    # Partitions detached by retention are left as they are.
+    partitioned = "health_metrics_partitioned"
+    _detach_keys(partitioned)
+    op.create_table(
+        TABLE,
+        *_columns(),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("owner", "metric_type", "measured_at", name=UNIQUE_KEY),
+    )
+    _create_keys()
+    _copy_rows(partitioned)
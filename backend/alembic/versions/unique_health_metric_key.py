@@ -0,0 +1,42 @@
+"""deduplicate health_metrics and add unique (owner, metric_type, measured_at)
+
+Revision ID: unique_health_metric_key
+Revises: add_source_column
+Create Date: 2026-10-18
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+revision: str = "unique_health_metric_key"
+down_revision: str | None = "add_source_column"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+CONSTRAINT = "uq_health_metrics_owner_metric_type_measured_at"
+
+
+def upgrade() -> None:
+    # Keep one row per key: manual entries win, then the most recently updated row.
+    op.execute(
+        """
+        DELETE FROM health_metrics AS hm
+        USING (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY owner, metric_type, measured_at
+                       ORDER BY (source = 'manual') DESC, updated_at DESC, id DESC
+                   ) AS rn
+            FROM health_metrics
+        ) AS ranked
+        WHERE hm.id = ranked.id AND ranked.rn > 1
+        """
+    )
+    op.create_unique_constraint(
+        CONSTRAINT, "health_metrics", ["owner", "metric_type", "measured_at"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(CONSTRAINT, "health_metrics", type_="unique")
@@ -1,56 +1,41 @@
-from datetime import datetime
-
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.models import HealthGoal, HealthMetric, LabResult, Medication, Supplement
+from app.core.database import get_async_db
+from app.models import HealthGoal, LabResult, Medication, Supplement
+from app.services.crud import async_health_metric
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 
 @router.get("/")
-def get_dashboard_data(owner: str, db: Session = Depends(get_db)):
-    now = datetime.utcnow()
-
-    latest_metrics = (
-        db.query(HealthMetric)
-        .filter(HealthMetric.owner == owner)
-        .order_by(HealthMetric.measured_at.desc())
-        .limit(10)
-        .all()
-    )
+async def get_dashboard_data(owner: str, db: AsyncSession = Depends(get_async_db)):
+    latest_metrics = await async_health_metric.latest(db, owner, limit=10)
 
-    active_medications = (
-        db.query(Medication)
-        .filter(Medication.owner == owner, Medication.is_active == True)
-        .all()
+    active_medications = await db.scalars(
+        select(Medication).where(Medication.owner == owner, Medication.is_active.is_(True))
     )
 
-    active_supplements = (
-        db.query(Supplement)
-        .filter(Supplement.owner == owner, Supplement.is_active == True)
-        .all()
+    active_supplements = await db.scalars(
+        select(Supplement).where(Supplement.owner == owner, Supplement.is_active.is_(True))
     )
 
-    recent_lab_results = (
-        db.query(LabResult)
-        .filter(LabResult.owner == owner)
+    recent_lab_results = await db.scalars(
+        select(LabResult)
+        .where(LabResult.owner == owner)
         .order_by(LabResult.test_date.desc())
         .limit(3)
-        .all()
     )
 
-    active_goals = (
-        db.query(HealthGoal)
-        .filter(HealthGoal.owner == owner, HealthGoal.is_completed == False)
-        .all()
+    active_goals = await db.scalars(
+        select(HealthGoal).where(HealthGoal.owner == owner, HealthGoal.is_completed.is_(False))
     )
 
     return {
         "latest_metrics": latest_metrics,
-        "active_medications": active_medications,
-        "active_supplements": active_supplements,
-        "recent_lab_results": recent_lab_results,
-        "active_goals": active_goals,
+        "active_medications": active_medications.all(),
+        "active_supplements": active_supplements.all(),
+        "recent_lab_results": recent_lab_results.all(),
+        "active_goals": active_goals.all(),
     }
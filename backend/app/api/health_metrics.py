@@ -1,52 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.core.database import get_db
-from app.schemas import HealthMetricCreate, HealthMetricResponse, HealthMetricUpdate
-from app.services.crud import health_metric
+from app.api.import_health import DEFAULT_OWNER
+from app.core.database import SessionLocal, get_async_db, get_db
+from app.schemas import (
+    CompactionResult,
+    HealthMetricCreate,
+    HealthMetricResponse,
+    HealthMetricUpdate,
+    MetricSummary,
+    PartitionMaintenanceResult,
+    RollupPeriod,
+    SeriesPoint,
+)
+from app.services.base import Cursor
+from app.services.crud import async_health_metric
+from app.services.metric_partitions import metric_partitions
+from app.services.metric_rollups import metric_rollup_service
+from app.services.metric_series import metric_series_service
+from app.services.retention import retention_compactor
 
 router = APIRouter(prefix="/health-metrics", tags=["health-metrics"])
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
 @router.post("", response_model=HealthMetricResponse)
-def create_health_metric(metric: HealthMetricCreate, db: Session = Depends(get_db)):
-    return health_metric.create(db=db, obj_in=metric)
+async def create_health_metric(
+    metric: HealthMetricCreate, db: AsyncSession = Depends(get_async_db)
+):
+    return await async_health_metric.create(db=db, obj_in=metric)
+
+
+@router.post("/compact", response_model=CompactionResult)
+def compact_health_metrics(db: Session = Depends(get_db)):
+    """Roll stored metrics up to the retention policy configured in app_config now."""
+    return retention_compactor.compact(db)
+
+
+@router.post("/partitions", response_model=PartitionMaintenanceResult)
+def maintain_health_metric_partitions(db: Session = Depends(get_db)):
+    """Move rows out of the default partition, create coming months and expire old ones now."""
+    return metric_partitions.maintain(db)
+
+
+@router.get("/summary", response_model=list[MetricSummary])
+async def summarize_health_metrics(
+    owner: str,
+    metric_type: str,
+    period: RollupPeriod = "day",
+    from_: datetime | None = Query(None, alias="from", description="Earliest bucket start"),
+    to: datetime | None = Query(None, description="Buckets starting before this"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Count, total, mean, min, max and standard deviation per hour, day or week.
+
+    Read from the rollups kept up to date on every write, so this never scans samples.
+    """
+    return await db.run_sync(metric_rollup_service.summary, owner, metric_type, period, from_, to)
+
+
+@router.get("/series", response_model=list[SeriesPoint])
+async def health_metric_series(
+    metric_type: str,
+    owner: str = Query(DEFAULT_OWNER),
+    points: int = Query(600, ge=2, le=10_000, description="Most points to return"),
+    from_: datetime | None = Query(None, alias="from", description="Earliest measured_at"),
+    to: datetime | None = Query(None, description="measured_at before this (exclusive)"),
+):
+    """A metric's values for a chart, oldest first.
+
+    Ranges with more than ``points`` rows come back as the lowest and highest
+    value of each of ``points / 2`` equal time buckets, so the payload stays
+    small however long the range. Only ``owner``'s rows are read.
+    """
+    # The fold reads and reduces every row in the range: keep it off the event loop.
+    return await run_in_threadpool(_series, owner, metric_type, points, from_, to)
+
+
+def _series(
+    owner: str,
+    metric_type: str,
+    points: int,
+    since: datetime | None,
+    until: datetime | None,
+) -> list[SeriesPoint]:
+    with SessionLocal() as db:
+        return metric_series_service.series(db, owner, metric_type, points, since, until)
 
 
 @router.get("/{metric_id}", response_model=HealthMetricResponse)
-def get_health_metric(metric_id: int, db: Session = Depends(get_db)):
-    db_metric = health_metric.get(db=db, id=metric_id)
+async def get_health_metric(metric_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_metric = await async_health_metric.get(db=db, id=metric_id)
     if not db_metric:
         raise HTTPException(status_code=404, detail="Health metric not found")
     return db_metric
 
 
 @router.get("", response_model=list[HealthMetricResponse])
-def list_health_metrics(
+async def list_health_metrics(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     owner: str | None = None,
     metric_type: str | None = None,
-    db: Session = Depends(get_db),
+    from_: datetime | None = Query(None, alias="from", description="Earliest measured_at"),
+    to: datetime | None = Query(None, description="measured_at before this (exclusive)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return health_metric.get_multi(
-        db=db, skip=skip, limit=limit, owner=owner, metric_type=metric_type
+    """Metrics, latest first.
+
+    Page with ``cursor`` rather than ``skip``: while more rows follow, the
+    ``X-Next-Cursor`` header holds the cursor for the next page, and every page
+    costs the same however deep it is.
+    """
+    try:
+        after = Cursor.decode(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    metrics = await async_health_metric.get_multi(
+        db=db,
+        skip=skip,
+        limit=limit + 1,
+        owner=owner,
+        metric_type=metric_type,
+        since=from_,
+        until=to,
+        after=after,
     )
+    if len(metrics) > limit:
+        metrics = metrics[:limit]
+        last = metrics[-1]
+        response.headers[NEXT_CURSOR_HEADER] = Cursor(last.measured_at, last.id).encode()
+    return metrics
 
 
 @router.patch("/{metric_id}", response_model=HealthMetricResponse)
-def update_health_metric(
-    metric_id: int, metric_update: HealthMetricUpdate, db: Session = Depends(get_db)
+async def update_health_metric(
+    metric_id: int, metric_update: HealthMetricUpdate, db: AsyncSession = Depends(get_async_db)
 ):
-    db_metric = health_metric.get(db=db, id=metric_id)
+    db_metric = await async_health_metric.get(db=db, id=metric_id)
     if not db_metric:
         raise HTTPException(status_code=404, detail="Health metric not found")
-    return health_metric.update(db=db, db_obj=db_metric, obj_in=metric_update)
+    return await async_health_metric.update(db=db, db_obj=db_metric, obj_in=metric_update)
 
 
 @router.delete("/{metric_id}", response_model=HealthMetricResponse)
-def delete_health_metric(metric_id: int, db: Session = Depends(get_db)):
-    db_metric = health_metric.delete(db=db, id=metric_id)
+async def delete_health_metric(metric_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_metric = await async_health_metric.delete(db=db, id=metric_id)
     if not db_metric:
         raise HTTPException(status_code=404, detail="Health metric not found")
     return db_metric
@@ -1,57 +1,292 @@
 """API endpoints for importing Apple Health data."""
 
+import hashlib
+import json
 import logging
+import tempfile
+from collections.abc import Callable, Iterable, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import IO
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.core.database import get_db
-from app.models import HealthMetric
-from app.schemas import HealthAutoExportPayload, HealthMetricCreate, ImportResult
+from app.core.config import settings
+from app.core.database import SessionLocal, get_async_db, get_db
+from app.models import ImportJob
+from app.schemas import (
+    HealthAutoExportPayload,
+    ImportJobResponse,
+    ImportResult,
+    ImportStatus,
+)
 from app.services.apple_health_parser import apple_health_parser
+from app.services.auto_export_stream import AutoExportStream
 from app.services.crud import health_metric
+from app.services.import_digests import (
+    copy_digesting,
+    idempotency_digest,
+    import_digest_service,
+    request_digest,
+)
+from app.services.import_jobs import import_job_runner
+from app.services.import_watermarks import import_watermark_service
+from app.services.metric_batch import MetricBatch
+from app.services.parse_pool import ExportParseError, parse_pool
+from app.services.record_filter import RecordFilter
+from app.services.request_body import (
+    MSGPACK_TYPES,
+    BodyTooLargeError,
+    UnsupportedBodyError,
+    decode_payload,
+    iter_body,
+    media_type,
+    read_body,
+)
+from app.services.retention import import_policy
+from app.services.source_adapters import SOURCE_ADAPTERS, SourceAdapter, UploadSource
+from app.services.webhook_buffer import BufferFullError, webhook_buffer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/import", tags=["import"])
 
 DEFAULT_OWNER = "default_user"
+APPLE_HEALTH = SOURCE_ADAPTERS["apple-health"]
+
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
+
+TYPES_QUERY = Query(None, description="Only import these metric types, e.g. heart_rate")
+SINCE_QUERY = Query(None, description="Only import records starting at or after this time")
+UNTIL_QUERY = Query(None, description="Only import records starting before this time")
+INCREMENTAL_QUERY = Query(
+    False, description="Skip records older than what earlier imports already stored"
+)
+
+# Set on responses that repeat the stored result of an identical earlier request.
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Seconds a webhook sender should wait after a 429.
+WEBHOOK_RETRY_AFTER = "5"
 
 
 @router.post("/apple-health", response_model=ImportResult)
-async def import_apple_health_xml(
+def import_apple_health_xml(
+    response: Response,
     file: UploadFile = File(...),
     owner: str = Query(DEFAULT_OWNER),
     aggregate_days: int = Query(30, description="Aggregate old data to daily values. 0=disable"),
+    types: list[str] | None = TYPES_QUERY,
+    since: datetime | None = SINCE_QUERY,
+    until: datetime | None = UNTIL_QUERY,
+    incremental: bool = INCREMENTAL_QUERY,
     db: Session = Depends(get_db),
 ) -> ImportResult:
-    """Import Apple Health export XML file.
+    """Import an Apple Health export.xml, or the export.zip produced by the Health app.
 
     High-frequency metrics (heart_rate, steps, hrv) older than aggregate_days
-    are aggregated to daily averages/sums to reduce storage.
+    are aggregated to daily averages/sums to reduce storage. A retention policy
+    configured in app_config (``metric_retention_policy``) replaces that rule
+    unless aggregate_days is 0, which keeps every record raw.
+
+    ``types``, ``since`` and ``until`` limit the import to some metric types and
+    a window of record start times (wall time, read as UTC). Records outside
+    them, like those of types that are never imported, are skipped in the raw
+    bytes without being parsed.
+
+    With ``incremental`` set, each metric type is only read from the day its
+    last imported record fell in, less
+    ``settings.import_incremental_overlap_hours``, so re-uploading a growing
+    export only parses what is new.
+
+    Uploading the same file with the same parameters again within
+    ``settings.import_digest_ttl_seconds`` returns the first result without
+    importing, with the ``Idempotent-Replayed`` header set.
+
+    The upload is staged to disk and parsed as a stream in a worker process, so
+    neither the raw bytes nor the element tree are held in memory and the event
+    loop keeps serving other requests. For ZIP uploads only
+    apple_health_export/export.xml is decompressed, on the fly.
     """
-    if not file.filename or not file.filename.endswith(".xml"):
-        raise HTTPException(status_code=400, detail="File must be an XML file")
+    _check_upload(file)
+    record_filter = _record_filter(db, owner, types, since, until, incremental)
+    policy = import_policy(db, aggregate_days)
+    return _import_upload(
+        db,
+        response,
+        file,
+        owner,
+        "apple-health",
+        {"policy": policy.to_json(), "filter": record_filter.to_json(), "incremental": incremental},
+        lambda path: parse_pool.iter_export(path, owner, policy, record_filter=record_filter),
+    )
 
-    content = await file.read()
-    if not content:
-        raise HTTPException(status_code=400, detail="File is empty")
 
-    try:
-        metrics = apple_health_parser.parse_xml(content, owner, aggregate_days)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse XML: {e}") from e
+@router.post("/apple-health/jobs", response_model=ImportJobResponse, status_code=202)
+def submit_apple_health_import_job(
+    file: UploadFile = File(...),
+    owner: str = Query(DEFAULT_OWNER),
+    aggregate_days: int = Query(30, description="Aggregate old data to daily values. 0=disable"),
+    types: list[str] | None = TYPES_QUERY,
+    since: datetime | None = SINCE_QUERY,
+    until: datetime | None = UNTIL_QUERY,
+    incremental: bool = INCREMENTAL_QUERY,
+    db: Session = Depends(get_db),
+) -> ImportJob:
+    """Queue an Apple Health export.xml or export.zip for import in the background.
 
-    return _import_metrics(db, metrics, owner)
+    Returns as soon as the upload is stored; poll ``GET /import/jobs/{id}`` for
+    progress. Jobs survive restarts and resume after their last committed batch.
+    Filters work as for the synchronous import; an incremental job starts from
+    the watermarks as they are when it is submitted.
+    """
+    filename = _check_upload(file)
+    record_filter = _record_filter(db, owner, types, since, until, incremental)
+    job = import_job_runner.create(db, file.file, filename, owner, aggregate_days, record_filter)
+    import_job_runner.submit(job.id)
+    return job
 
 
-@router.post("/apple-health/webhook", response_model=ImportResult)
-def import_apple_health_webhook(
-    payload: HealthAutoExportPayload,
+@router.post("/{source}", response_model=ImportResult)
+def import_source_file(
+    source: UploadSource,
+    response: Response,
+    file: UploadFile = File(...),
     owner: str = Query(DEFAULT_OWNER),
+    aggregate_days: int = Query(30, description="Aggregate old data to daily values. 0=disable"),
     db: Session = Depends(get_db),
 ) -> ImportResult:
-    """Webhook endpoint for Health Auto Export app."""
+    """Import a file from another source: a CSV (``csv``) or a Garmin FIT file (``fit``).
+
+    A CSV needs a header row with ``metric_type``, ``value`` and
+    ``measured_at`` (ISO 8601) columns and may have a ``unit`` column; FIT
+    files give heart rate, weight, body fat and blood pressure readings.
+    Metric types and units are those of Apple Health imports.
+
+    Readings go through the same pipeline as Apple Health exports: they are
+    parsed as a stream in a worker process, rolled up like Apple Health data
+    (see ``aggregate_days``), and written in deduplicated batches; manual
+    entries are never overwritten. Repeated uploads are replayed as for
+    Apple Health exports.
+    """
+    adapter = SOURCE_ADAPTERS[source]
+    _check_upload(file, adapter)
+    policy = import_policy(db, aggregate_days)
+    return _import_upload(
+        db,
+        response,
+        file,
+        owner,
+        source,
+        {"policy": policy.to_json()},
+        lambda path: parse_pool.iter_source(path, source, owner, policy),
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=ImportJobResponse)
+def get_import_job(job_id: int, db: Session = Depends(get_db)) -> ImportJob:
+    """Get the phase and progress counters of a background import job."""
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.get("/status", response_model=ImportStatus)
+def get_import_status(
+    owner: str = Query(DEFAULT_OWNER), db: Session = Depends(get_db)
+) -> ImportStatus:
+    """Get the last completed background import for an owner."""
+    job = db.scalars(
+        select(ImportJob)
+        .where(ImportJob.owner == owner, ImportJob.phase == "completed")
+        .order_by(ImportJob.finished_at.desc())
+        .limit(1)
+    ).first()
+    if not job:
+        return ImportStatus()
+    return ImportStatus(
+        last_import_at=job.finished_at,
+        last_import_source=job.filename,
+        last_import_count=job.rows_written,
+    )
+
+
+async def _auto_export_payload(request: Request) -> HealthAutoExportPayload:
+    """The webhook body, decompressed and decoded from JSON or MessagePack."""
+    try:
+        body = await read_body(request, settings.webhook_max_body_bytes)
+        data = decode_payload(body, media_type(request))
+    except BodyTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except UnsupportedBodyError as e:
+        raise HTTPException(status_code=415, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    try:
+        return HealthAutoExportPayload.model_validate(data)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+
+
+# The webhook decodes its own body, so document it by hand.
+WEBHOOK_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            content_type: {"schema": HealthAutoExportPayload.model_json_schema()}
+            for content_type in ("application/json", "application/msgpack")
+        },
+    }
+}
+
+
+@router.post(
+    "/apple-health/webhook",
+    response_model=ImportResult,
+    status_code=202,
+    openapi_extra=WEBHOOK_BODY,
+)
+async def import_apple_health_webhook(
+    response: Response,
+    payload: HealthAutoExportPayload = Depends(_auto_export_payload),
+    owner: str = Query(DEFAULT_OWNER),
+    idempotency_key: str | None = Header(None, max_length=255),
+    db: AsyncSession = Depends(get_async_db),
+) -> ImportResult:
+    """Webhook endpoint for Health Auto Export app.
+
+    The body is JSON or, with ``Content-Type: application/msgpack``,
+    MessagePack of the same shape, and may be sent with ``Content-Encoding:
+    gzip`` (or ``zstd`` where available). Bodies larger than
+    ``settings.webhook_max_body_bytes`` once decompressed get 413; send those
+    to ``/apple-health/webhook/stream``.
+
+    Valid records are queued and written shortly after in bulk (see
+    ``app.services.webhook_buffer``), so the response counts the records
+    accepted as ``imported`` and nothing as skipped. While too many records
+    wait to be written the webhook answers 429 and the app retries later.
+
+    A payload identical to one imported within
+    ``settings.import_digest_ttl_seconds``, or any payload sent with an
+    ``Idempotency-Key`` already used in that time, gets the first result back
+    without importing, with the ``Idempotent-Replayed`` header set.
+    """
     data: dict = {}
     if payload.data:
         data = {"data": payload.data}
@@ -63,50 +298,181 @@ def import_apple_health_webhook(
             detail="No metrics data in payload. Expected 'data' or 'metrics' field.",
         )
 
-    metrics = apple_health_parser.parse_auto_export_json(data, owner)
-    return _import_metrics(db, metrics, owner)
+    # Hashing and parsing a large payload would stall every other request on the loop.
+    if idempotency_key is not None:
+        digest = idempotency_digest("apple-health/webhook", idempotency_key)
+    else:
+        digest = await run_in_threadpool(_payload_digest, data)
+    # run_sync runs the ledger's queries on the async connection, without a worker thread.
+    if replayed := await db.run_sync(_replay, response, owner, digest):
+        return replayed
+
+    batch = await run_in_threadpool(apple_health_parser.parse_auto_export_batch, data, owner)
+    try:
+        result = webhook_buffer.put(batch)
+    except BufferFullError as e:
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": WEBHOOK_RETRY_AFTER}
+        ) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    await db.run_sync(import_digest_service.record, owner, digest, result)
+    return result
 
 
-def _import_metrics(
-    db: Session, metrics: list[HealthMetricCreate], owner: str
+@router.post("/apple-health/webhook/stream", response_model=ImportResult)
+async def import_apple_health_webhook_stream(
+    request: Request,
+    response: Response,
+    owner: str = Query(DEFAULT_OWNER),
+    idempotency_key: str | None = Header(None, max_length=255),
 ) -> ImportResult:
-    """Import metrics with deduplication."""
-    imported = 0
-    skipped = 0
-    errors = 0
+    """Webhook endpoint for large Health Auto Export payloads, e.g. a full history sync.
 
-    for metric in metrics:
+    Takes the same JSON as ``/apple-health/webhook``, but the body is staged to
+    disk as it arrives and then parsed as a stream, writing a batch of
+    ``settings.import_batch_size`` records at a time, so memory follows the
+    batch size rather than the payload size. The records are written before the
+    response is sent. Compressed bodies are accepted as on
+    ``/apple-health/webhook``; MessagePack is not, as it is only decoded whole.
+    The limit here is ``settings.webhook_stream_max_body_bytes``.
+
+    Repeated bodies and reused ``Idempotency-Key`` headers are replayed as on
+    ``/apple-health/webhook``.
+    """
+    if media_type(request) in MSGPACK_TYPES:
+        raise HTTPException(status_code=415, detail="Streamed payloads must be JSON")
+    endpoint = "apple-health/webhook/stream"
+    digest = request_digest(endpoint, {}) if idempotency_key is None else None
+    settings.import_job_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=settings.import_job_dir, suffix=".json") as staged:
         try:
-            existing = (
-                db.query(HealthMetric)
-                .filter(
-                    HealthMetric.owner == owner,
-                    HealthMetric.metric_type == metric.metric_type,
-                    HealthMetric.measured_at == metric.measured_at,
-                )
-                .first()
+            async for chunk in iter_body(request, settings.webhook_stream_max_body_bytes):
+                # Hashing and disk writes block: do them in a worker thread.
+                await run_in_threadpool(_stage_chunk, staged, digest, chunk)
+        except BodyTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e)) from e
+        except UnsupportedBodyError as e:
+            raise HTTPException(status_code=415, detail=str(e)) from e
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        await run_in_threadpool(staged.flush)
+        if idempotency_key is not None:
+            request_key = idempotency_digest(endpoint, idempotency_key)
+        else:
+            request_key = digest.hexdigest()
+        try:
+            return await run_in_threadpool(
+                _import_stream, response, owner, Path(staged.name), request_key
             )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def _check_upload(file: UploadFile, adapter: SourceAdapter = APPLE_HEALTH) -> str:
+    """Reject uploads that are not a non-empty file of ``adapter``'s kind."""
+    filename = file.filename or ""
+    if not filename.endswith(adapter.suffixes):
+        raise HTTPException(status_code=400, detail=f"File must be {adapter.file_kind}")
+
+    if not file.file.read(1):
+        raise HTTPException(status_code=400, detail="File is empty")
+    file.file.seek(0)
+    return filename
 
-            if existing:
-                if existing.source == "manual":
-                    skipped += 1
-                    continue
-                existing.value = metric.value
-                existing.unit = metric.unit
-                existing.source = metric.source
-                db.commit()
-                imported += 1
-            else:
-                health_metric.create(db=db, obj_in=metric)
-                imported += 1
-        except Exception:
-            logger.exception("Failed to import metric: %s", metric.metric_type)
-            errors += 1
-            db.rollback()
-
-    return ImportResult(
-        total_records=len(metrics),
-        imported=imported,
-        skipped=skipped,
-        errors=errors,
+
+def _record_filter(
+    db: Session,
+    owner: str,
+    types: list[str] | None,
+    since: datetime | None,
+    until: datetime | None,
+    incremental: bool,
+) -> RecordFilter:
+    since_by_metric = (
+        import_watermark_service.incremental_since(db, owner, "apple_health_import")
+        if incremental
+        else None
     )
+    try:
+        return apple_health_parser.record_filter(types, since, until, since_by_metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+def _import_upload(
+    db: Session,
+    response: Response,
+    file: UploadFile,
+    owner: str,
+    endpoint: str,
+    params: dict,
+    parse: Callable[[Path], Iterable[MetricBatch]],
+) -> ImportResult:
+    """Stage an upload to disk and import what ``parse`` reads from it.
+
+    The upload is hashed with ``endpoint`` and ``params`` while it is staged; a
+    repeat within ``settings.import_digest_ttl_seconds`` gets the first result.
+    """
+    settings.import_job_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=settings.import_job_dir, suffix=Path(file.filename or "").suffix
+    ) as staged:
+        digest = request_digest(endpoint, params)
+        copy_digesting(file.file, staged, digest, UPLOAD_COPY_BUFFER_SIZE)
+        staged.flush()
+        if replayed := _replay(db, response, owner, digest.hexdigest()):
+            return replayed
+        try:
+            result = _import_metrics(db, parse(Path(staged.name)))
+        except ExportParseError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        import_digest_service.record(db, owner, digest.hexdigest(), result)
+        return result
+
+
+def _payload_digest(data: dict) -> str:
+    content = request_digest("apple-health/webhook", {})
+    content.update(json.dumps(data, sort_keys=True, separators=(",", ":")).encode())
+    return content.hexdigest()
+
+
+def _replay(db: Session, response: Response, owner: str, digest: str) -> ImportResult | None:
+    """Stored result of an identical earlier request, flagged on ``response``."""
+    result = import_digest_service.get(db, owner, digest)
+    if result is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+
+def _stage_chunk(staged: IO[bytes], digest: "hashlib._Hash | None", chunk: bytes) -> None:
+    if digest is not None:
+        digest.update(chunk)
+    staged.write(chunk)
+
+
+def _import_stream(response: Response, owner: str, path: Path, digest: str) -> ImportResult:
+    """Import a staged Health Auto Export body, on one session owned by this thread."""
+    with SessionLocal() as db:
+        if replayed := _replay(db, response, owner, digest):
+            return replayed
+        with path.open("rb") as body:
+            result = _import_metrics(db, _stream_batches(owner, body))
+        import_digest_service.record(db, owner, digest, result)
+        return result
+
+
+def _stream_batches(owner: str, body: IO[bytes]) -> Iterator[MetricBatch]:
+    stream = AutoExportStream(owner, settings.import_batch_size)
+    while chunk := body.read(UPLOAD_COPY_BUFFER_SIZE):
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+def _import_metrics(db: Session, batches: Iterable[MetricBatch]) -> ImportResult:
+    """Import metrics with deduplication.
+
+    ``batches`` may be a lazy iterator; it is consumed exactly once and written
+    by the bulk upsert path. Manual entries are never overwritten.
+    """
+    return health_metric.bulk_upsert_batches(db, batches)
@@ -1,3 +1,8 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -14,11 +19,39 @@ from app.api import (
     vaccinations,
 )
 from app.core.config import settings
+from app.services.import_jobs import import_job_runner
+from app.services.metric_partitions import metric_partitions
+from app.services.parse_pool import parse_pool
+from app.services.retention import retention_compactor
+from app.services.webhook_buffer import webhook_buffer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Resume import jobs left queued or interrupted by a previous process.
+    tasks = [
+        asyncio.create_task(import_job_runner.poll_forever()),
+        asyncio.create_task(webhook_buffer.run_forever()),
+    ]
+    if settings.retention_compaction_seconds > 0:
+        tasks.append(asyncio.create_task(retention_compactor.run_forever()))
+    if settings.metric_partition_maintenance_seconds > 0:
+        tasks.append(asyncio.create_task(metric_partitions.run_forever()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    webhook_buffer.shutdown()
+    import_job_runner.shutdown()
+    parse_pool.shutdown()
+
 
 app = FastAPI(
     title="Health Buddy API",
     description="Health tracking application backend",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -27,6 +60,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[health_metrics.NEXT_CURSOR_HEADER],
 )
 
 app.include_router(dashboard.router, prefix=settings.api_prefix)
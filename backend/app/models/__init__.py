@@ -1,10 +1,14 @@
 from app.models.app_config import AppConfig
 from app.models.health_goal import HealthGoal
 from app.models.health_metric import HealthMetric
+from app.models.import_digest import ImportDigest
+from app.models.import_job import ImportJob
+from app.models.import_watermark import ImportWatermark
 from app.models.lab_result import LabResult
 from app.models.lab_result_value import LabResultValue
 from app.models.medical_history import MedicalHistory
 from app.models.medication import Medication
+from app.models.metric_rollup import MetricRollup
 from app.models.supplement import Supplement
 from app.models.vaccination import Vaccination
 
@@ -12,10 +16,14 @@ __all__ = [
     "AppConfig",
     "HealthGoal",
     "HealthMetric",
+    "ImportDigest",
+    "ImportJob",
+    "ImportWatermark",
     "LabResult",
     "LabResultValue",
     "MedicalHistory",
     "Medication",
+    "MetricRollup",
     "Supplement",
     "Vaccination",
 ]
@@ -1,15 +1,40 @@
 from datetime import UTC, datetime
 
-from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    PrimaryKeyConstraint,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.database import Base
 
+UNIQUE_KEY_CONSTRAINT = "uq_health_metrics_owner_metric_type_measured_at"
+LISTING_INDEX = "ix_health_metrics_owner_metric_type_measured_at_id"
 
+
+def _utcnow() -> datetime:
+    # Naive, like the column: asyncpg refuses aware datetimes for timestamp columns.
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+# Range partitioned by month of measured_at (see app.services.metric_partitions), so
+# the primary key and unique key both include it.
 class HealthMetric(Base):
     __tablename__ = "health_metrics"
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "measured_at"),
+        UniqueConstraint("owner", "metric_type", "measured_at", name=UNIQUE_KEY_CONSTRAINT),
+        {"postgresql_partition_by": "RANGE (measured_at)"},
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, autoincrement=True, index=True)
     metric_type: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
     value: Mapped[float] = mapped_column(Float, nullable=False)
     unit: Mapped[str] = mapped_column(String(50), nullable=False)
@@ -18,12 +43,27 @@ class HealthMetric(Base):
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
     source: Mapped[str] = mapped_column(String(50), nullable=False, default="manual", index=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(
-        DateTime, default=lambda: datetime.now(UTC), nullable=False
+    # 0 for raw samples; otherwise the bucket size this row was rolled up from.
+    resolution_seconds: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
     )
+    sample_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    value_min: Mapped[float | None] = mapped_column(Float, nullable=True)
+    value_max: Mapped[float | None] = mapped_column(Float, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=_utcnow, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime,
-        default=lambda: datetime.now(UTC),
-        onupdate=lambda: datetime.now(UTC),
+        default=_utcnow,
+        onupdate=_utcnow,
         nullable=False,
     )
+
+
+# Serves metric listings page by page in their order (see CRUDBase.get_multi).
+Index(
+    LISTING_INDEX,
+    HealthMetric.owner,
+    HealthMetric.metric_type,
+    HealthMetric.measured_at.desc(),
+    HealthMetric.id,
+)
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+DIGEST_KEY_CONSTRAINT = "uq_import_digests_owner_digest"
+
+
+class ImportDigest(Base):
+    """Result of an import request, kept for a while to answer repeats of it."""
+
+    __tablename__ = "import_digests"
+    __table_args__ = (UniqueConstraint("owner", "digest", name=DIGEST_KEY_CONSTRAINT),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    owner: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Hex SHA-256 of the request content or of its Idempotency-Key.
+    digest: Mapped[str] = mapped_column(String(64), nullable=False)
+    total_records: Mapped[int] = mapped_column(Integer, nullable=False)
+    imported: Mapped[int] = mapped_column(Integer, nullable=False)
+    skipped: Mapped[int] = mapped_column(Integer, nullable=False)
+    errors: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Naive UTC.
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
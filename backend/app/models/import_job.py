@@ -0,0 +1,50 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    owner: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    file_path: Mapped[str] = mapped_column(Text, nullable=False)
+    aggregate_days: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Retention policy JSON resolved at submission, for the same reason as reference_time.
+    retention_policy: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Record types and date window to import, as RecordFilter JSON; None imports all.
+    record_filter: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Reference time for the parser, fixed at submission so a resumed run
+    # re-parses the upload into exactly the same stream of rows.
+    reference_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    phase: Mapped[str] = mapped_column(
+        String(20), nullable=False, default="queued", index=True
+    )  # queued, running, completed, failed
+    rows_parsed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_written: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_skipped: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_errored: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    batches_committed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=_utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=_utcnow, onupdate=_utcnow, nullable=False
+    )
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if not self.started_at:
+            return None
+        elapsed = ((self.finished_at or _utcnow()) - self.started_at).total_seconds()
+        return round(self.rows_parsed / elapsed, 1) if elapsed > 0 else None
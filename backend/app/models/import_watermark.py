@@ -0,0 +1,30 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+WATERMARK_KEY_CONSTRAINT = "uq_import_watermarks_owner_metric_type_source"
+
+
+class ImportWatermark(Base):
+    """Latest ``measured_at`` imported per owner, metric type and source."""
+
+    __tablename__ = "import_watermarks"
+    __table_args__ = (
+        UniqueConstraint("owner", "metric_type", "source", name=WATERMARK_KEY_CONSTRAINT),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    owner: Mapped[str] = mapped_column(String(100), nullable=False)
+    metric_type: Mapped[str] = mapped_column(String(100), nullable=False)
+    source: Mapped[str] = mapped_column(String(50), nullable=False)
+    # Naive UTC, like health_metrics.measured_at.
+    measured_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(UTC),
+        onupdate=lambda: datetime.now(UTC),
+        nullable=False,
+    )
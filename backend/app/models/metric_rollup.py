@@ -0,0 +1,39 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import BigInteger, DateTime, Float, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+ROLLUP_KEY_CONSTRAINT = "uq_health_metric_rollups_key"
+
+
+class MetricRollup(Base):
+    """Running statistics of an owner's metric over one hour, day or week.
+
+    Kept up to date by statement triggers on ``health_metrics`` (see
+    app.services.metric_rollups); never written by the application.
+    """
+
+    __tablename__ = "health_metric_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "owner", "metric_type", "period", "bucket_start", name=ROLLUP_KEY_CONSTRAINT
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    owner: Mapped[str] = mapped_column(String(100), nullable=False)
+    metric_type: Mapped[str] = mapped_column(String(100), nullable=False)
+    # "hour", "day" or "week" (weeks start on Monday), as for date_trunc.
+    period: Mapped[str] = mapped_column(String(10), nullable=False)
+    # Naive UTC, like health_metrics.measured_at.
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    sample_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    value_sum: Mapped[float] = mapped_column(Float, nullable=False)
+    sum_squares: Mapped[float] = mapped_column(Float, nullable=False)
+    value_min: Mapped[float | None] = mapped_column(Float, nullable=True)
+    value_max: Mapped[float | None] = mapped_column(Float, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(UTC), nullable=False
+    )
@@ -1,12 +1,18 @@
 from app.schemas.app_config import AppConfigCreate, AppConfigResponse, AppConfigUpdate
 from app.schemas.health_goal import HealthGoalCreate, HealthGoalResponse, HealthGoalUpdate
 from app.schemas.health_metric import (
+    CompactionResult,
     HealthMetricCreate,
     HealthMetricResponse,
     HealthMetricUpdate,
+    MetricSummary,
+    PartitionMaintenanceResult,
+    RollupPeriod,
+    SeriesPoint,
 )
 from app.schemas.import_health import (
     HealthAutoExportPayload,
+    ImportJobResponse,
     ImportResult,
     ImportStatus,
 )
@@ -30,6 +36,7 @@ __all__ = [
     "AppConfigCreate",
     "AppConfigResponse",
     "AppConfigUpdate",
+    "CompactionResult",
     "HealthAutoExportPayload",
     "HealthGoalCreate",
     "HealthGoalResponse",
@@ -37,6 +44,7 @@ __all__ = [
     "HealthMetricCreate",
     "HealthMetricResponse",
     "HealthMetricUpdate",
+    "ImportJobResponse",
     "ImportResult",
     "ImportStatus",
     "LabResultCreate",
@@ -50,6 +58,10 @@ __all__ = [
     "MedicationCreate",
     "MedicationResponse",
     "MedicationUpdate",
+    "MetricSummary",
+    "PartitionMaintenanceResult",
+    "RollupPeriod",
+    "SeriesPoint",
     "SupplementCreate",
     "SupplementResponse",
     "SupplementUpdate",
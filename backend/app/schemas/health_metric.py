@@ -3,7 +3,11 @@ from typing import Literal
 
 from pydantic import BaseModel, Field
 
-SourceType = Literal["manual", "apple_health_import", "apple_health_webhook"]
+SourceType = Literal[
+    "manual", "apple_health_import", "apple_health_webhook", "csv_import", "fit_import"
+]
+
+RollupPeriod = Literal["hour", "day", "week"]
 
 
 class HealthMetricBase(BaseModel):
@@ -33,8 +37,48 @@ class HealthMetricUpdate(BaseModel):
 class HealthMetricResponse(HealthMetricBase):
     id: int
     source: SourceType
+    # Rows rolled up by the retention policy: bucket size and the samples it holds.
+    resolution_seconds: int = 0
+    sample_count: int | None = None
+    value_min: float | None = None
+    value_max: float | None = None
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class CompactionResult(BaseModel):
+    """Result of applying the retention policy to stored metrics."""
+
+    rows_compacted: int
+    buckets_written: int
+
+
+class PartitionMaintenanceResult(BaseModel):
+    """Result of maintaining the monthly partitions of ``health_metrics``."""
+
+    created: list[str]
+    rows_moved: int
+    detached: list[str]
+    dropped: list[str]
+
+
+class MetricSummary(BaseModel):
+    """Statistics of a metric's samples in one hour, day or week."""
+
+    bucket_start: datetime
+    sample_count: int
+    total: float
+    mean: float
+    min: float | None
+    max: float | None
+    stddev: float
+
+
+class SeriesPoint(BaseModel):
+    """One point of a chart series."""
+
+    measured_at: datetime
+    value: float
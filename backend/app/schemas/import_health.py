@@ -23,6 +23,28 @@ class ImportStatus(BaseModel):
     last_import_count: int | None = None
 
 
+class ImportJobResponse(BaseModel):
+    """Progress of a background import job."""
+
+    id: int
+    owner: str
+    filename: str
+    phase: str
+    rows_parsed: int
+    rows_written: int
+    rows_skipped: int
+    rows_errored: int
+    batches_committed: int
+    rows_per_second: float | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
 class HealthAutoExportPayload(BaseModel):
     """Health Auto Export JSON payload structure."""
 
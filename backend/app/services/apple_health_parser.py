@@ -1,19 +1,33 @@
 """Apple Health data parser for XML exports and Health Auto Export JSON."""
 
+import io
 import logging
+import posixpath
+import re
 import xml.etree.ElementTree as ET
-from collections import defaultdict
-from datetime import UTC, datetime, timedelta
-from typing import Any
+import zipfile
+from collections.abc import Iterable, Iterator, Mapping
+from datetime import UTC, datetime, timedelta, timezone
+from functools import cache, lru_cache
+from typing import IO, Any
 
 import defusedxml.ElementTree as DefusedET
 
-from app.schemas.health_metric import HealthMetricCreate
+from app.core.config import settings
+from app.schemas.health_metric import HealthMetricCreate, SourceType
+from app.services.bucket_stats import BucketStats, BucketSummary
+from app.services.metric_batch import EPOCH, EPOCH_UTC, MetricBatch, epoch_us, from_epoch_us
+from app.services.overlap_resolver import Fields, OverlapResolver
+from app.services.record_filter import FilteredExport, RecordFilter
+from app.services.retention import SUM_METRICS, RetentionPolicy
+from app.services.sleep_nights import SLEEP_ANALYSIS, STAGE_METRICS, STAGE_PREFIX, SleepNights
 
 logger = logging.getLogger(__name__)
 
-AGGREGATE_METRICS = {"heart_rate", "steps", "hrv", "respiratory_rate", "walking_heart_rate"}
-SUM_METRICS = {"steps"}
+APPLE_HEALTH_EXPORT_MEMBER = "apple_health_export/export.xml"
+
+# The shape Apple Health writes every date in: "2024-01-15 10:00:00 +0100".
+APPLE_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{2}[0-5]\d", re.ASCII)
 
 APPLE_HEALTH_TYPE_MAP: dict[str, tuple[str, str]] = {
     "HKQuantityTypeIdentifierHeartRate": ("heart_rate", "bpm"),
@@ -31,10 +45,16 @@ APPLE_HEALTH_TYPE_MAP: dict[str, tuple[str, str]] = {
     "HKQuantityTypeIdentifierRestingHeartRate": ("resting_heart_rate", "bpm"),
     "HKQuantityTypeIdentifierVO2Max": ("vo2_max", "mL/kg/min"),
     "HKQuantityTypeIdentifierWalkingHeartRateAverage": ("walking_heart_rate", "bpm"),
+    # Category Records, totalled per night (with per-stage totals) by SleepNights.
+    SLEEP_ANALYSIS: ("sleep_hours", "hours"),
 }
 
-# Note: sleep_analysis only supported via webhook (Health Auto Export JSON), not XML import.
-# Apple Health XML uses HKCategoryTypeIdentifierSleepAnalysis with different data format.
+# Unit each imported metric type is stored in.
+METRIC_UNITS = dict(APPLE_HEALTH_TYPE_MAP.values())
+
+# Every Record type the importer maps, in any date range.
+MAPPED_RECORDS = RecordFilter(APPLE_HEALTH_TYPE_MAP)
+
 HEALTH_AUTO_EXPORT_TYPE_MAP: dict[str, tuple[str, str]] = {
     "heart_rate": ("heart_rate", "bpm"),
     "weight_body_mass": ("weight", "kg"),
@@ -55,6 +75,124 @@ HEALTH_AUTO_EXPORT_TYPE_MAP: dict[str, tuple[str, str]] = {
 }
 
 
+@cache
+def _fixed_offset(offset: str) -> timezone:
+    """Shared tzinfo per "+HHMM" offset string, as strptime's ``%z`` would build it."""
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+    return timezone(-delta if offset[0] == "-" else delta)
+
+
+@lru_cache(maxsize=8)
+def _utc_wall_time(now: datetime) -> datetime:
+    """``now`` as naive UTC; one import reuses the same ``now`` for every record."""
+    return now.astimezone(UTC).replace(tzinfo=None)
+
+
+class RollupAggregator:
+    """Bucket statistics for the records a retention policy rolls up, reduced with NumPy.
+
+    A record older than one of its metric's tiers relative to ``now`` goes into
+    the coarsest such tier's bucket. Ages and buckets are taken in UTC, as
+    ``RetentionCompactor`` takes them from the stored ``measured_at``, so a
+    record lands in the same bucket whether it is rolled up on import or later.
+    Partial statistics from several parsers (e.g. one per shard of an export)
+    can be combined with ``merge``.
+    """
+
+    def __init__(self, policy: RetentionPolicy, now: datetime):
+        wall_now = _utc_wall_time(now)
+        # Cutoffs are held as time since the epoch, like the records they are compared with.
+        self._tiers = {
+            metric_type: [
+                (
+                    wall_now - timedelta(days=tier.after_days) - EPOCH,
+                    timedelta(seconds=tier.bucket_seconds),
+                    tier.bucket_seconds,
+                )
+                for tier in policy.tiers(metric_type)
+            ]
+            for metric_type in policy.metric_types
+        }
+        # Keyed by metric type, unit and bucket size: each bucket keeps its records' unit.
+        self.stats: dict[tuple[str, str, int], BucketStats] = {}
+
+    def add(self, metric_type: str, measured_at: datetime, value: float, unit: str) -> bool:
+        """Fold a record into its bucket; False if it should be kept as is."""
+        tiers = self._tiers.get(metric_type)
+        if not tiers:
+            return False
+        since_epoch = measured_at - (EPOCH if measured_at.tzinfo is None else EPOCH_UTC)
+        for cutoff, step, seconds in tiers:
+            if since_epoch < cutoff:
+                break
+        else:
+            return False
+        stats = self.stats.get((metric_type, unit, seconds))
+        if stats is None:
+            stats = self.stats[metric_type, unit, seconds] = BucketStats()
+        stats.add(since_epoch // step, value)
+        return True
+
+    def merge(self, stats: dict[tuple[str, str, int], BucketStats]) -> None:
+        for key, other in stats.items():
+            self.stats.setdefault(key, BucketStats()).merge(other)
+
+    def summaries(self) -> Iterator[tuple[str, str, int, BucketSummary]]:
+        """Count, sum, min and max per metric type, unit, bucket size and bucket."""
+        for (metric_type, unit, seconds), stats in self.stats.items():
+            for summary in stats.summaries():
+                yield metric_type, unit, seconds, summary
+
+    def metrics(
+        self, owner: str, source: SourceType = "apple_health_import"
+    ) -> Iterator[HealthMetricCreate]:
+        """Yield one metric per bucket, timestamped at the bucket's midpoint.
+
+        Models only hold the bucket's value; ``batches`` also carries its statistics.
+        """
+        for metric_type, _, value, unit, measured_at_us, _ in self._rollups():
+            yield HealthMetricCreate(
+                metric_type=metric_type,
+                value=value,
+                unit=unit,
+                measured_at=from_epoch_us(measured_at_us).replace(tzinfo=UTC),
+                owner=owner,
+                source=source,
+            )
+
+    def batches(
+        self, owner: str, source: SourceType = "apple_health_import"
+    ) -> Iterator[MetricBatch]:
+        """The same rows as ``metrics`` with their statistics, one batch per bucket size."""
+        batches: dict[int, MetricBatch] = {}
+        for metric_type, seconds, value, unit, measured_at_us, summary in self._rollups():
+            batch = batches.get(seconds)
+            if batch is None:
+                batch = batches[seconds] = MetricBatch(owner, resolution_seconds=seconds)
+            batch.append_rollup(
+                metric_type,
+                value,
+                unit,
+                measured_at_us,
+                source,
+                summary.count,
+                summary.minimum,
+                summary.maximum,
+            )
+        yield from batches.values()
+
+    def _rollups(self) -> Iterator[tuple[str, int, float, str, int, BucketSummary]]:
+        for metric_type, unit, seconds, summary in self.summaries():
+            if metric_type in SUM_METRICS:
+                agg_value = round(summary.total, 2)
+            else:
+                agg_value = round(summary.mean, 2)
+
+            step_us = seconds * 1_000_000
+            measured_at_us = summary.bucket * step_us + step_us // 2
+            yield metric_type, seconds, agg_value, unit, measured_at_us, summary
+
+
 class AppleHealthParser:
     """Parser for Apple Health data from various sources."""
 
@@ -66,66 +204,274 @@ class AppleHealthParser:
         Args:
             content: XML file content
             owner: Owner identifier
-            aggregate_days: Data older than this many days gets aggregated to daily values.
-                           Set to 0 to disable aggregation.
+            aggregate_days: High-frequency data older than this many days gets
+                           aggregated to daily values. Set to 0 to disable aggregation.
         """
-        metrics: list[HealthMetricCreate] = []
-        to_aggregate: dict[str, dict[str, list[float]]] = defaultdict(
-            lambda: defaultdict(list)
+        return list(self.iter_xml(io.BytesIO(content), owner, aggregate_days))
+
+    def iter_xml(
+        self,
+        source: IO[bytes],
+        owner: str,
+        aggregate_days: int = 30,
+        now: datetime | None = None,
+        policy: RetentionPolicy | None = None,
+        record_filter: RecordFilter | None = None,
+    ) -> Iterator[HealthMetricCreate]:
+        """Stream metrics from an Apple Health export without building the full tree.
+
+        Records are read incrementally from ``source`` and cleared once handled, so
+        memory stays flat regardless of export size. Recent records are yielded as
+        they are parsed; bucketed values for old data are yielded at the end. Old
+        samples are buffered in flat arrays and reduced per bucket in chunks.
+
+        ``policy`` decides what is bucketed; by default, daily values for
+        ``app.services.retention.AGGREGATE_METRICS`` older than
+        ``aggregate_days``. ``now`` fixes the reference time for its cutoffs and
+        the future-date check, so the same input always produces the same stream.
+        ``record_filter`` narrows the Records parsed (by default, every mapped
+        type).
+
+        Cumulative Records (steps) that devices wrote for the same time are
+        resolved to ``settings.import_source_priority`` by ``OverlapResolver``,
+        so they are yielded a day or two of Records later than the rest. Sleep
+        analysis Records are yielded as nightly totals (see ``SleepNights``).
+        """
+        now = now or datetime.now(UTC)
+        if policy is None:
+            policy = RetentionPolicy.daily(aggregate_days)
+        aggregator = RollupAggregator(policy, now)
+        for fields in self.iter_export_fields(source, now, record_filter):
+            if not aggregator.add(fields[0], fields[3], fields[1], fields[2]):
+                yield self._metric(owner, *fields, source="apple_health_import")
+        yield from aggregator.metrics(owner)
+
+    def iter_xml_batches(
+        self,
+        source: IO[bytes],
+        owner: str,
+        aggregate_days: int = 30,
+        now: datetime | None = None,
+        batch_size: int = 5000,
+        policy: RetentionPolicy | None = None,
+        record_filter: RecordFilter | None = None,
+    ) -> Iterator[MetricBatch]:
+        """Like ``iter_xml``, but yields columnar batches of up to ``batch_size`` rows.
+
+        No model is built per record; the importer validates each batch once.
+        Bucketed rows come last, one batch per bucket size.
+        """
+        now = now or datetime.now(UTC)
+        if policy is None:
+            policy = RetentionPolicy.daily(aggregate_days)
+        aggregator = RollupAggregator(policy, now)
+        yield from self.iter_record_batches(
+            source, owner, now, aggregator, batch_size, record_filter
+        )
+        yield from aggregator.batches(owner)
+
+    def iter_record_batches(
+        self,
+        source: IO[bytes],
+        owner: str,
+        now: datetime,
+        aggregator: RollupAggregator,
+        batch_size: int = 5000,
+        record_filter: RecordFilter | None = None,
+        resolver: OverlapResolver | None = None,
+        sleep: SleepNights | None = None,
+    ) -> Iterator[MetricBatch]:
+        """Batch the Records in ``source`` that ``aggregator`` does not take.
+
+        Overlapping cumulative Records are resolved by ``resolver`` and sleep
+        Records totalled by ``sleep``; when they are passed in, they are left
+        with their open days for the caller to close.
+        """
+        close = resolver is None and sleep is None
+        if resolver is None:
+            resolver = OverlapResolver(settings.import_source_priority)
+        if sleep is None:
+            sleep = SleepNights.within(record_filter)
+        yield from self.batch_fields(
+            self._iter_xml_fields(source, now, record_filter, resolver, sleep, close),
+            owner,
+            aggregator,
+            batch_size,
         )
-        cutoff = datetime.now(UTC) - timedelta(days=aggregate_days) if aggregate_days > 0 else None
-
-        root = DefusedET.fromstring(content)
 
-        for record in root.iter("Record"):
-            metric = self._parse_xml_record(record, owner)
-            if not metric:
+    def batch_fields(
+        self,
+        fields: Iterable[Fields],
+        owner: str,
+        aggregator: RollupAggregator,
+        batch_size: int = 5000,
+        source: SourceType = "apple_health_import",
+    ) -> Iterator[MetricBatch]:
+        """Batch parsed Record fields that ``aggregator`` does not take."""
+        batch = MetricBatch(owner)
+        for metric_type, value, unit, measured_at in fields:
+            if aggregator.add(metric_type, measured_at, value, unit):
                 continue
-
-            if (
-                cutoff
-                and metric.metric_type in AGGREGATE_METRICS
-                and metric.measured_at.replace(tzinfo=UTC) < cutoff
-            ):
-                day_key = metric.measured_at.strftime("%Y-%m-%d")
-                to_aggregate[metric.metric_type][day_key].append(metric.value)
+            batch.append(metric_type, value, unit, epoch_us(measured_at), source)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = MetricBatch(owner)
+        if batch:
+            yield batch
+
+    def record_filter(
+        self,
+        metric_types: Iterable[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        since_by_metric: Mapping[str, datetime] | None = None,
+    ) -> RecordFilter:
+        """Filter for the Records of the given metric types (default: all) in a date window.
+
+        ``since_by_metric`` starts the window later for single metric types;
+        types that are not imported from exports are ignored there.
+
+        Raises:
+            ValueError: If a metric type is not imported from exports, or the
+                window is empty.
+        """
+        by_metric = {v[0]: k for k, v in APPLE_HEALTH_TYPE_MAP.items()}
+        if metric_types is None:
+            record_types = list(APPLE_HEALTH_TYPE_MAP)
+        else:
+            unknown = sorted(set(metric_types) - set(by_metric))
+            if unknown:
+                raise ValueError(f"Unknown metric types: {', '.join(unknown)}")
+            record_types = [by_metric[metric_type] for metric_type in metric_types]
+        since_by_type = {
+            by_metric[metric_type]: value
+            for metric_type, value in (since_by_metric or {}).items()
+            if metric_type in by_metric
+        }
+        return RecordFilter(record_types, since, until, since_by_type)
+
+    def iter_export_fields(
+        self, source: IO[bytes], now: datetime, record_filter: RecordFilter | None = None
+    ) -> Iterator[Fields]:
+        """Fields of the Records in an export, with steps resolved and sleep totalled."""
+        resolver = OverlapResolver(settings.import_source_priority)
+        sleep = SleepNights.within(record_filter)
+        yield from self._iter_xml_fields(source, now, record_filter, resolver, sleep, close=True)
+
+    def metric_fields(
+        self, metric_type: str, value: float, unit: str | None, measured_at: datetime, now: datetime
+    ) -> Fields | None:
+        """Fields of a reading from another source, in the unit imports store its type in.
+
+        None for a metric type exports do not map, or a time later than ``now``.
+        """
+        default_unit = METRIC_UNITS.get(metric_type)
+        if default_unit is None:
+            return None
+        if measured_at.replace(tzinfo=None) > _utc_wall_time(now):
+            logger.warning("Rejecting future date: %s", measured_at)
+            return None
+        value, unit = self._convert_unit(value, unit or default_unit, default_unit)
+        return metric_type, value, unit, measured_at
+
+    def _iter_xml_fields(
+        self,
+        source: IO[bytes],
+        now: datetime,
+        record_filter: RecordFilter | None,
+        resolver: OverlapResolver,
+        sleep: SleepNights,
+        close: bool,
+    ) -> Iterator[Fields]:
+        """Fields of the Records in ``source``; cumulative ones once their day is resolved.
+
+        Sleep Records come out as nightly totals once their night is merged.
+        """
+        for record in self._iter_record_elements(source, record_filter):
+            if record.get("type") == SLEEP_ANALYSIS:
+                stretch = self._parse_sleep_stretch(record, now)
+                if stretch:
+                    yield from sleep.add(*stretch)
+                continue
+            fields = self._parse_xml_fields(record, now)
+            if not fields:
+                continue
+            if fields[0] in resolver.metric_types:
+                end = record.get("endDate")
+                yield from resolver.add(
+                    fields,
+                    self._parse_apple_date(end, now) if end else None,
+                    record.get("sourceName", ""),
+                )
             else:
-                metrics.append(metric)
-
-        for metric_type, daily_values in to_aggregate.items():
-            mapping = next(
-                (v for k, v in APPLE_HEALTH_TYPE_MAP.items() if v[0] == metric_type), None
-            )
-            if not mapping:
+                yield fields
+        if close:
+            yield from resolver.close()
+            yield from sleep.close()
+
+    def _iter_record_elements(
+        self, source: IO[bytes], record_filter: RecordFilter | None = None
+    ) -> Iterator[ET.Element]:
+        """Yield each Record element of an export, clearing it once handled.
+
+        Records ``record_filter`` rejects are cut from the raw bytes first, so no
+        element is ever built for them.
+        """
+        filtered = FilteredExport(source, record_filter or MAPPED_RECORDS)
+        depth = 0
+        root: ET.Element | None = None
+        for event, elem in DefusedET.iterparse(filtered, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
                 continue
-            _, unit = mapping
 
-            for day_str, values in daily_values.items():
-                if metric_type in SUM_METRICS:
-                    agg_value = round(sum(values), 2)
-                else:
-                    agg_value = round(sum(values) / len(values), 2)
+            depth -= 1
+            if elem.tag == "Record":
+                yield elem
+                elem.clear()
 
-                measured_at = datetime.strptime(day_str, "%Y-%m-%d").replace(
-                    hour=12, tzinfo=UTC
-                )
-                metrics.append(
-                    HealthMetricCreate(
-                        metric_type=metric_type,
-                        value=agg_value,
-                        unit=unit,
-                        measured_at=measured_at,
-                        owner=owner,
-                        source="apple_health_import",
-                    )
-                )
+            # Top-level elements are fully handled once closed; drop them from the root
+            # so the partially built tree never grows with the file.
+            if depth == 1 and root is not None:
+                root.clear()
+
+    def open_export_zip(self, fileobj: IO[bytes]) -> IO[bytes]:
+        """Open export.xml inside an Apple Health export.zip as a stream.
+
+        The member is decompressed on the fly as it is read, so nothing is extracted
+        to disk or loaded whole. Other members (ECG CSVs, workout route GPX files,
+        export_cda.xml) are never read. ``fileobj`` must be seekable.
+
+        Raises:
+            zipfile.BadZipFile: If ``fileobj`` is not a ZIP archive.
+            ValueError: If the archive contains no export.xml.
+        """
+        archive = zipfile.ZipFile(fileobj)
+        names = archive.namelist()
+        if APPLE_HEALTH_EXPORT_MEMBER in names:
+            return archive.open(APPLE_HEALTH_EXPORT_MEMBER)
 
-        return metrics
+        # Some exporters rename the top-level folder; fall back to the shallowest export.xml.
+        candidates = [n for n in names if posixpath.basename(n) == "export.xml"]
+        if not candidates:
+            raise ValueError("Archive does not contain export.xml")
+        return archive.open(min(candidates, key=lambda n: n.count("/")))
 
     def _parse_xml_record(
-        self, record: ET.Element, owner: str
+        self, record: ET.Element, owner: str, now: datetime | None = None
     ) -> HealthMetricCreate | None:
         """Parse a single Record element from Apple Health XML."""
+        fields = self._parse_xml_fields(record, now)
+        if not fields:
+            return None
+        return self._metric(owner, *fields, source="apple_health_import")
+
+    def _parse_xml_fields(
+        self, record: ET.Element, now: datetime | None = None
+    ) -> tuple[str, float, str, datetime] | None:
+        """Metric type, value, unit and timestamp of a Record, or None to skip it."""
         record_type = record.get("type", "")
         mapping = APPLE_HEALTH_TYPE_MAP.get(record_type)
 
@@ -146,24 +492,61 @@ class AppleHealthParser:
         if not start_date_str:
             return None
 
-        measured_at = self._parse_apple_date(start_date_str)
+        measured_at = self._parse_apple_date(start_date_str, now)
         if not measured_at:
             return None
 
+        return metric_type, value, unit, measured_at
+
+    def _parse_sleep_stretch(
+        self, record: ET.Element, now: datetime | None = None
+    ) -> tuple[str, datetime, datetime] | None:
+        """Stage, start and end of a sleep analysis Record, or None to skip it."""
+        stage = record.get("value", "").removeprefix(STAGE_PREFIX)
+        if stage not in STAGE_METRICS:
+            return None
+        start = self._parse_apple_date(record.get("startDate", ""), now)
+        end = self._parse_apple_date(record.get("endDate", ""), now)
+        if not start or not end:
+            return None
+        return stage, start, end
+
+    def _metric(
+        self,
+        owner: str,
+        metric_type: str,
+        value: float,
+        unit: str,
+        measured_at: datetime,
+        source: SourceType,
+    ) -> HealthMetricCreate:
         return HealthMetricCreate(
             metric_type=metric_type,
             value=value,
             unit=unit,
             measured_at=measured_at,
             owner=owner,
-            source="apple_health_import",
+            source=source,
         )
 
-    def parse_auto_export_json(
-        self, data: dict[str, Any], owner: str
-    ) -> list[HealthMetricCreate]:
+    def parse_auto_export_json(self, data: dict[str, Any], owner: str) -> list[HealthMetricCreate]:
         """Parse Health Auto Export JSON payload."""
-        metrics: list[HealthMetricCreate] = []
+        return [
+            self._metric(owner, *fields, source="apple_health_webhook")
+            for fields in self._iter_auto_export_fields(data)
+        ]
+
+    def parse_auto_export_batch(self, data: dict[str, Any], owner: str) -> MetricBatch:
+        """Parse a Health Auto Export JSON payload into one columnar batch."""
+        batch = MetricBatch(owner)
+        for metric_type, value, unit, measured_at in self._iter_auto_export_fields(data):
+            batch.append(metric_type, value, unit, epoch_us(measured_at), "apple_health_webhook")
+        return batch
+
+    def _iter_auto_export_fields(
+        self, data: dict[str, Any]
+    ) -> Iterator[tuple[str, float, str, datetime]]:
+        now = datetime.now(UTC)
 
         metrics_container = data.get("data", data)
         if isinstance(metrics_container, dict):
@@ -172,63 +555,81 @@ class AppleHealthParser:
             metrics_data = []
 
         for metric_data in metrics_data:
-            parsed = self._parse_auto_export_metric(metric_data, owner)
-            metrics.extend(parsed)
-
-        return metrics
+            yield from self._parse_auto_export_metric(metric_data, now)
 
     def _parse_auto_export_metric(
-        self, metric_data: dict[str, Any], owner: str
-    ) -> list[HealthMetricCreate]:
+        self, metric_data: dict[str, Any], now: datetime | None = None
+    ) -> Iterator[tuple[str, float, str, datetime]]:
         """Parse a single metric from Health Auto Export JSON."""
-        results: list[HealthMetricCreate] = []
-
-        name = metric_data.get("name", "")
-        mapping = HEALTH_AUTO_EXPORT_TYPE_MAP.get(name.lower().replace(" ", "_"))
+        mapping = self.auto_export_mapping(metric_data.get("name", ""))
 
         if not mapping:
-            return results
+            return
 
-        metric_type, default_unit = mapping
-        unit = metric_data.get("units", default_unit)
+        unit = metric_data.get("units", mapping[1])
 
         for data_point in metric_data.get("data", []):
-            value = data_point.get("qty")
-            if value is None:
-                value = data_point.get("value")
-            if value is None:
-                continue
+            fields = self.auto_export_fields(mapping, unit, data_point, now)
+            if fields:
+                yield fields
+
+    def auto_export_mapping(self, name: str) -> tuple[str, str] | None:
+        """Metric type and default unit for a Health Auto Export metric name, if imported."""
+        return HEALTH_AUTO_EXPORT_TYPE_MAP.get(name.lower().replace(" ", "_"))
+
+    def auto_export_fields(
+        self,
+        mapping: tuple[str, str],
+        unit: str,
+        data_point: dict[str, Any],
+        now: datetime | None = None,
+    ) -> tuple[str, float, str, datetime] | None:
+        """Metric type, value, unit and time of one data point, or None if it is unusable."""
+        metric_type, default_unit = mapping
+        value = data_point.get("qty")
+        if value is None:
+            value = data_point.get("value")
+        if value is None:
+            return None
 
-            try:
-                value = float(value)
-            except (ValueError, TypeError):
-                continue
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            return None
 
-            date_str = data_point.get("date", "")
-            if not date_str:
-                continue
+        date_str = data_point.get("date", "")
+        if not date_str:
+            return None
 
-            measured_at = self._parse_iso_date(date_str)
-            if not measured_at:
-                continue
+        measured_at = self._parse_iso_date(date_str, now)
+        if not measured_at:
+            return None
 
-            value, unit = self._convert_unit(value, unit, default_unit)
+        value, unit = self._convert_unit(value, unit, default_unit)
 
-            results.append(
-                HealthMetricCreate(
-                    metric_type=metric_type,
-                    value=value,
-                    unit=unit,
-                    measured_at=measured_at,
-                    owner=owner,
-                    source="apple_health_webhook",
-                )
-            )
+        return metric_type, value, unit, measured_at
+
+    def _parse_apple_date(self, date_str: str, now: datetime | None = None) -> datetime | None:
+        """Parse Apple Health XML date format. Rejects dates later than ``now``.
 
-        return results
+        The common "YYYY-MM-DD HH:MM:SS +HHMM" shape is parsed directly; anything
+        else (or anything that fails there) goes through the strptime path, so
+        malformed dates are handled exactly as before.
+        """
+        if not APPLE_DATE_PATTERN.fullmatch(date_str):
+            return self._strptime_apple_date(date_str, now)
+        try:
+            wall_time = datetime.fromisoformat(date_str[:19])
+            tzinfo = _fixed_offset(date_str[20:])
+        except ValueError:
+            return self._strptime_apple_date(date_str, now)
+        # Same check as parsed.replace(tzinfo=UTC) > now, on naive values.
+        if wall_time > _utc_wall_time(now or datetime.now(UTC)):
+            logger.warning("Rejecting future date: %s", date_str)
+            return None
+        return wall_time.replace(tzinfo=tzinfo)
 
-    def _parse_apple_date(self, date_str: str) -> datetime | None:
-        """Parse Apple Health XML date format. Rejects future dates."""
+    def _strptime_apple_date(self, date_str: str, now: datetime | None = None) -> datetime | None:
         formats = [
             "%Y-%m-%d %H:%M:%S %z",
             "%Y-%m-%d %H:%M:%S",
@@ -236,7 +637,7 @@ class AppleHealthParser:
         for fmt in formats:
             try:
                 parsed = datetime.strptime(date_str, fmt)
-                if parsed.replace(tzinfo=UTC) > datetime.now(UTC):
+                if parsed.replace(tzinfo=UTC) > (now or datetime.now(UTC)):
                     logger.warning("Rejecting future date: %s", date_str)
                     return None
                 return parsed
@@ -244,20 +645,18 @@ class AppleHealthParser:
                 continue
         return None
 
-    def _parse_iso_date(self, date_str: str) -> datetime | None:
-        """Parse ISO format date string. Rejects future dates."""
+    def _parse_iso_date(self, date_str: str, now: datetime | None = None) -> datetime | None:
+        """Parse ISO format date string. Rejects dates later than ``now``."""
         try:
             parsed = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-            if parsed.replace(tzinfo=UTC) > datetime.now(UTC):
+            if parsed.replace(tzinfo=UTC) > (now or datetime.now(UTC)):
                 logger.warning("Rejecting future date: %s", date_str)
                 return None
             return parsed
         except ValueError:
             return None
 
-    def _convert_unit(
-        self, value: float, source_unit: str, target_unit: str
-    ) -> tuple[float, str]:
+    def _convert_unit(self, value: float, source_unit: str, target_unit: str) -> tuple[float, str]:
         """Convert value to target unit if needed."""
         source_lower = source_unit.lower()
         target_lower = target_unit.lower()
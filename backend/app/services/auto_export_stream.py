@@ -0,0 +1,166 @@
+"""Incremental parsing of large Health Auto Export JSON payloads.
+
+A "full history" sync can post hundreds of megabytes of JSON. Rather than
+loading it into a dict, ``AutoExportStream`` is fed the body chunk by chunk and
+walks ``data.metrics[*].data[*]`` (or ``metrics[*].data[*]``) as a stream of
+parser events, so only the current data point and the batch being filled are
+held in memory.
+"""
+
+from datetime import UTC, datetime
+from typing import Any
+
+import ijson
+
+from app.services.apple_health_parser import AppleHealthParser, apple_health_parser
+from app.services.metric_batch import MetricBatch, epoch_us
+
+# Key paths of the metrics array, as in a wrapped payload or one with metrics at the root.
+METRICS_PATHS = (["data", "metrics"], ["metrics"])
+CONTAINER_ENDS = frozenset(("end_map", "end_array"))
+
+NO_METRICS = "No metrics data in payload. Expected 'data' or 'metrics' field."
+
+
+class AutoExportStream:
+    """Push parser turning Health Auto Export JSON bytes into metric batches.
+
+    Health Auto Export writes a metric's name and units before its data points,
+    which are then converted as they arrive. Points that come first are held
+    until their metric's name and units are known.
+    """
+
+    def __init__(
+        self, owner: str, batch_size: int, parser: AppleHealthParser = apple_health_parser
+    ):
+        self.owner = owner
+        self.batch_size = batch_size
+        self._parser = parser
+        self._now = datetime.now(UTC)
+        self._events: list[tuple[str, Any]] = ijson.sendable_list()
+        # Basic events carry no path; a stack of the open containers' current keys
+        # (None for arrays) is much cheaper than having ijson build prefixes.
+        self._coro = ijson.basic_parse_coro(self._events, use_float=True)
+        self._stack: list[str | None] = []
+        # Depth of the metric objects once inside the metrics array.
+        self._metric_depth = 0
+        self._batch = MetricBatch(owner)
+        self._ready: list[MetricBatch] = []
+        self._seen_payload = False
+        self._start_metric()
+
+    def feed(self, chunk: bytes) -> list[MetricBatch]:
+        """Parse the next chunk of the body; returns the batches it filled.
+
+        Raises:
+            ValueError: If the body is not valid JSON.
+        """
+        if not chunk:
+            # An empty chunk would end the parse; ``close`` does that.
+            return []
+        try:
+            self._coro.send(chunk)
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON payload: {e}") from e
+        self._handle_events()
+        ready, self._ready = self._ready, []
+        return ready
+
+    def close(self) -> list[MetricBatch]:
+        """End the body; returns the remaining batches.
+
+        Raises:
+            ValueError: If the body is incomplete JSON or has no metrics.
+        """
+        try:
+            self._coro.close()
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON payload: {e}") from e
+        self._handle_events()
+        if not self._seen_payload:
+            raise ValueError(NO_METRICS)
+        if self._batch:
+            self._ready.append(self._batch)
+            self._batch = MetricBatch(self.owner)
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _start_metric(self) -> None:
+        self._named = False
+        self._mapping: tuple[str, str] | None = None
+        self._units: str | None = None
+        self._held: list[dict[str, Any]] = []
+        self._point: dict[str, Any] | None = None
+
+    def _handle_events(self) -> None:
+        stack = self._stack
+        for event, value in self._events:
+            if event == "map_key":
+                stack[-1] = value
+                continue
+            depth = len(stack)
+            metric = self._metric_depth
+            if event in CONTAINER_ENDS:
+                stack.pop()
+                depth -= 1
+                if not metric:
+                    continue
+                if depth == metric + 2 and self._point is not None:
+                    self._end_point()
+                elif depth == metric:
+                    self._end_metric()
+                elif depth < metric:
+                    self._metric_depth = 0
+            elif event == "start_map" or event == "start_array":
+                if metric:
+                    if depth == metric + 2 and stack[metric] == "data" and event == "start_map":
+                        self._point = {}
+                    elif depth == metric:
+                        self._seen_payload = True
+                        self._start_metric()
+                elif event == "start_array" and stack in METRICS_PATHS:
+                    self._metric_depth = depth + 1
+                elif depth == 2 and stack[0] == "data":
+                    self._seen_payload = True
+                stack.append(None)
+            elif not metric:
+                # A non-empty "data" object counts as a payload, as in the buffered webhook.
+                if depth == 2 and stack[0] == "data":
+                    self._seen_payload = True
+            else:
+                if depth == metric + 3 and self._point is not None:
+                    self._point[stack[-1]] = value
+                elif depth == metric + 1 and event == "string":
+                    if stack[metric] == "name":
+                        self._named = True
+                        self._mapping = self._parser.auto_export_mapping(value)
+                    elif stack[metric] == "units":
+                        self._units = value
+        del self._events[:]
+
+    def _end_point(self) -> None:
+        if not self._named or self._mapping and self._units is None:
+            self._held.append(self._point)
+        else:
+            self._add(self._point)
+        self._point = None
+
+    def _end_metric(self) -> None:
+        held, self._held = self._held, []
+        for point in held:
+            self._add(point)
+
+    def _add(self, point: dict[str, Any]) -> None:
+        mapping = self._mapping
+        if not mapping:
+            return
+        fields = self._parser.auto_export_fields(
+            mapping, self._units or mapping[1], point, self._now
+        )
+        if not fields:
+            return
+        metric_type, value, unit, measured_at = fields
+        self._batch.append(metric_type, value, unit, epoch_us(measured_at), "apple_health_webhook")
+        if len(self._batch) >= self.batch_size:
+            self._ready.append(self._batch)
+            self._batch = MetricBatch(self.owner)
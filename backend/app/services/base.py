@@ -1,6 +1,11 @@
-from typing import Generic, TypeVar
+import base64
+import binascii
+from datetime import UTC, datetime
+from typing import Generic, NamedTuple, TypeVar
 
 from pydantic import BaseModel
+from sqlalchemy import Select, and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.database import Base
@@ -10,6 +15,69 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def to_db_timestamp(value: datetime) -> datetime:
+    """Normalize a datetime to the naive UTC form stored in ``measured_at``."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+class Cursor(NamedTuple):
+    """Position after the last row of a page ordered by ``measured_at`` desc, then ``id``."""
+
+    measured_at: datetime
+    id: int
+
+    def encode(self) -> str:
+        raw = f"{self.measured_at.isoformat()}|{self.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str) -> "Cursor":
+        """Raises ValueError for a cursor that ``encode`` did not produce."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            measured_at, id = raw.split("|")
+            return cls(to_db_timestamp(datetime.fromisoformat(measured_at)), int(id))
+        except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def _multi_query(
+    model: type[ModelType],
+    skip: int,
+    limit: int,
+    owner: str | None,
+    metric_type: str | None,
+    since: datetime | None,
+    until: datetime | None,
+    after: Cursor | None,
+) -> Select:
+    """The ``get_multi`` query, shared by the sync and async CRUD classes."""
+    query = select(model)
+    if owner and hasattr(model, "owner"):
+        query = query.where(model.owner == owner)
+    if metric_type and hasattr(model, "metric_type"):
+        query = query.where(model.metric_type == metric_type)
+    if hasattr(model, "measured_at"):
+        # Bounds on the partition key limit the scan to the partitions they cover.
+        if since:
+            query = query.where(model.measured_at >= to_db_timestamp(since))
+        if until:
+            query = query.where(model.measured_at < to_db_timestamp(until))
+        if after:
+            query = query.where(
+                model.measured_at <= after.measured_at,
+                or_(
+                    model.measured_at < after.measured_at,
+                    and_(model.measured_at == after.measured_at, model.id > after.id),
+                ),
+            )
+        # Matches the (owner, metric_type, measured_at DESC, id) listing index.
+        query = query.order_by(model.measured_at.desc(), model.id)
+    return query.offset(skip).limit(limit)
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: type[ModelType]):
         self.model = model
@@ -24,15 +92,19 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         limit: int = 100,
         owner: str | None = None,
         metric_type: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: Cursor | None = None,
     ) -> list[ModelType]:
-        query = db.query(self.model)
-        if owner and hasattr(self.model, "owner"):
-            query = query.filter(self.model.owner == owner)
-        if metric_type and hasattr(self.model, "metric_type"):
-            query = query.filter(self.model.metric_type == metric_type)
-        if hasattr(self.model, "measured_at"):
-            query = query.order_by(self.model.measured_at.desc())
-        return query.offset(skip).limit(limit).all()
+        """Rows in the model's order; time-series rows latest first.
+
+        For rows with ``measured_at``, ``since`` and ``until`` bound it (until
+        exclusive) and ``after`` continues from a ``Cursor`` for the last row of
+        the previous page. Unlike ``skip``, a cursor costs the same at any depth:
+        with owner and metric type it is one range read of the listing index.
+        """
+        query = _multi_query(self.model, skip, limit, owner, metric_type, since, until, after)
+        return list(db.scalars(query))
 
     def create(self, db: Session, obj_in: CreateSchemaType) -> ModelType:
         obj_data = obj_in.model_dump()
@@ -42,9 +114,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.refresh(db_obj)
         return db_obj
 
-    def update(
-        self, db: Session, db_obj: ModelType, obj_in: UpdateSchemaType | dict
-    ) -> ModelType:
+    def update(self, db: Session, db_obj: ModelType, obj_in: UpdateSchemaType | dict) -> ModelType:
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
@@ -64,3 +134,58 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             db.delete(obj)
             db.commit()
         return obj
+
+
+class AsyncCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    """``CRUDBase`` for ``AsyncSession``, used by the async routes."""
+
+    def __init__(self, model: type[ModelType]):
+        self.model = model
+
+    async def get(self, db: AsyncSession, id: int) -> ModelType | None:
+        return await db.scalar(select(self.model).where(self.model.id == id))
+
+    async def get_multi(
+        self,
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        owner: str | None = None,
+        metric_type: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: Cursor | None = None,
+    ) -> list[ModelType]:
+        """Rows as ``CRUDBase.get_multi`` returns them."""
+        query = _multi_query(self.model, skip, limit, owner, metric_type, since, until, after)
+        return list(await db.scalars(query))
+
+    async def create(self, db: AsyncSession, obj_in: CreateSchemaType) -> ModelType:
+        db_obj = self.model(**obj_in.model_dump())
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self, db: AsyncSession, db_obj: ModelType, obj_in: UpdateSchemaType | dict
+    ) -> ModelType:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+
+        for field, value in update_data.items():
+            setattr(db_obj, field, value)
+
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def delete(self, db: AsyncSession, id: int) -> ModelType | None:
+        obj = await self.get(db, id)
+        if obj:
+            await db.delete(obj)
+            await db.commit()
+        return obj
@@ -0,0 +1,140 @@
+"""Vectorized per-bucket statistics for high-frequency metrics.
+
+Samples are buffered as flat arrays of integer bucket numbers and values and
+reduced with NumPy in chunks: one stable sort by bucket, then sum, count, min
+and max for every bucket with ``reduceat``. Reduced partials have the same
+shape as raw samples (a sample is a bucket with count 1), so chunks and partials
+from other parsers combine the same way and memory is bounded by the number of
+buckets, not samples.
+"""
+
+from array import array
+from typing import NamedTuple
+
+import numpy as np
+
+# Samples buffered per metric before they are reduced into the partials.
+FLUSH_SAMPLES = 65_536
+
+
+class BucketSummary(NamedTuple):
+    bucket: int
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+
+def _reduce_by_bucket(
+    buckets: np.ndarray,
+    totals: np.ndarray,
+    counts: np.ndarray,
+    minimums: np.ndarray,
+    maximums: np.ndarray,
+) -> tuple[np.ndarray, ...]:
+    """Combine entries that share a bucket; the result is sorted by bucket."""
+    if not len(buckets):
+        return buckets, totals, counts, minimums, maximums
+    order = np.argsort(buckets, kind="stable")
+    buckets = buckets[order]
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    return (
+        buckets[starts],
+        np.add.reduceat(totals[order], starts),
+        np.add.reduceat(counts[order], starts),
+        np.minimum.reduceat(minimums[order], starts),
+        np.maximum.reduceat(maximums[order], starts),
+    )
+
+
+class BucketStats:
+    """Sum, count, min and max per bucket of one metric's samples.
+
+    Buckets are plain integers, e.g. ``date.toordinal()`` or the number of
+    whole bucket intervals since the epoch. Instances pickle as their reduced
+    arrays, so they can be sent between processes and combined with ``merge``.
+    """
+
+    __slots__ = ("keys", "values", "_buckets", "_totals", "_counts", "_minimums", "_maximums")
+
+    def __init__(self) -> None:
+        self.keys = array("q")
+        self.values = array("d")
+        self._buckets = np.empty(0, dtype=np.int64)
+        self._totals = np.empty(0, dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._minimums = np.empty(0, dtype=np.float64)
+        self._maximums = np.empty(0, dtype=np.float64)
+
+    def __getstate__(self) -> tuple[np.ndarray, ...]:
+        self.flush()
+        return self._buckets, self._totals, self._counts, self._minimums, self._maximums
+
+    def __setstate__(self, state: tuple[np.ndarray, ...]) -> None:
+        self.keys = array("q")
+        self.values = array("d")
+        self._buckets, self._totals, self._counts, self._minimums, self._maximums = state
+
+    def add(self, bucket: int, value: float) -> None:
+        self.keys.append(bucket)
+        self.values.append(value)
+        if len(self.values) >= FLUSH_SAMPLES:
+            self.flush()
+
+    def flush(self) -> None:
+        """Reduce buffered samples into the partials."""
+        if not self.values:
+            return
+        buckets = np.frombuffer(self.keys, dtype=np.int64)
+        values = np.frombuffer(self.values, dtype=np.float64)
+        self._combine(buckets, values, np.ones(len(values), dtype=np.int64), values, values)
+        # Fresh buffers: the old ones are still exported to the arrays above.
+        self.keys = array("q")
+        self.values = array("d")
+
+    def merge(self, other: "BucketStats") -> None:
+        other.flush()
+        self._combine(
+            other._buckets, other._totals, other._counts, other._minimums, other._maximums
+        )
+
+    def summaries(self) -> list[BucketSummary]:
+        """Statistics per bucket, in bucket order."""
+        self.flush()
+        return [
+            BucketSummary(*row)
+            for row in zip(
+                self._buckets.tolist(),
+                self._counts.tolist(),
+                self._totals.tolist(),
+                self._minimums.tolist(),
+                self._maximums.tolist(),
+                strict=True,
+            )
+        ]
+
+    def _combine(
+        self,
+        buckets: np.ndarray,
+        totals: np.ndarray,
+        counts: np.ndarray,
+        minimums: np.ndarray,
+        maximums: np.ndarray,
+    ) -> None:
+        (
+            self._buckets,
+            self._totals,
+            self._counts,
+            self._minimums,
+            self._maximums,
+        ) = _reduce_by_bucket(
+            np.concatenate((self._buckets, buckets)),
+            np.concatenate((self._totals, totals)),
+            np.concatenate((self._counts, counts)),
+            np.concatenate((self._minimums, minimums)),
+            np.concatenate((self._maximums, maximums)),
+        )
@@ -1,7 +1,6 @@
 from app.models import (
     AppConfig,
     HealthGoal,
-    HealthMetric,
     MedicalHistory,
     Medication,
     Supplement,
@@ -12,8 +11,6 @@ from app.schemas import (
     AppConfigUpdate,
     HealthGoalCreate,
     HealthGoalUpdate,
-    HealthMetricCreate,
-    HealthMetricUpdate,
     MedicalHistoryCreate,
     MedicalHistoryUpdate,
     MedicationCreate,
@@ -24,9 +21,12 @@ from app.schemas import (
     VaccinationUpdate,
 )
 from app.services.base import CRUDBase
+from app.services.health_metric_service import (
+    async_health_metric_service as async_health_metric,
+)
+from app.services.health_metric_service import health_metric_service as health_metric
 from app.services.lab_result_service import lab_result_service as lab_result
 
-health_metric = CRUDBase[HealthMetric, HealthMetricCreate, HealthMetricUpdate](HealthMetric)
 medication = CRUDBase[Medication, MedicationCreate, MedicationUpdate](Medication)
 supplement = CRUDBase[Supplement, SupplementCreate, SupplementUpdate](Supplement)
 health_goal = CRUDBase[HealthGoal, HealthGoalCreate, HealthGoalUpdate](HealthGoal)
@@ -38,6 +38,7 @@ app_config = CRUDBase[AppConfig, AppConfigCreate, AppConfigUpdate](AppConfig)
 
 __all__ = [
     "app_config",
+    "async_health_metric",
     "health_goal",
     "health_metric",
     "lab_result",
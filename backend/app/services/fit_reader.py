@@ -0,0 +1,192 @@
+"""Streaming reader for Garmin FIT files.
+
+A FIT file is a header followed by records: definition messages, which give
+the layout of a local message type, and data messages laid out by the last
+definition of their local type. ``iter_messages`` reads one record at a time
+from a file object and only decodes the fields a caller asks for, so a
+multi-hour activity with a reading every second is never held in memory.
+
+Chained files (several FIT files back to back, as some devices write them)
+are read one after the other. CRCs are not checked.
+"""
+
+import math
+import struct
+from collections.abc import Iterator, Mapping
+from datetime import UTC, datetime, timedelta
+from typing import IO, NamedTuple
+
+SIGNATURE = b".FIT"
+# FIT timestamps count seconds from 1989-12-31 00:00 UTC.
+FIT_EPOCH = datetime(1989, 12, 31, tzinfo=UTC)
+
+TIMESTAMP_FIELD = 253
+# Monitoring messages often carry only the low 16 bits of their timestamp.
+MONITORING_MESSAGE = 55
+TIMESTAMP_16_FIELD = 26
+
+COMPRESSED_HEADER = 0x80
+DEFINITION_HEADER = 0x40
+DEVELOPER_DATA = 0x20
+
+# Struct format and invalid value of each numeric base type; strings and byte
+# arrays are never decoded.
+BASE_TYPES: dict[int, tuple[str, int | None]] = {
+    0x00: ("B", 0xFF),  # enum
+    0x01: ("b", 0x7F),
+    0x02: ("B", 0xFF),
+    0x83: ("h", 0x7FFF),
+    0x84: ("H", 0xFFFF),
+    0x85: ("i", 0x7FFFFFFF),
+    0x86: ("I", 0xFFFFFFFF),
+    0x88: ("f", None),
+    0x89: ("d", None),
+    0x0A: ("B", 0x00),  # uint8z
+    0x8B: ("H", 0x0000),
+    0x8C: ("I", 0x00000000),
+    0x8E: ("q", 0x7FFFFFFFFFFFFFFF),
+    0x8F: ("Q", 0xFFFFFFFFFFFFFFFF),
+    0x90: ("Q", 0x0000000000000000),
+}
+
+
+class FitMessage(NamedTuple):
+    """A data message: its global number, time and the requested fields that are set."""
+
+    number: int
+    timestamp: datetime | None
+    fields: dict[int, int | float]
+
+
+class _Definition(NamedTuple):
+    number: int
+    size: int
+    # Field number, offset and its first value's struct, for the fields to decode.
+    fields: list[tuple[int, int, struct.Struct, int | None]]
+
+
+def fit_time(seconds: int) -> datetime:
+    return FIT_EPOCH + timedelta(seconds=seconds)
+
+
+def _read(stream: IO[bytes], size: int) -> bytes:
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            raise ValueError("Truncated FIT file")
+        data += more
+    return data
+
+
+def iter_messages(stream: IO[bytes], wanted: Mapping[int, frozenset[int]]) -> Iterator[FitMessage]:
+    """Data messages of the global numbers in ``wanted``, with those of their fields.
+
+    Raises:
+        ValueError: If the stream is not a FIT file or is cut short.
+    """
+    first = True
+    while True:
+        header_size = stream.read(1)
+        if not header_size:
+            if first:
+                raise ValueError("Not a FIT file: it is empty")
+            return
+        if header_size[0] < 12:
+            raise ValueError("Not a FIT file: header too short")
+        header = header_size + _read(stream, header_size[0] - 1)
+        if header[8:12] != SIGNATURE:
+            raise ValueError("Not a FIT file: missing .FIT signature")
+        (data_size,) = struct.unpack_from("<I", header, 4)
+        yield from _iter_file_messages(stream, data_size, wanted)
+        _read(stream, 2)  # CRC
+        first = False
+
+
+def _iter_file_messages(
+    stream: IO[bytes], data_size: int, wanted: Mapping[int, frozenset[int]]
+) -> Iterator[FitMessage]:
+    definitions: dict[int, _Definition] = {}
+    last_timestamp = 0
+    remaining = data_size
+    while remaining > 0:
+        header = _read(stream, 1)[0]
+        remaining -= 1
+        if header & COMPRESSED_HEADER:
+            local = (header >> 5) & 0x03
+            time_offset = header & 0x1F
+            timestamp = (last_timestamp & ~0x1F) + time_offset
+            if time_offset < last_timestamp & 0x1F:
+                timestamp += 0x20
+            last_timestamp = timestamp
+        else:
+            local = header & 0x0F
+            timestamp = None
+            if header & DEFINITION_HEADER:
+                definition, size = _read_definition(stream, header & DEVELOPER_DATA, wanted)
+                definitions[local] = definition
+                remaining -= size
+                continue
+
+        definition = definitions.get(local)
+        if definition is None:
+            raise ValueError(f"FIT data message for undefined local type {local}")
+        data = _read(stream, definition.size)
+        remaining -= definition.size
+        if definition.number not in wanted and not definition.fields:
+            continue
+        fields: dict[int, int | float] = {}
+        for number, offset, layout, invalid in definition.fields:
+            (value,) = layout.unpack_from(data, offset)
+            if value == invalid or (invalid is None and math.isnan(value)):
+                continue
+            fields[number] = value
+        seconds = fields.pop(TIMESTAMP_FIELD, None)
+        low = (
+            fields.pop(TIMESTAMP_16_FIELD, None)
+            if definition.number == MONITORING_MESSAGE
+            else None
+        )
+        if seconds is not None:
+            last_timestamp = timestamp = int(seconds)
+        elif low is not None:
+            last_timestamp = timestamp = last_timestamp + ((int(low) - last_timestamp) & 0xFFFF)
+        if definition.number in wanted:
+            yield FitMessage(
+                definition.number, fit_time(timestamp) if timestamp is not None else None, fields
+            )
+
+
+def _read_definition(
+    stream: IO[bytes], developer: int, wanted: Mapping[int, frozenset[int]]
+) -> tuple[_Definition, int]:
+    """The definition at the stream position, and the bytes it took after its header."""
+    fixed = _read(stream, 5)
+    big_endian = fixed[1] == 1
+    order = ">" if big_endian else "<"
+    (number,) = struct.unpack_from(order + "H", fixed, 2)
+    count = fixed[4]
+    raw = _read(stream, count * 3)
+    size = 5 + count * 3
+    field_numbers = wanted.get(number, frozenset())
+    # Timestamps are tracked for every message, as later compressed headers build on them.
+    decode = field_numbers | {TIMESTAMP_FIELD}
+    if number == MONITORING_MESSAGE:
+        decode |= {TIMESTAMP_16_FIELD}
+    fields = []
+    offset = 0
+    for i in range(count):
+        field, field_size, base_type = raw[i * 3 : i * 3 + 3]
+        layout = BASE_TYPES.get(base_type)
+        if field in decode and layout is not None:
+            fmt, invalid = layout
+            value = struct.Struct(order + fmt)
+            if value.size <= field_size:
+                fields.append((field, offset, value, invalid))
+        offset += field_size
+    if developer:
+        dev_count = _read(stream, 1)[0]
+        dev_fields = _read(stream, dev_count * 3)
+        offset += sum(dev_fields[i * 3 + 1] for i in range(dev_count))
+        size += 1 + dev_count * 3
+    return _Definition(number, offset, fields), size
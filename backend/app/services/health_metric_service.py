@@ -0,0 +1,449 @@
+"""Health metric persistence, including the bulk upsert paths used by imports."""
+
+import io
+import logging
+import sys
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import HealthMetric
+from app.models.health_metric import UNIQUE_KEY_CONSTRAINT
+from app.schemas import HealthMetricCreate, HealthMetricUpdate, ImportResult
+from app.services.base import AsyncCRUDBase, CRUDBase, to_db_timestamp
+from app.services.import_watermarks import import_watermark_service
+from app.services.metric_batch import MetricBatch
+
+logger = logging.getLogger(__name__)
+
+MetricKey = tuple[str, str, datetime]
+
+# The dashboard looks for the latest metrics this far back before scanning every partition.
+LATEST_WINDOW_DAYS = 31
+BatchCallback = Callable[[ImportResult], None]
+
+# Errors one bad row causes, which the row-by-row fallback isolates. Anything else,
+# such as a lost connection, fails the write so the caller can retry or spool it.
+ROW_ERRORS = (DataError, IntegrityError)
+
+# Column order shared by the staging table, the COPY stream (MetricBatch.csv) and the merge.
+COPY_COLUMNS = (
+    "owner",
+    "metric_type",
+    "measured_at_us",
+    "value",
+    "unit",
+    "source",
+    "resolution_seconds",
+    "sample_count",
+    "value_min",
+    "value_max",
+)
+
+# Columns an import (or manual entry) replaces on an existing row with the same key.
+REPLACED_COLUMNS = (
+    "value",
+    "unit",
+    "source",
+    "resolution_seconds",
+    "sample_count",
+    "value_min",
+    "value_max",
+    "updated_at",
+)
+
+# Temporary tables are never WAL-logged, so this is the unlogged staging area for
+# COPY; being per-connection it also keeps concurrent imports apart. Timestamps
+# are staged as epoch microseconds, which is how batches hold them.
+CREATE_STAGING_TABLE = text(
+    """
+    CREATE TEMP TABLE IF NOT EXISTS health_metrics_stage (
+        seq bigint GENERATED BY DEFAULT AS IDENTITY,
+        owner varchar(100) NOT NULL,
+        metric_type varchar(100) NOT NULL,
+        measured_at_us bigint NOT NULL,
+        value double precision NOT NULL,
+        unit varchar(50) NOT NULL,
+        source varchar(50) NOT NULL,
+        resolution_seconds integer NOT NULL,
+        sample_count integer,
+        value_min double precision,
+        value_max double precision
+    ) ON COMMIT DELETE ROWS
+    """
+)
+
+# One set-based merge per staged chunk, with the same manual-wins rule as the
+# batched path. The latest staged row wins for repeated keys, and each written
+# key counts for every input row that collapsed into it. Gives the latest written
+# measured_at and the imported count per owner, metric type and source.
+MERGE_STAGED_ROWS = text(
+    f"""
+    WITH src AS (
+        SELECT DISTINCT ON (owner, metric_type, measured_at_us)
+               owner, metric_type, value, unit, source,
+               resolution_seconds, sample_count, value_min, value_max,
+               timestamp '1970-01-01' + measured_at_us * interval '1 microsecond'
+                   AS measured_at,
+               count(*) OVER (PARTITION BY owner, metric_type, measured_at_us) AS n
+        FROM health_metrics_stage
+        ORDER BY owner, metric_type, measured_at_us, seq DESC
+    ), written AS (
+        INSERT INTO health_metrics (
+            owner, metric_type, measured_at, value, unit, notes, is_active, source,
+            resolution_seconds, sample_count, value_min, value_max, created_at, updated_at
+        )
+        SELECT owner, metric_type, measured_at, value, unit, NULL, true, source,
+               resolution_seconds, sample_count, value_min, value_max,
+               now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+        FROM src
+        ON CONFLICT ON CONSTRAINT {UNIQUE_KEY_CONSTRAINT} DO UPDATE
+        SET {", ".join(f"{column} = EXCLUDED.{column}" for column in REPLACED_COLUMNS)}
+        WHERE health_metrics.source <> 'manual'
+        RETURNING owner, metric_type, measured_at
+    )
+    SELECT owner, metric_type, src.source, max(measured_at), sum(src.n)::bigint
+    FROM written JOIN src USING (owner, metric_type, measured_at)
+    GROUP BY owner, metric_type, src.source
+    """
+)
+
+
+def _row(metric: HealthMetricCreate) -> dict[str, Any]:
+    row = metric.model_dump()
+    row["measured_at"] = to_db_timestamp(row["measured_at"])
+    # A manual value replaces any rollup statistics stored under the same key.
+    row.update(resolution_seconds=0, sample_count=None, value_min=None, value_max=None)
+    return row
+
+
+def _latest_written(
+    batch: MetricBatch, rows: dict[MetricKey, dict[str, Any]], written: set[MetricKey]
+) -> dict[tuple[str, str], datetime]:
+    """Latest ``written`` timestamp per (metric type, source) of ``batch``'s ``rows``."""
+    if len(written) == len(rows):
+        return batch.latest()
+    latest: dict[tuple[str, str], datetime] = {}
+    for key in written:
+        mark = (key[1], rows[key]["source"])
+        latest[mark] = max(latest.get(mark, key[2]), key[2])
+    return latest
+
+
+def _create_statement(metric: HealthMetricCreate):
+    obj_data = _row(metric)
+    stmt = insert(HealthMetric).values(**obj_data)
+    replaced = obj_data.keys() - {"owner", "metric_type", "measured_at"}
+    return stmt.on_conflict_do_update(
+        constraint=UNIQUE_KEY_CONSTRAINT,
+        set_={field: stmt.excluded[field] for field in (*replaced, "updated_at")},
+    ).returning(HealthMetric)
+
+
+class _CsvStream(io.TextIOBase):
+    """File-like view over CSV text produced lazily, one batch at a time, for COPY."""
+
+    def __init__(self, batches: Iterable[MetricBatch]):
+        self._batches = iter(batches)
+        self._buffer = ""
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> str:
+        if size is None or size < 0:
+            size = sys.maxsize
+        while len(self._buffer) - self._pos < size and self._fill():
+            pass
+        chunk = self._buffer[self._pos : self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def readline(self, size: int | None = -1) -> str:
+        return self.read(size)
+
+    def _fill(self) -> bool:
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        self._buffer = self._buffer[self._pos :] + batch.csv()
+        self._pos = 0
+        return True
+
+
+class HealthMetricService(CRUDBase[HealthMetric, HealthMetricCreate, HealthMetricUpdate]):
+    def latest(
+        self, db: Session, owner: str, limit: int = 10, now: datetime | None = None
+    ) -> list[HealthMetric]:
+        """The ``limit`` most recent metrics of ``owner``.
+
+        Tries the last ``LATEST_WINDOW_DAYS`` first, which only scans the
+        partitions of those months, and all of them if that finds too few.
+        """
+        since = (now or datetime.now(UTC)) - timedelta(days=LATEST_WINDOW_DAYS)
+        metrics = self.get_multi(db, limit=limit, owner=owner, since=since)
+        if len(metrics) < limit:
+            metrics = self.get_multi(db, limit=limit, owner=owner)
+        return metrics
+
+    def create(self, db: Session, obj_in: HealthMetricCreate) -> HealthMetric:
+        """Create a metric, replacing any row with the same owner, type and time."""
+        db_obj = db.scalars(_create_statement(obj_in)).one()
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def bulk_upsert(
+        self,
+        db: Session,
+        metrics: Iterable[HealthMetricCreate],
+        batch_size: int | None = None,
+        copy_threshold: int | None = None,
+        on_batch: BatchCallback | None = None,
+        result: ImportResult | None = None,
+    ) -> ImportResult:
+        """Insert or update imported metrics in large batches.
+
+        Models are packed into ``MetricBatch`` columns and written by
+        ``bulk_upsert_batches``; see there for the semantics.
+        """
+        batch_size = batch_size or settings.import_batch_size
+        return self.bulk_upsert_batches(
+            db,
+            MetricBatch.from_models(metrics, batch_size),
+            batch_size=batch_size,
+            copy_threshold=copy_threshold,
+            on_batch=on_batch,
+            result=result,
+        )
+
+    def bulk_upsert_batches(
+        self,
+        db: Session,
+        batches: Iterable[MetricBatch],
+        batch_size: int | None = None,
+        copy_threshold: int | None = None,
+        on_batch: BatchCallback | None = None,
+        result: ImportResult | None = None,
+    ) -> ImportResult:
+        """Insert or update columnar batches of imported metrics.
+
+        Each batch of up to ``batch_size`` rows is validated once and written as a
+        single ``INSERT ... ON CONFLICT DO UPDATE`` keyed on (owner, metric_type,
+        measured_at), then committed. Existing rows with source ``manual`` are never
+        overwritten and count as skipped. Counts match the former row-by-row
+        import: every input row is imported, skipped or an error, including
+        repeats of the same key within one import. Only rows the database rejects
+        (``ROW_ERRORS``) are errors; other failures, such as a lost connection,
+        raise, leaving the batches committed so far.
+
+        Once ``copy_threshold`` rows (``settings.import_copy_threshold`` by default,
+        0 disables) have been written this way, the remainder of the stream switches
+        to the COPY staging path, which avoids per-row bind parameters entirely.
+
+        ``on_batch`` is called with the running totals right before each commit, in
+        the same transaction, so progress recorded there is exactly as durable as the
+        rows it describes. Pass ``result`` to continue totals from an earlier run.
+        The import watermarks advance in that transaction too, over written rows only.
+        """
+        batch_size = batch_size or settings.import_batch_size
+        if copy_threshold is None:
+            copy_threshold = settings.import_copy_threshold
+
+        result = result or ImportResult(total_records=0, imported=0, skipped=0, errors=0)
+        parts = (part for batch in batches for part in batch.split(batch_size))
+        written = 0
+        for part in parts:
+            self._upsert_batch(db, part, result, on_batch)
+            written += len(part)
+            if copy_threshold and written >= copy_threshold:
+                self._copy_merge(db, parts, result, on_batch)
+                break
+        return result
+
+    def _upsert_batch(
+        self,
+        db: Session,
+        batch: MetricBatch,
+        result: ImportResult,
+        on_batch: BatchCallback | None = None,
+    ) -> None:
+        # Counted in the transaction that writes the batch: a resumed job skips
+        # total_records rows (see import_jobs), so they must all be committed.
+        result.total_records += len(batch)
+        batch, invalid = batch.validated()
+        result.errors += invalid
+
+        # ON CONFLICT cannot touch the same row twice in one statement, so collapse
+        # repeated keys (last one wins) and remember how many inputs each row stands for.
+        rows: dict[MetricKey, dict[str, Any]] = {}
+        counts: Counter[MetricKey] = Counter()
+        for row in batch.rows():
+            key = (row["owner"], row["metric_type"], row["measured_at"])
+            rows[key] = row
+            counts[key] += 1
+
+        params = list(rows.values())
+        try:
+            returned = db.execute(self._upsert_statement(), params).all() if params else []
+        except ROW_ERRORS:
+            logger.exception("Bulk upsert of %d metrics failed, retrying row by row", len(rows))
+            db.rollback()
+            written = self._upsert_rows(db, rows, counts, result)
+        else:
+            written = {tuple(key) for key in returned}
+            imported = sum(counts[key] for key in written)
+            result.imported += imported
+            result.skipped += len(batch) - imported
+        import_watermark_service.advance(db, batch.owner, _latest_written(batch, rows, written))
+        if on_batch:
+            on_batch(result)
+        db.commit()
+
+    def _upsert_rows(
+        self,
+        db: Session,
+        rows: dict[MetricKey, dict[str, Any]],
+        counts: Counter[MetricKey],
+        result: ImportResult,
+    ) -> set[MetricKey]:
+        """Fallback for a failed batch: isolate bad rows so the rest still land.
+
+        Returns the keys that were written.
+        """
+        stmt = self._upsert_statement()
+        written: set[MetricKey] = set()
+        for key, row in rows.items():
+            try:
+                returned = db.execute(stmt, row).first()
+                db.commit()
+            except ROW_ERRORS:
+                logger.exception("Failed to import metric: %s", row["metric_type"])
+                db.rollback()
+                result.errors += counts[key]
+                continue
+            if returned:
+                written.add(key)
+                result.imported += counts[key]
+            else:
+                result.skipped += counts[key]
+        return written
+
+    def _copy_merge(
+        self,
+        db: Session,
+        batches: Iterator[MetricBatch],
+        result: ImportResult,
+        on_batch: BatchCallback | None = None,
+    ) -> None:
+        """Stream batches through ``COPY FROM STDIN`` into staging, then merge per chunk.
+
+        Each chunk of about ``settings.import_copy_chunk_size`` rows is one
+        transaction. A chunk that fails to load falls back to the batched upsert
+        path so bad rows are isolated the same way.
+        """
+        for chunk in self._copy_chunks(batches):
+            validated = [batch.validated() for batch in chunk]
+            staged = [batch for batch, _ in validated]
+            rows = sum(len(batch) for batch in staged)
+            try:
+                db.execute(CREATE_STAGING_TABLE)
+                cursor = db.connection().connection.cursor()
+                try:
+                    cursor.copy_expert(
+                        f"COPY health_metrics_stage ({', '.join(COPY_COLUMNS)}) "
+                        "FROM STDIN WITH (FORMAT csv)",
+                        _CsvStream(staged),
+                    )
+                finally:
+                    cursor.close()
+                merged = db.execute(MERGE_STAGED_ROWS).all()
+            except (SQLAlchemyError, psycopg2.Error):
+                logger.exception("COPY merge of %d metrics failed, using batches", rows)
+                db.rollback()
+                for batch in chunk:
+                    self._upsert_batch(db, batch, result, on_batch)
+                continue
+            result.total_records += sum(len(batch) for batch in chunk)
+            result.errors += sum(invalid for _, invalid in validated)
+            imported = sum(count for *_, count in merged)
+            result.imported += imported
+            result.skipped += rows - imported
+            latest: dict[str, dict[tuple[str, str], datetime]] = defaultdict(dict)
+            for owner, metric_type, source, measured_at, _ in merged:
+                latest[owner][metric_type, source] = measured_at
+            for owner, marks in latest.items():
+                import_watermark_service.advance(db, owner, marks)
+            if on_batch:
+                on_batch(result)
+            db.commit()
+
+    def _copy_chunks(self, batches: Iterator[MetricBatch]) -> Iterator[list[MetricBatch]]:
+        """Group batches into chunks of about ``import_copy_chunk_size`` rows."""
+        chunk: list[MetricBatch] = []
+        rows = 0
+        for batch in batches:
+            chunk.append(batch)
+            rows += len(batch)
+            if rows >= settings.import_copy_chunk_size:
+                yield chunk
+                chunk, rows = [], 0
+        if chunk:
+            yield chunk
+
+    def _upsert_statement(self):
+        stmt = insert(HealthMetric)
+        return stmt.on_conflict_do_update(
+            constraint=UNIQUE_KEY_CONSTRAINT,
+            set_={column: stmt.excluded[column] for column in REPLACED_COLUMNS},
+            where=HealthMetric.source != "manual",
+        ).returning(HealthMetric.owner, HealthMetric.metric_type, HealthMetric.measured_at)
+
+
+class AsyncHealthMetricService(AsyncCRUDBase[HealthMetric, HealthMetricCreate, HealthMetricUpdate]):
+    """The request-time half of ``HealthMetricService`` for the async routes.
+
+    Imports and maintenance stay on ``HealthMetricService``: COPY and the
+    batched upserts run on psycopg2 in worker threads.
+    """
+
+    async def latest(
+        self, db: AsyncSession, owner: str, limit: int = 10, now: datetime | None = None
+    ) -> list[HealthMetric]:
+        """As ``HealthMetricService.latest``."""
+        since = (now or datetime.now(UTC)) - timedelta(days=LATEST_WINDOW_DAYS)
+        metrics = await self.get_multi(db, limit=limit, owner=owner, since=since)
+        if len(metrics) < limit:
+            metrics = await self.get_multi(db, limit=limit, owner=owner)
+        return metrics
+
+    async def create(self, db: AsyncSession, obj_in: HealthMetricCreate) -> HealthMetric:
+        """Create a metric, replacing any row with the same owner, type and time."""
+        db_obj = (await db.scalars(_create_statement(obj_in))).one()
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self, db: AsyncSession, db_obj: HealthMetric, obj_in: HealthMetricUpdate | dict
+    ) -> HealthMetric:
+        if not isinstance(obj_in, dict):
+            obj_in = obj_in.model_dump(exclude_unset=True)
+        # asyncpg only binds naive datetimes to timestamp columns.
+        if obj_in.get("measured_at"):
+            obj_in = {**obj_in, "measured_at": to_db_timestamp(obj_in["measured_at"])}
+        return await super().update(db, db_obj, obj_in)
+
+
+health_metric_service = HealthMetricService(HealthMetric)
+async_health_metric_service = AsyncHealthMetricService(HealthMetric)
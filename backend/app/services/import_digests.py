@@ -0,0 +1,97 @@
+"""Ledger of recent import results, to answer repeated requests without importing.
+
+Health Auto Export retries webhooks with identical payloads and uploads get
+submitted twice. Each import request is reduced to a digest of its content and
+parameters (or of its ``Idempotency-Key``), and the result of the first run is
+stored per owner for ``settings.import_digest_ttl_seconds``. The ledger lives in
+the database so every API worker sees it. Two identical requests that arrive
+together may both run; the import upsert makes that harmless.
+"""
+
+import hashlib
+import json
+from collections.abc import Mapping
+from datetime import UTC, datetime, timedelta
+from typing import IO, Any
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import ImportDigest
+from app.models.import_digest import DIGEST_KEY_CONSTRAINT
+from app.schemas import ImportResult
+
+RESULT_COLUMNS = ("total_records", "imported", "skipped", "errors")
+
+
+def request_digest(endpoint: str, params: Mapping[str, Any]) -> "hashlib._Hash":
+    """Running SHA-256 of a request to ``endpoint``; feed it the body next."""
+    digest = hashlib.sha256(endpoint.encode() + b"\0")
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode() + b"\0")
+    return digest
+
+
+def idempotency_digest(endpoint: str, key: str) -> str:
+    """Digest standing for every request to ``endpoint`` sent with Idempotency-Key ``key``."""
+    return hashlib.sha256(f"{endpoint}\0Idempotency-Key\0{key}".encode()).hexdigest()
+
+
+def copy_digesting(
+    source: IO[bytes], target: IO[bytes], digest: "hashlib._Hash", size: int
+) -> None:
+    """Copy ``source`` to ``target`` in ``size`` reads, adding each to ``digest``."""
+    while chunk := source.read(size):
+        digest.update(chunk)
+        target.write(chunk)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class ImportDigestService:
+    """Looks up and records results in ``import_digests``."""
+
+    def get(self, db: Session, owner: str, digest: str) -> ImportResult | None:
+        """The stored result for ``digest``, unless the ledger is off or it expired."""
+        if not settings.import_digest_ttl_seconds:
+            return None
+        row = db.scalars(
+            select(ImportDigest).where(
+                ImportDigest.owner == owner,
+                ImportDigest.digest == digest,
+                ImportDigest.expires_at > _utcnow(),
+            )
+        ).first()
+        if row is None:
+            return None
+        return ImportResult(**{column: getattr(row, column) for column in RESULT_COLUMNS})
+
+    def record(self, db: Session, owner: str, digest: str, result: ImportResult) -> None:
+        """Store ``result`` for ``digest`` and evict expired entries."""
+        if not settings.import_digest_ttl_seconds:
+            return
+        now = _utcnow()
+        db.execute(delete(ImportDigest).where(ImportDigest.expires_at <= now))
+        stmt = insert(ImportDigest).values(
+            owner=owner,
+            digest=digest,
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.import_digest_ttl_seconds),
+            **result.model_dump(include=set(RESULT_COLUMNS)),
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                constraint=DIGEST_KEY_CONSTRAINT,
+                set_={
+                    column: stmt.excluded[column]
+                    for column in (*RESULT_COLUMNS, "created_at", "expires_at")
+                },
+            )
+        )
+        db.commit()
+
+
+import_digest_service = ImportDigestService()
@@ -0,0 +1,252 @@
+"""Background import jobs, stored in ``import_jobs`` and run inside the app process.
+
+Uploads are saved to ``settings.import_job_dir`` and processed by a small thread
+pool. Job progress is written in the same transaction as each batch of metrics,
+so after a crash a job resumes right after its last committed batch.
+"""
+
+import asyncio
+import logging
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from functools import partial
+from pathlib import Path
+from typing import IO
+from uuid import uuid4
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import ImportJob
+from app.schemas import ImportResult
+from app.services.crud import health_metric
+from app.services.metric_batch import skip_rows
+from app.services.parse_pool import parse_pool
+from app.services.record_filter import RecordFilter
+from app.services.retention import RetentionPolicy, import_policy
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def _lost_database(error: Exception) -> bool:
+    """Whether ``error`` is the database going away rather than a problem with the job."""
+    return isinstance(error, OperationalError | InterfaceError) or (
+        isinstance(error, DBAPIError) and error.connection_invalidated
+    )
+
+
+class ImportJobRunner:
+    """Queues import jobs and runs them on a thread pool."""
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._active: set[int] = set()
+
+    def create(
+        self,
+        db: Session,
+        upload: IO[bytes],
+        filename: str,
+        owner: str,
+        aggregate_days: int,
+        record_filter: RecordFilter | None = None,
+    ) -> ImportJob:
+        """Persist the upload and record a queued job for it."""
+        settings.import_job_dir.mkdir(parents=True, exist_ok=True)
+        path = settings.import_job_dir / f"{uuid4().hex}{Path(filename).suffix}"
+        with path.open("wb") as out:
+            shutil.copyfileobj(upload, out, COPY_BUFFER_SIZE)
+
+        job = ImportJob(
+            owner=owner,
+            filename=filename,
+            file_path=str(path),
+            aggregate_days=aggregate_days,
+            retention_policy=import_policy(db, aggregate_days).to_json(),
+            record_filter=record_filter.to_json() if record_filter else None,
+            reference_time=_utcnow(),
+            phase="queued",
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def submit(self, job_id: int) -> None:
+        with self._lock:
+            if job_id in self._active:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.import_job_workers, thread_name_prefix="import-job"
+                )
+            self._active.add(job_id)
+        self._executor.submit(self._run_guarded, job_id)
+
+    def resume_pending(self) -> None:
+        """Heartbeat jobs running here and pick up queued or abandoned ones."""
+        now = _utcnow()
+        stale_before = now - timedelta(seconds=settings.import_job_stale_seconds)
+        with SessionLocal() as db:
+            with self._lock:
+                active = list(self._active)
+            if active:
+                db.execute(
+                    update(ImportJob)
+                    .where(ImportJob.id.in_(active), ImportJob.phase == "running")
+                    .values(heartbeat_at=now)
+                )
+                db.commit()
+            pending = db.scalars(
+                select(ImportJob.id).where(
+                    or_(
+                        ImportJob.phase == "queued",
+                        and_(ImportJob.phase == "running", ImportJob.heartbeat_at < stale_before),
+                    )
+                )
+            ).all()
+        for job_id in pending:
+            self.submit(job_id)
+
+    async def poll_forever(self) -> None:
+        while True:
+            try:
+                await run_in_threadpool(self.resume_pending)
+            except Exception:
+                logger.exception("Failed to poll for pending import jobs")
+            await asyncio.sleep(settings.import_job_poll_seconds)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, job_id: int) -> None:
+        """Claim and run one job; a no-op if another worker already owns it."""
+        with SessionLocal() as db:
+            job = self._claim(db, job_id)
+            if job is None:
+                return
+            if not Path(job.file_path).is_file():
+                logger.error("Import job %d lost its upload %s", job_id, job.file_path)
+                self._finish(
+                    db,
+                    job,
+                    "failed",
+                    error=f"Upload {job.file_path} no longer exists; submit the file again",
+                )
+                return
+            try:
+                self._import(db, job)
+            except Exception as e:
+                db.rollback()
+                if _lost_database(e):
+                    # Keep the upload: polling resumes the job after its last committed
+                    # batch. If the database is still down, the commit below fails and the
+                    # job stays running until its heartbeat goes stale.
+                    logger.warning("Import job %d lost the database, requeued: %s", job_id, e)
+                    job.phase = "queued"
+                    db.commit()
+                    return
+                logger.exception("Import job %d failed", job_id)
+                self._finish(db, job, "failed", error=str(e))
+            else:
+                self._finish(db, job, "completed")
+
+    def _run_guarded(self, job_id: int) -> None:
+        try:
+            self.run(job_id)
+        except Exception:
+            logger.exception("Import job %d could not be run", job_id)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _claim(self, db: Session, job_id: int) -> ImportJob | None:
+        now = _utcnow()
+        stale_before = now - timedelta(seconds=settings.import_job_stale_seconds)
+        claimed = db.execute(
+            update(ImportJob)
+            .where(
+                ImportJob.id == job_id,
+                or_(
+                    ImportJob.phase == "queued",
+                    and_(ImportJob.phase == "running", ImportJob.heartbeat_at < stale_before),
+                ),
+            )
+            .values(
+                phase="running",
+                heartbeat_at=now,
+                started_at=func.coalesce(ImportJob.started_at, now),
+            )
+        ).rowcount
+        db.commit()
+        return db.get(ImportJob, job_id) if claimed else None
+
+    def _import(self, db: Session, job: ImportJob) -> None:
+        progress = ImportResult(
+            total_records=job.rows_parsed,
+            imported=job.rows_written,
+            skipped=job.rows_skipped,
+            errors=job.rows_errored,
+        )
+        policy = (
+            RetentionPolicy.from_json(job.retention_policy)
+            if job.retention_policy is not None
+            else RetentionPolicy.daily(job.aggregate_days)
+        )
+        batches = parse_pool.iter_export(
+            Path(job.file_path),
+            job.owner,
+            policy,
+            now=job.reference_time.replace(tzinfo=UTC),
+            # Resuming by row count needs the same row order on every run.
+            shards=1,
+            record_filter=RecordFilter.from_json(job.record_filter) if job.record_filter else None,
+        )
+        # Rows up to the last committed batch are already in the database.
+        remaining = skip_rows(batches, job.rows_parsed)
+        health_metric.bulk_upsert_batches(
+            db,
+            remaining,
+            on_batch=partial(self._record_progress, db, job.id),
+            result=progress,
+        )
+
+    def _record_progress(self, db: Session, job_id: int, result: ImportResult) -> None:
+        db.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id)
+            .values(
+                rows_parsed=result.total_records,
+                rows_written=result.imported,
+                rows_skipped=result.skipped,
+                rows_errored=result.errors,
+                batches_committed=ImportJob.batches_committed + 1,
+                heartbeat_at=_utcnow(),
+            )
+        )
+
+    def _finish(self, db: Session, job: ImportJob, phase: str, error: str | None = None) -> None:
+        job.phase = phase
+        job.error = error
+        job.finished_at = _utcnow()
+        db.commit()
+        Path(job.file_path).unlink(missing_ok=True)
+
+
+import_job_runner = ImportJobRunner()
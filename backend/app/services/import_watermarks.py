@@ -0,0 +1,80 @@
+"""High-water marks of imported metrics, for incremental re-imports.
+
+Each import batch advances, in the transaction that writes it, the latest
+``measured_at`` written per owner, metric type and source; rows that failed
+or were skipped leave the marks alone. An incremental import
+then only reads records from a little before each mark onwards.
+"""
+
+from collections.abc import Mapping
+from datetime import UTC, datetime, time, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import ImportWatermark
+from app.models.import_watermark import WATERMARK_KEY_CONSTRAINT
+
+
+class ImportWatermarkService:
+    """Reads and advances ``import_watermarks``."""
+
+    def advance(self, db: Session, owner: str, latest: Mapping[tuple[str, str], datetime]) -> None:
+        """Raise ``owner``'s marks to ``latest``; the caller commits.
+
+        ``latest`` maps (metric type, source) to the latest timestamp written,
+        as ``MetricBatch.latest`` gives it for a batch written whole.
+        """
+        if not latest:
+            return
+        now = datetime.now(UTC).replace(tzinfo=None)
+        stmt = insert(ImportWatermark).values(
+            [
+                {
+                    "owner": owner,
+                    "metric_type": metric_type,
+                    "source": source,
+                    "measured_at": measured_at,
+                    "updated_at": now,
+                }
+                for (metric_type, source), measured_at in latest.items()
+            ]
+        )
+        db.execute(
+            stmt.on_conflict_do_update(
+                constraint=WATERMARK_KEY_CONSTRAINT,
+                set_={
+                    "measured_at": func.greatest(
+                        ImportWatermark.measured_at, stmt.excluded.measured_at
+                    ),
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+
+    def get(self, db: Session, owner: str, source: str) -> dict[str, datetime]:
+        """The mark per metric type for one owner and source."""
+        rows = db.execute(
+            select(ImportWatermark.metric_type, ImportWatermark.measured_at).where(
+                ImportWatermark.owner == owner, ImportWatermark.source == source
+            )
+        )
+        return {metric_type: measured_at for metric_type, measured_at in rows}
+
+    def incremental_since(self, db: Session, owner: str, source: str) -> dict[str, datetime]:
+        """Per metric type, the time an incremental import of ``source`` reads from.
+
+        That is the mark less ``settings.import_incremental_overlap_hours``,
+        rounded down to midnight. Retention buckets divide a day, so a bucket is
+        always re-read whole and never replaced by a partial one.
+        """
+        overlap = timedelta(hours=settings.import_incremental_overlap_hours)
+        return {
+            metric_type: datetime.combine((mark - overlap).date(), time())
+            for metric_type, mark in self.get(db, owner, source).items()
+        }
+
+
+import_watermark_service = ImportWatermarkService()
@@ -0,0 +1,369 @@
+"""Columnar batches of parsed health metrics for the import pipeline.
+
+A batch holds one owner's rows column by column: values as float64, timestamps
+as int64 microseconds since the epoch in UTC (the naive UTC form stored in
+``measured_at``), and metric types, units and sources as small integer codes
+into a label table shared by the batch. Imports produce millions of rows with a
+handful of distinct strings, so this costs a few dozen bytes per row instead of
+a validated pydantic model each, and it pickles as a few flat buffers.
+
+Rollup batches (``resolution_seconds`` > 0) also carry each bucket's sample
+count, min and max; raw batches leave those columns empty.
+"""
+
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from datetime import UTC, datetime, timedelta
+from typing import Any, get_args
+
+import numpy as np
+
+from app.schemas import HealthMetricCreate
+from app.schemas.health_metric import SourceType
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=UTC)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+SOURCES = frozenset(get_args(SourceType))
+MAX_OWNER_LENGTH = HealthMetricCreate.model_fields["owner"].metadata[0].max_length
+MAX_METRIC_TYPE_LENGTH = HealthMetricCreate.model_fields["metric_type"].metadata[0].max_length
+MAX_UNIT_LENGTH = HealthMetricCreate.model_fields["unit"].metadata[0].max_length
+
+
+def epoch_us(value: datetime) -> int:
+    """Microseconds since the epoch for ``value``, naive values being UTC already."""
+    return (value - (EPOCH if value.tzinfo is None else EPOCH_UTC)) // ONE_MICROSECOND
+
+
+def from_epoch_us(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _csv_field(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+class MetricBatch:
+    """Imported metrics for one owner, stored column by column."""
+
+    __slots__ = (
+        "owner",
+        "labels",
+        "metric_types",
+        "units",
+        "sources",
+        "values",
+        "timestamps",
+        "resolution_seconds",
+        "counts",
+        "minimums",
+        "maximums",
+        "_codes",
+    )
+
+    def __init__(self, owner: str, resolution_seconds: int = 0):
+        self.owner = owner
+        self.labels: list[str] = []
+        self.metric_types = array("H")
+        self.units = array("H")
+        self.sources = array("H")
+        self.values = array("d")
+        self.timestamps = array("q")
+        self.resolution_seconds = resolution_seconds
+        self.counts = array("q")
+        self.minimums = array("d")
+        self.maximums = array("d")
+        self._codes: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getstate__(self) -> tuple:
+        return (
+            self.owner,
+            self.labels,
+            self.metric_types,
+            self.units,
+            self.sources,
+            self.values,
+            self.timestamps,
+            self.resolution_seconds,
+            self.counts,
+            self.minimums,
+            self.maximums,
+        )
+
+    def __setstate__(self, state: tuple) -> None:
+        (
+            self.owner,
+            self.labels,
+            self.metric_types,
+            self.units,
+            self.sources,
+            self.values,
+            self.timestamps,
+            self.resolution_seconds,
+            self.counts,
+            self.minimums,
+            self.maximums,
+        ) = state
+        self._codes = {label: code for code, label in enumerate(self.labels)}
+
+    def append(
+        self, metric_type: str, value: float, unit: str, measured_at_us: int, source: str
+    ) -> None:
+        codes = self._codes
+        self.metric_types.append(
+            codes[metric_type] if metric_type in codes else self._code(metric_type)
+        )
+        self.units.append(codes[unit] if unit in codes else self._code(unit))
+        self.sources.append(codes[source] if source in codes else self._code(source))
+        self.values.append(value)
+        self.timestamps.append(measured_at_us)
+
+    def append_rollup(
+        self,
+        metric_type: str,
+        value: float,
+        unit: str,
+        measured_at_us: int,
+        source: str,
+        count: int,
+        minimum: float,
+        maximum: float,
+    ) -> None:
+        """Append a bucket of ``count`` samples; only for batches with a resolution."""
+        self.append(metric_type, value, unit, measured_at_us, source)
+        self.counts.append(count)
+        self.minimums.append(minimum)
+        self.maximums.append(maximum)
+
+    @classmethod
+    def from_models(
+        cls, metrics: Iterable[HealthMetricCreate], size: int
+    ) -> Iterator["MetricBatch"]:
+        """Pack models into batches of up to ``size`` rows, one owner per batch.
+
+        Batches only carry what imports set, so models with notes or marked
+        inactive are rejected rather than silently altered.
+        """
+        batch: MetricBatch | None = None
+        for metric in metrics:
+            if metric.notes is not None or not metric.is_active:
+                raise ValueError("Bulk imports do not support notes or inactive metrics")
+            if batch is None or batch.owner != metric.owner or len(batch) >= size:
+                if batch:
+                    yield batch
+                batch = cls(metric.owner)
+            batch.append(
+                metric.metric_type,
+                metric.value,
+                metric.unit,
+                epoch_us(metric.measured_at),
+                metric.source,
+            )
+        if batch:
+            yield batch
+
+    @classmethod
+    def concat(cls, batches: Iterable["MetricBatch"]) -> "MetricBatch":
+        """One raw batch holding the rows of ``batches``, which share an owner, in order."""
+        merged: MetricBatch | None = None
+        for batch in batches:
+            if batch.resolution_seconds:
+                raise ValueError("Only raw batches can be concatenated")
+            if merged is None:
+                merged = cls(batch.owner)
+            elif batch.owner != merged.owner:
+                raise ValueError("Concatenated batches must share one owner")
+            codes = np.array([merged._code(label) for label in batch.labels] or [0], np.uint16)
+            for name in ("metric_types", "units", "sources"):
+                column = np.frombuffer(getattr(batch, name), np.uint16)
+                getattr(merged, name).frombytes(codes[column].tobytes())
+            merged.values.extend(batch.values)
+            merged.timestamps.extend(batch.timestamps)
+        if merged is None:
+            raise ValueError("Nothing to concatenate")
+        return merged
+
+    def split(self, size: int) -> Iterator["MetricBatch"]:
+        """This batch in slices of at most ``size`` rows."""
+        if len(self) <= size:
+            yield self
+            return
+        for start in range(0, len(self), size):
+            yield self[start : start + size]
+
+    def __getitem__(self, rows: slice) -> "MetricBatch":
+        # Slices share the label table; they are read, never appended to.
+        part = MetricBatch(self.owner, self.resolution_seconds)
+        part.labels = self.labels
+        part._codes = self._codes
+        part.metric_types = self.metric_types[rows]
+        part.units = self.units[rows]
+        part.sources = self.sources[rows]
+        part.values = self.values[rows]
+        part.timestamps = self.timestamps[rows]
+        part.counts = self.counts[rows]
+        part.minimums = self.minimums[rows]
+        part.maximums = self.maximums[rows]
+        return part
+
+    def validated(self) -> tuple["MetricBatch", int]:
+        """Check each distinct label once; returns the valid rows and how many were dropped.
+
+        Applies the same limits as ``HealthMetricCreate``. Values and timestamps
+        are typed by their arrays, so only the strings need checking.
+        """
+        if len(self.owner) > MAX_OWNER_LENGTH:
+            raise ValueError(f"Owner is longer than {MAX_OWNER_LENGTH} characters")
+        bad_types = self._invalid_codes(
+            self.metric_types, lambda label: len(label) <= MAX_METRIC_TYPE_LENGTH
+        )
+        bad_units = self._invalid_codes(self.units, lambda label: len(label) <= MAX_UNIT_LENGTH)
+        bad_sources = self._invalid_codes(self.sources, SOURCES.__contains__)
+        if not (bad_types or bad_units or bad_sources):
+            return self, 0
+
+        keep = [
+            i
+            for i, (metric_type, unit, source) in enumerate(
+                zip(self.metric_types, self.units, self.sources, strict=True)
+            )
+            if not (metric_type in bad_types or unit in bad_units or source in bad_sources)
+        ]
+        return self._take(keep), len(self) - len(keep)
+
+    def deduplicated(self) -> tuple["MetricBatch", int]:
+        """Keep the last row per (metric type, timestamp); returns it and how many were dropped."""
+        last = {key: i for i, key in enumerate(zip(self.metric_types, self.timestamps))}
+        if len(last) == len(self):
+            return self, 0
+        return self._take(sorted(last.values())), len(self) - len(last)
+
+    def rows(self) -> Iterator[dict[str, Any]]:
+        """Rows as column dicts for executemany inserts."""
+        labels = self.labels
+        for i, (metric_type, unit, source, value, micros) in enumerate(
+            zip(
+                self.metric_types,
+                self.units,
+                self.sources,
+                self.values,
+                self.timestamps,
+                strict=True,
+            )
+        ):
+            yield {
+                "owner": self.owner,
+                "metric_type": labels[metric_type],
+                "measured_at": from_epoch_us(micros),
+                "value": value,
+                "unit": labels[unit],
+                "notes": None,
+                "is_active": True,
+                "source": labels[source],
+                **self._stats(i),
+            }
+
+    def latest(self) -> dict[tuple[str, str], datetime]:
+        """Latest timestamp per (metric type, source) in this batch."""
+        if not self:
+            return {}
+        keys = np.frombuffer(self.metric_types, np.uint16).astype(np.uint32) << 16
+        keys |= np.frombuffer(self.sources, np.uint16)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        latest = np.full(len(unique), np.iinfo(np.int64).min)
+        np.maximum.at(latest, inverse, np.frombuffer(self.timestamps, np.int64))
+        labels = self.labels
+        return {
+            (labels[key >> 16], labels[key & 0xFFFF]): from_epoch_us(int(micros))
+            for key, micros in zip(unique.tolist(), latest.tolist(), strict=True)
+        }
+
+    def to_models(self) -> list[HealthMetricCreate]:
+        """Rebuild models (with naive UTC ``measured_at``), mainly for tests and tools."""
+        return [HealthMetricCreate.model_construct(**row) for row in self.rows()]
+
+    def csv(self) -> str:
+        """Rows as CSV lines in ``COPY_COLUMNS`` order.
+
+        That is owner, metric_type, epoch microseconds, value, unit, source, then
+        resolution, sample count, min and max (empty, i.e. NULL, for raw rows).
+        """
+        quoted = [_csv_field(label) for label in self.labels]
+        owner = _csv_field(self.owner)
+        if self.resolution_seconds:
+            stats = [
+                f"{self.resolution_seconds},{count},{minimum!r},{maximum!r}"
+                for count, minimum, maximum in zip(
+                    self.counts, self.minimums, self.maximums, strict=True
+                )
+            ]
+        else:
+            stats = ["0,,,"] * len(self)
+        return "".join(
+            f"{owner},{quoted[metric_type]},{micros},{value!r},{quoted[unit]},{quoted[source]},"
+            f"{row_stats}\n"
+            for metric_type, unit, source, value, micros, row_stats in zip(
+                self.metric_types,
+                self.units,
+                self.sources,
+                self.values,
+                self.timestamps,
+                stats,
+                strict=True,
+            )
+        )
+
+    def _stats(self, row: int) -> dict[str, Any]:
+        if not self.resolution_seconds:
+            return {
+                "resolution_seconds": 0,
+                "sample_count": None,
+                "value_min": None,
+                "value_max": None,
+            }
+        return {
+            "resolution_seconds": self.resolution_seconds,
+            "sample_count": self.counts[row],
+            "value_min": self.minimums[row],
+            "value_max": self.maximums[row],
+        }
+
+    def _take(self, rows: list[int]) -> "MetricBatch":
+        """A batch of the given row positions, sharing the label table."""
+        if len(rows) == len(self):
+            return self
+        part = MetricBatch(self.owner, self.resolution_seconds)
+        part.labels = self.labels
+        part._codes = self._codes
+        columns = ["metric_types", "units", "sources", "values", "timestamps"]
+        if self.resolution_seconds:
+            columns += ["counts", "minimums", "maximums"]
+        for name in columns:
+            column = getattr(self, name)
+            setattr(part, name, array(column.typecode, [column[i] for i in rows]))
+        return part
+
+    def _code(self, label: str) -> int:
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def _invalid_codes(self, codes: array, is_valid: Callable[[str], bool]) -> set[int]:
+        return {code for code in set(codes) if not is_valid(self.labels[code])}
+
+
+def skip_rows(batches: Iterable[MetricBatch], count: int) -> Iterator[MetricBatch]:
+    """Drop the first ``count`` rows of a batch stream."""
+    iterator = iter(batches)
+    for batch in iterator:
+        if count < len(batch):
+            yield batch[count:] if count else batch
+            break
+        count -= len(batch)
+    yield from iterator
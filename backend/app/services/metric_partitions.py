@@ -0,0 +1,178 @@
+"""Monthly range partitions of ``health_metrics``.
+
+``health_metrics`` is partitioned by ``measured_at``, with one partition per
+calendar month (``health_metrics_p2024_05``) and a default partition that
+takes rows of months without one, so a write never fails for lack of a
+partition (an import of a years-old export lands there). Queries bounded on
+``measured_at`` only scan the partitions of the months they cover.
+
+``MetricPartitions.maintain`` runs periodically, like retention compaction:
+
+- rows in the default partition move to partitions of their own months, and
+  partitions are created for the coming ``metric_partition_months_ahead``
+  months;
+- partitions entirely older than ``metric_partition_retention_months`` are
+  detached, and dropped with ``metric_partition_retention_drop``. A detached
+  partition is a plain table again and can be attached back.
+
+New partitions are created standalone, filled and then attached, which only
+takes a SHARE UPDATE EXCLUSIVE lock on ``health_metrics``; writes to the
+default partition wait while a month moves out of it.
+"""
+
+import asyncio
+import logging
+import re
+from datetime import UTC, date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.schemas import PartitionMaintenanceResult
+
+logger = logging.getLogger(__name__)
+
+TABLE = "health_metrics"
+DEFAULT_PARTITION = "health_metrics_default"
+PARTITION_PATTERN = re.compile(r"health_metrics_p(\d{4})_(\d{2})")
+
+LIST_PARTITIONS = text(
+    f"""
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = '{TABLE}'::regclass
+    """
+)
+DEFAULT_MONTHS = text(
+    f"SELECT DISTINCT date_trunc('month', measured_at)::date FROM {DEFAULT_PARTITION}"
+)
+# Serializes maintenance across processes; one transaction per partition holds it.
+LOCK_MAINTENANCE = text(f"SELECT pg_advisory_xact_lock(hashtext('{TABLE}_partitions'))")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+class MetricPartitions:
+    """Creates, fills and expires the monthly partitions of ``health_metrics``."""
+
+    def months(self, db: Session) -> list[date]:
+        """Months that have a partition attached."""
+        months = []
+        for (name,) in db.execute(LIST_PARTITIONS):
+            match = PARTITION_PATTERN.fullmatch(name)
+            if match:
+                months.append(date(int(match[1]), int(match[2]), 1))
+        return sorted(months)
+
+    def maintain(self, db: Session, now: datetime | None = None) -> PartitionMaintenanceResult:
+        """Split the default partition, create coming months and expire old ones.
+
+        Each partition is its own transaction.
+        """
+        current = month_start((now or datetime.now(UTC)).date())
+        result = PartitionMaintenanceResult(created=[], rows_moved=0, detached=[], dropped=[])
+        for month in sorted(row[0] for row in db.execute(DEFAULT_MONTHS)):
+            self._attach(db, month, result)
+        existing = set(self.months(db))
+        for offset in range(settings.metric_partition_months_ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                self._attach(db, month, result)
+        if settings.metric_partition_retention_months > 0:
+            cutoff = add_months(current, -settings.metric_partition_retention_months)
+            for month in self.months(db):
+                if month >= cutoff:
+                    break
+                self._detach(db, month, result)
+        return result
+
+    def _attach(self, db: Session, month: date, result: PartitionMaintenanceResult) -> None:
+        """Create the partition of ``month``, moving its rows out of the default one.
+
+        A table of that name left detached by retention is not replaced, so rows
+        imported again for its month stay in the default partition.
+        """
+        name = partition_name(month)
+        start, end = f"'{month}'", f"'{add_months(month, 1)}'"
+        db.execute(LOCK_MAINTENANCE)
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            db.commit()
+            return
+        # Until the partition is attached, rows of its month still route to the default.
+        db.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE"))
+        db.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"))
+        moved = db.execute(
+            text(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE measured_at >= {start} AND measured_at < {end}
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """
+            )
+        ).rowcount
+        # Proves the range to ATTACH, which would otherwise scan the new partition.
+        db.execute(
+            text(
+                f"ALTER TABLE {name} ADD CONSTRAINT {name}_range "
+                f"CHECK (measured_at >= {start} AND measured_at < {end})"
+            )
+        )
+        db.execute(
+            text(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})"
+            )
+        )
+        db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range"))
+        db.commit()
+        result.created.append(name)
+        result.rows_moved += moved
+
+    def _detach(self, db: Session, month: date, result: PartitionMaintenanceResult) -> None:
+        name = partition_name(month)
+        db.execute(LOCK_MAINTENANCE)
+        db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        result.detached.append(name)
+        if settings.metric_partition_retention_drop:
+            db.execute(text(f"DROP TABLE {name}"))
+            result.dropped.append(name)
+        db.commit()
+
+    def maintain_configured(self) -> PartitionMaintenanceResult:
+        with SessionLocal() as db:
+            return self.maintain(db)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                result = await run_in_threadpool(self.maintain_configured)
+            except Exception:
+                logger.exception("Partition maintenance failed")
+            else:
+                if result.created or result.detached:
+                    logger.info(
+                        "Created partitions %s (%d rows moved), detached %s, dropped %s",
+                        result.created,
+                        result.rows_moved,
+                        result.detached,
+                        result.dropped,
+                    )
+            await asyncio.sleep(settings.metric_partition_maintenance_seconds)
+
+
+metric_partitions = MetricPartitions()
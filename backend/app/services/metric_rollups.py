@@ -0,0 +1,100 @@
+"""Hourly, daily and weekly statistics of health metrics, kept by the database.
+
+Statement triggers on ``health_metrics`` (see the add_metric_rollups
+migration) fold every write into ``health_metric_rollups``: manual entries,
+edits and deletes, imports of every kind and webhooks alike, in the same
+transaction as the write. Each bucket row holds the sample count, sum, sum
+of squares, min and max, so a summary over a year of daily buckets reads a
+few hundred rows whatever the number of samples behind them.
+
+Inserted rows are added to their buckets. Updated and deleted rows are taken
+out again; when one held a bucket's min or max, that extreme is recomputed
+from the bucket's rows. Rows rolled up by the retention policy count for
+their ``sample_count`` samples, in the buckets of their midpoint. Compaction
+writes with the triggers off (``SKIP_ROLLUPS``) and then rebuilds the buckets
+it touched, so a compacted day moves to the hour of its midpoint. Partitions
+detached for retention leave the totals as they are: their rows stay counted.
+
+``rebuild`` recomputes the rollups from ``health_metrics``, for backfills::
+
+    python -m app.services.metric_rollups [--owner OWNER]
+"""
+
+import argparse
+import math
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models import MetricRollup
+from app.schemas import MetricSummary, RollupPeriod
+from app.services.base import to_db_timestamp
+
+# Makes the triggers ignore the rest of the transaction's writes to health_metrics.
+SKIP_ROLLUPS = text("SET LOCAL health_buddy.skip_rollups = 'on'")
+REBUILD = text("SELECT health_metric_rollups_rebuild(:owner)")
+
+
+class MetricRollupService:
+    def summary(
+        self,
+        db: Session,
+        owner: str,
+        metric_type: str,
+        period: RollupPeriod = "day",
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[MetricSummary]:
+        """Statistics per ``period`` of the buckets starting in [since, until), oldest first."""
+        query = select(MetricRollup).where(
+            MetricRollup.owner == owner,
+            MetricRollup.metric_type == metric_type,
+            MetricRollup.period == period,
+        )
+        if since:
+            query = query.where(MetricRollup.bucket_start >= to_db_timestamp(since))
+        if until:
+            query = query.where(MetricRollup.bucket_start < to_db_timestamp(until))
+        return [self._summary(rollup) for rollup in db.scalars(query.order_by("bucket_start"))]
+
+    def rebuild(self, db: Session, owner: str | None = None) -> int:
+        """Recompute the rollups of ``owner`` (everyone by default); returns the rows written.
+
+        Rollups of rows no longer in ``health_metrics``, such as those of
+        detached partitions, are lost.
+        """
+        written = db.execute(REBUILD, {"owner": owner}).scalar_one()
+        db.commit()
+        return written
+
+    def _summary(self, rollup: MetricRollup) -> MetricSummary:
+        mean = rollup.value_sum / rollup.sample_count
+        variance = rollup.sum_squares / rollup.sample_count - mean * mean
+        return MetricSummary(
+            bucket_start=rollup.bucket_start,
+            sample_count=rollup.sample_count,
+            total=round(rollup.value_sum, 2),
+            mean=round(mean, 2),
+            min=rollup.value_min,
+            max=rollup.value_max,
+            # Float error can leave a constant bucket's variance slightly negative.
+            stddev=round(math.sqrt(max(variance, 0.0)), 2),
+        )
+
+
+metric_rollup_service = MetricRollupService()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild health_metric_rollups.")
+    parser.add_argument("--owner", help="only this owner's rollups (default: everyone's)")
+    args = parser.parse_args()
+    with SessionLocal() as db:
+        written = metric_rollup_service.rebuild(db, args.owner)
+    print(f"Wrote {written} rollup rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Chart series of a metric, downsampled in the database session's stream.
+
+A range with more rows than the chart has points is cut into ``points // 2``
+equal time buckets, and each bucket keeps its lowest and its highest sample,
+in time order. Unlike averaging, min/max bucketing keeps every spike a chart
+that wide can draw. Rows are read through a server-side cursor in chunks of
+``CHUNK_ROWS`` and folded into per-bucket extremes with NumPy, so memory
+follows the number of points rather than the number of rows. Rolled-up rows
+contribute their ``value_min`` and ``value_max``.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import HealthMetric
+from app.schemas import SeriesPoint
+from app.services.base import to_db_timestamp
+
+# Rows fetched from the server-side cursor at a time.
+CHUNK_ROWS = 10_000
+
+
+def _microseconds(timestamps: list[datetime]) -> np.ndarray:
+    return np.array(timestamps, dtype="datetime64[us]").astype(np.int64)
+
+
+class MetricSeriesService:
+    def series(
+        self,
+        db: Session,
+        owner: str,
+        metric_type: str,
+        points: int,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[SeriesPoint]:
+        """At most ``points`` (>= 2) points of ``metric_type`` in [since, until), oldest first."""
+        filters = [HealthMetric.owner == owner, HealthMetric.metric_type == metric_type]
+        if since:
+            filters.append(HealthMetric.measured_at >= to_db_timestamp(since))
+        if until:
+            filters.append(HealthMetric.measured_at < to_db_timestamp(until))
+
+        count, first, last = db.execute(
+            select(
+                func.count(), func.min(HealthMetric.measured_at), func.max(HealthMetric.measured_at)
+            ).where(*filters)
+        ).one()
+        if count <= points:
+            rows = db.execute(
+                select(HealthMetric.measured_at, HealthMetric.value)
+                .where(*filters)
+                .order_by(HealthMetric.measured_at)
+            )
+            return [SeriesPoint(measured_at=at, value=value) for at, value in rows]
+
+        # Buckets span the requested range, so charts of the same range line up.
+        start = to_db_timestamp(since) if since else first
+        end = to_db_timestamp(until) if until else last + timedelta(microseconds=1)
+        return self._min_max(db, filters, points // 2, start, end)
+
+    def _min_max(
+        self, db: Session, filters: list, buckets: int, start: datetime, end: datetime
+    ) -> list[SeriesPoint]:
+        origin = int(_microseconds([start])[0])
+        span = int(_microseconds([end])[0]) - origin
+        lows = np.full(buckets, np.inf)
+        highs = np.full(buckets, -np.inf)
+        low_at = np.zeros(buckets, dtype=np.int64)
+        high_at = np.zeros(buckets, dtype=np.int64)
+
+        result = db.execute(
+            select(
+                HealthMetric.measured_at,
+                func.coalesce(HealthMetric.value_min, HealthMetric.value),
+                func.coalesce(HealthMetric.value_max, HealthMetric.value),
+            ).where(*filters),
+            execution_options={"yield_per": CHUNK_ROWS},
+        )
+        for chunk in result.partitions():
+            timestamps, chunk_lows, chunk_highs = zip(*chunk, strict=True)
+            at = _microseconds(timestamps)
+            low = np.array(chunk_lows, dtype=np.float64)
+            high = np.array(chunk_highs, dtype=np.float64)
+            bucket = np.minimum((at - origin) * buckets // span, buckets - 1)
+            np.minimum.at(lows, bucket, low)
+            np.maximum.at(highs, bucket, high)
+            # Timestamps of the samples that hold the extremes now (ties: any of them).
+            holds = low == lows[bucket]
+            low_at[bucket[holds]] = at[holds]
+            holds = high == highs[bucket]
+            high_at[bucket[holds]] = at[holds]
+
+        filled = np.isfinite(lows)
+        at = np.concatenate((low_at[filled], high_at[filled]))
+        values = np.concatenate((lows[filled], highs[filled]))
+        order = np.lexsort((values, at))
+        at, values = at[order], values[order]
+        # A bucket whose extremes are one sample gives one point.
+        keep = np.concatenate(([True], (at[1:] != at[:-1]) | (values[1:] != values[:-1])))
+        return [
+            SeriesPoint(measured_at=measured_at, value=value)
+            for measured_at, value in zip(
+                at[keep].astype("datetime64[us]").tolist(), values[keep].tolist(), strict=True
+            )
+        ]
+
+
+metric_series_service = MetricSeriesService()
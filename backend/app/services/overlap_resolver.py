@@ -0,0 +1,209 @@
+"""Resolve overlapping cumulative Records written by several devices.
+
+An iPhone and an Apple Watch both count steps, so an export holds two
+overlapping series of ``StepCount`` Records and summing them double-counts
+every step taken while wearing the watch. ``OverlapResolver`` keeps, for every
+stretch of time, only the Records of the source ranked first by
+``settings.import_source_priority``: a lower-ranked Record fully covered by
+higher-ranked ones is dropped and a partly covered one keeps the share of its
+value for the time nobody ranked above it was counting, as Apple Health does
+when it shows a day's total.
+
+Records are resolved per metric type and day (wall time read as UTC, as
+everywhere else in imports). Exports list a type's Records roughly by date, so
+a day is resolved once Records ``OPEN_DAYS`` days later arrive and only a few
+days of intervals are ever held.
+"""
+
+import logging
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import NamedTuple
+
+from app.services.metric_batch import epoch_us
+from app.services.retention import SUM_METRICS
+
+logger = logging.getLogger(__name__)
+
+# A day is resolved once a Record this many days later has been read.
+OPEN_DAYS = 2
+
+Fields = tuple[str, float, str, datetime]
+
+
+class Interval(NamedTuple):
+    """A cumulative Record waiting to be resolved: its span in wall microseconds."""
+
+    rank: tuple[int, str]
+    start: int
+    end: int
+    fields: Fields
+
+
+def _covered_before(starts: list[int], ends: list[int], before: list[int], at: int) -> int:
+    """Microseconds of the disjoint sorted intervals that lie before ``at``."""
+    i = bisect_right(starts, at) - 1
+    if i < 0:
+        return 0
+    return before[i] + min(at, ends[i]) - starts[i]
+
+
+def resolve_overlaps(intervals: Iterable[Interval]) -> Iterator[tuple[Fields, bool]]:
+    """Resolve one metric type's Records of one day, by start time.
+
+    Yields the fields of each Record kept, with its value reduced to the share
+    of its span no higher-ranked source covers, and whether it was reduced.
+    Records of the same source never resolve against each other.
+
+    Sources are swept rank by rank: each Record is measured against the union
+    of the ranks above it (two binary searches over its running lengths), then
+    the rank is merged into that union. Each sweep is linear after the sort, so
+    a day costs O(n log n) for the handful of sources an export has.
+    """
+    # Union of the higher ranks as disjoint sorted intervals, with the covered
+    # length before each one; instants only higher-ranked points were taken at.
+    starts: list[int] = []
+    ends: list[int] = []
+    before: list[int] = []
+    points: set[int] = set()
+    kept: list[tuple[int, tuple[int, str], Fields, bool]] = []
+    for _, group in groupby(sorted(intervals), key=itemgetter(0)):
+        ranked = list(group)
+        for interval in ranked:
+            span = interval.end - interval.start
+            if span <= 0:
+                at = interval.start
+                if at in points or _covered_before(starts, ends, before, at + 1) > (
+                    _covered_before(starts, ends, before, at)
+                ):
+                    continue
+                kept.append((at, interval.rank, interval.fields, False))
+                continue
+            covered = _covered_before(starts, ends, before, interval.end) - _covered_before(
+                starts, ends, before, interval.start
+            )
+            if covered >= span:
+                continue
+            fields = interval.fields
+            if covered:
+                metric_type, value, unit, measured_at = fields
+                fields = (metric_type, round(value * (span - covered) / span, 2), unit, measured_at)
+            kept.append((interval.start, interval.rank, fields, bool(covered)))
+
+        union: list[tuple[int, int]] = []
+        for start, end in sorted([*zip(starts, ends, strict=True)] + [i[1:3] for i in ranked]):
+            if end <= start:
+                points.add(start)
+            elif union and start <= union[-1][1]:
+                union[-1] = (union[-1][0], max(union[-1][1], end))
+            else:
+                union.append((start, end))
+        starts = [start for start, _ in union]
+        ends = [end for _, end in union]
+        before = []
+        total = 0
+        for start, end in union:
+            before.append(total)
+            total += end - start
+
+    kept.sort(key=itemgetter(0, 1))
+    for _, _, fields, reduced in kept:
+        yield fields, reduced
+
+
+class OverlapResolver:
+    """Holds the cumulative Records of the days still open and resolves each closed day.
+
+    Sources are ranked by the first of ``priority`` (case-insensitive
+    substrings of ``sourceName``) they contain; sources matching none come
+    after all that do, in name order.
+
+    A parse of one byte range of an export sets ``hold_first``: its first day
+    may continue in the range before, so it stays open with the last ones and
+    ``held`` hands them to the parent to ``merge`` with the other ranges.
+    """
+
+    def __init__(
+        self,
+        priority: Sequence[str] = (),
+        metric_types: Iterable[str] = SUM_METRICS,
+        hold_first: bool = False,
+    ):
+        self.metric_types = frozenset(metric_types)
+        self._priority = [pattern.casefold() for pattern in priority]
+        self._ranks: dict[str, tuple[int, str]] = {}
+        self._hold_first = hold_first
+        self._days: dict[tuple[str, date], list[Interval]] = {}
+        self._latest: dict[str, date] = {}
+        self._first: dict[str, date] = {}
+        self._resolved: set[tuple[str, date]] = set()
+        self.dropped = 0
+        self.reduced = 0
+
+    def rank(self, source_name: str) -> tuple[int, str]:
+        rank = self._ranks.get(source_name)
+        if rank is None:
+            name = source_name.casefold()
+            position = next(
+                (i for i, pattern in enumerate(self._priority) if pattern in name),
+                len(self._priority),
+            )
+            rank = self._ranks[source_name] = (position, source_name)
+        return rank
+
+    def add(self, fields: Fields, end: datetime | None, source_name: str) -> list[Fields]:
+        """Hold a Record spanning from its timestamp to ``end``; returns the days it closes."""
+        metric_type, _, _, measured_at = fields
+        start = measured_at.replace(tzinfo=None)
+        stop = start if end is None else max(start, end.replace(tzinfo=None))
+        day = start.date()
+        key = (metric_type, day)
+        if key in self._resolved:
+            logger.debug("Resolving a late %s Record for %s on its own", metric_type, day)
+        self._days.setdefault(key, []).append(
+            Interval(self.rank(source_name), epoch_us(start), epoch_us(stop), fields)
+        )
+        self._first.setdefault(metric_type, day)
+        latest = self._latest.get(metric_type)
+        if latest is not None and day <= latest:
+            return []
+        self._latest[metric_type] = day
+        cutoff = day - timedelta(days=OPEN_DAYS - 1)
+        return self._resolve(
+            k for k in self._days if k[0] == metric_type and k[1] < cutoff and not self._held(k)
+        )
+
+    def close(self) -> list[Fields]:
+        """Resolve every day still open."""
+        return self._resolve(list(self._days))
+
+    def held(self) -> list[Interval]:
+        """The Records of the days still open, for ``merge`` into another resolver."""
+        held = [interval for intervals in self._days.values() for interval in intervals]
+        self._days.clear()
+        return held
+
+    def merge(self, intervals: Iterable[Interval]) -> None:
+        """Hold Records another resolver (e.g. a shard's) left open."""
+        for interval in intervals:
+            key = (interval.fields[0], interval.fields[3].replace(tzinfo=None).date())
+            self._days.setdefault(key, []).append(interval)
+
+    def _held(self, key: tuple[str, date]) -> bool:
+        return self._hold_first and self._first.get(key[0]) == key[1]
+
+    def _resolve(self, keys: Iterable[tuple[str, date]]) -> list[Fields]:
+        resolved: list[Fields] = []
+        for key in sorted(keys, key=itemgetter(1)):
+            intervals = self._days.pop(key)
+            self._resolved.add(key)
+            kept = 0
+            for fields, reduced in resolve_overlaps(intervals):
+                resolved.append(fields)
+                kept += 1
+                self.reduced += reduced
+            self.dropped += len(intervals) - kept
+        return resolved
@@ -0,0 +1,382 @@
+"""Parse Apple Health exports and other uploaded files in worker processes.
+
+Parsing is CPU-bound, so running it in the API process starves the event loop
+even from a thread. Workers read the export from disk and stream rows back as
+columnar ``MetricBatch``es, which pickle as a few flat buffers. The queue is
+bounded, so a parser never runs far ahead of the database. Files of other
+sources (CSV, FIT) are read the same way by their ``SourceAdapter``.
+
+A plain export.xml can also be split into byte ranges parsed side by side, one
+per worker. Each worker sends its bucket statistics and the cumulative and
+sleep Records of the days it could not resolve on its own when it finishes,
+and the parent merges them, so aggregated values match a single-process parse.
+"""
+
+import mmap
+import multiprocessing
+import re
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from itertools import chain, pairwise
+from multiprocessing.managers import SyncManager
+from pathlib import Path
+from queue import Empty, Full
+from typing import IO, Any
+
+from defusedxml import DefusedXmlException
+
+from app.core.config import settings
+from app.services.apple_health_parser import RollupAggregator, apple_health_parser
+from app.services.metric_batch import MetricBatch
+from app.services.overlap_resolver import OverlapResolver
+from app.services.record_filter import RecordFilter
+from app.services.retention import RetentionPolicy
+from app.services.sleep_nights import SleepNights
+from app.services.source_adapters import SOURCE_ADAPTERS, AppleHealthExportAdapter
+
+ByteRange = tuple[int, int]
+
+QUEUE_POLL_SECONDS = 0.5
+SHARD_READ_SIZE = 16 * 1024
+
+ROOT_START = b"<HealthData"
+ROOT_END = b"</HealthData>"
+RECORD_START = re.compile(rb"<Record[\s/>]")
+CORRELATION_START = b"<Correlation"
+CORRELATION_END = b"</Correlation>"
+
+
+class ExportParseError(ValueError):
+    """An export could not be read; carries only a message so it pickles safely."""
+
+
+def iter_export(
+    path: Path,
+    owner: str,
+    policy: RetentionPolicy,
+    now: datetime | None = None,
+    record_filter: RecordFilter | None = None,
+) -> Iterator[MetricBatch]:
+    """Parse an export.xml or export.zip on disk in the current process."""
+    adapter = AppleHealthExportAdapter(record_filter)
+    with _open_export(path) as source:
+        try:
+            yield from adapter.iter_batches(
+                source, owner, policy, now or datetime.now(UTC), settings.import_batch_size
+            )
+        except (ET.ParseError, DefusedXmlException, zipfile.BadZipFile, zlib.error) as e:
+            raise ExportParseError(f"Failed to parse XML: {e}") from e
+
+
+def iter_source(
+    path: Path,
+    source: str,
+    owner: str,
+    policy: RetentionPolicy,
+    now: datetime | None = None,
+) -> Iterator[MetricBatch]:
+    """Parse a file on disk with the adapter named ``source``, in the current process."""
+    adapter = SOURCE_ADAPTERS[source]
+    with adapter.open(path) as stream:
+        try:
+            yield from adapter.iter_batches(
+                stream, owner, policy, now or datetime.now(UTC), settings.import_batch_size
+            )
+        except ValueError as e:
+            raise ExportParseError(f"Failed to parse {adapter.file_kind}: {e}") from e
+
+
+def split_export(data: bytes | mmap.mmap, shards: int) -> list[ByteRange]:
+    """Split an export.xml into byte ranges that each hold whole top-level elements.
+
+    The first range starts right after the root start tag and every other range
+    at a ``<Record`` that is not nested in a ``<Correlation>``, so each range
+    parses on its own once wrapped in a root element.
+    """
+    root = data.find(ROOT_START)
+    end = data.rfind(ROOT_END)
+    if root < 0 or end < 0:
+        raise ExportParseError("Failed to parse XML: no HealthData root element")
+    start = data.find(b">", root) + 1
+
+    bounds = [start]
+    for i in range(1, shards):
+        target = start + (end - start) * i // shards
+        bounds.append(_record_boundary(data, max(bounds[-1], target), end))
+    bounds.append(end)
+    return [(a, b) for a, b in pairwise(bounds) if a < b]
+
+
+def _record_boundary(data: bytes | mmap.mmap, pos: int, end: int) -> int:
+    """Offset of the first top-level ``<Record`` at or after ``pos``, else ``end``."""
+    while match := RECORD_START.search(data, pos, end):
+        at = match.start()
+        if data.rfind(CORRELATION_START, 0, at) <= data.rfind(CORRELATION_END, 0, at):
+            return at
+        # Inside a Correlation: its Records belong with it, so look past its end.
+        pos = data.find(CORRELATION_END, at, end)
+        if pos < 0:
+            break
+    return end
+
+
+class _ShardReader:
+    """File-like view of one byte range of an export, wrapped in a root element."""
+
+    def __init__(self, data: mmap.mmap, start: int, end: int):
+        self._chunks = chain(
+            (ROOT_START + b">",),
+            (data[i : min(i + SHARD_READ_SIZE, end)] for i in range(start, end, SHARD_READ_SIZE)),
+            (ROOT_END,),
+        )
+
+    def read(self, size: int = -1) -> bytes:
+        return next(self._chunks, b"")
+
+
+@contextmanager
+def _open_export(path: Path, byte_range: ByteRange | None = None) -> Iterator[IO[bytes]]:
+    with path.open("rb") as raw:
+        if byte_range:
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield _ShardReader(data, *byte_range)  # type: ignore[misc]
+            return
+        try:
+            source = apple_health_parser.open_export_zip(raw) if path.suffix == ".zip" else raw
+        except (zipfile.BadZipFile, ValueError) as e:
+            raise ExportParseError(f"Invalid export archive: {e}") from e
+        with source:
+            yield source
+
+
+def _parse_worker(
+    path: Path,
+    byte_range: ByteRange | None,
+    owner: str,
+    policy: RetentionPolicy,
+    record_filter: RecordFilter | None,
+    now: datetime,
+    batch_size: int,
+    queue: Any,
+    cancelled: Any,
+) -> None:
+    """Send batches of rows, then this worker's bucket statistics and open days."""
+    aggregator = RollupAggregator(policy, now)
+    # A shard's first day may have begun in the shard before it.
+    resolver = OverlapResolver(settings.import_source_priority, hold_first=byte_range is not None)
+    sleep = SleepNights.within(record_filter, hold_first=byte_range is not None)
+    with _open_export(path, byte_range) as source:
+        batches = apple_health_parser.iter_record_batches(
+            source, owner, now, aggregator, batch_size, record_filter, resolver, sleep
+        )
+        try:
+            for batch in batches:
+                if not _put(queue, batch, cancelled):
+                    return
+        except (ET.ParseError, DefusedXmlException, zipfile.BadZipFile, zlib.error) as e:
+            raise ExportParseError(f"Failed to parse XML: {e}") from e
+    _put(queue, (aggregator.stats, resolver.held(), sleep.held()), cancelled)
+
+
+def _source_worker(
+    path: Path,
+    source: str,
+    owner: str,
+    policy: RetentionPolicy,
+    now: datetime,
+    queue: Any,
+    cancelled: Any,
+) -> None:
+    """Send batches of rows, then None."""
+    for batch in iter_source(path, source, owner, policy, now):
+        if not _put(queue, batch, cancelled):
+            return
+    _put(queue, None, cancelled)
+
+
+def _put(queue: Any, message: Any, cancelled: Any) -> bool:
+    while not cancelled.is_set():
+        try:
+            queue.put(message, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except Full:
+            continue
+    return False
+
+
+class ParsePool:
+    """Process pool shared by all imports in this API process."""
+
+    def __init__(self) -> None:
+        self._executor: ProcessPoolExecutor | None = None
+        self._manager: SyncManager | None = None
+        self._lock = threading.Lock()
+
+    def iter_export(
+        self,
+        path: Path,
+        owner: str,
+        policy: RetentionPolicy,
+        now: datetime | None = None,
+        shards: int | None = None,
+        record_filter: RecordFilter | None = None,
+    ) -> Iterator[MetricBatch]:
+        """Parse an export in worker processes, yielding batches as they arrive.
+
+        Records that ``policy`` rolls up are yielded last, as bucket rows. Only
+        Records that ``record_filter`` keeps are parsed (default: all mapped types).
+
+        A plain .xml file is split into ``shards`` byte ranges
+        (``settings.import_parse_shards`` by default) parsed in parallel. Rows
+        from different shards arrive interleaved, so the stream order (and the
+        winner among repeated keys in different shards) is only deterministic
+        with a single shard. Falls back to parsing in the calling thread when
+        ``settings.import_parse_workers`` is 0.
+
+        Raises:
+            ExportParseError: If the file is not a valid export.
+        """
+        if settings.import_parse_workers <= 0:
+            yield from iter_export(path, owner, policy, now, record_filter)
+            return
+
+        shards = settings.import_parse_shards if shards is None else shards
+        # Every shard must see the same reference time for cutoffs to line up.
+        now = now or datetime.now(UTC)
+        ranges: list[ByteRange | None] = [None]
+        if shards > 1 and path.suffix == ".xml":
+            ranges = list(self._split(path, shards))
+
+        executor, manager = self._start()
+        queue = manager.Queue(maxsize=settings.import_parse_queue_batches)
+        cancelled = manager.Event()
+        futures = [
+            executor.submit(
+                _parse_worker,
+                path,
+                byte_range,
+                owner,
+                policy,
+                record_filter,
+                now,
+                settings.import_batch_size,
+                queue,
+                cancelled,
+            )
+            for byte_range in ranges
+        ]
+        aggregator = RollupAggregator(policy, now)
+        resolver = OverlapResolver(settings.import_source_priority)
+        sleep = SleepNights.within(record_filter)
+        try:
+            finished = 0
+            while finished < len(futures):
+                message = self._next_message(queue, futures)
+                if isinstance(message, tuple):
+                    stats, held, nights = message
+                    aggregator.merge(stats)
+                    resolver.merge(held)
+                    sleep.merge(nights)
+                    finished += 1
+                    continue
+                yield message
+            for future in futures:
+                future.result()
+        finally:
+            # Stops the workers if the consumer gave up early.
+            cancelled.set()
+        # Days the workers left open, joined across shard boundaries.
+        yield from apple_health_parser.batch_fields(
+            chain(resolver.close(), sleep.close()), owner, aggregator, settings.import_batch_size
+        )
+        yield from aggregator.batches(owner)
+
+    def iter_source(
+        self,
+        path: Path,
+        source: str,
+        owner: str,
+        policy: RetentionPolicy,
+        now: datetime | None = None,
+    ) -> Iterator[MetricBatch]:
+        """Parse a file with the adapter named ``source`` in a worker process.
+
+        Batches arrive as the worker parses; rows ``policy`` rolls up come last.
+
+        Raises:
+            ExportParseError: If the file is not of the adapter's kind.
+        """
+        if settings.import_parse_workers <= 0:
+            yield from iter_source(path, source, owner, policy, now)
+            return
+
+        executor, manager = self._start()
+        queue = manager.Queue(maxsize=settings.import_parse_queue_batches)
+        cancelled = manager.Event()
+        future = executor.submit(
+            _source_worker,
+            path,
+            source,
+            owner,
+            policy,
+            now or datetime.now(UTC),
+            queue,
+            cancelled,
+        )
+        try:
+            while (message := self._next_message(queue, [future])) is not None:
+                yield message
+            future.result()
+        finally:
+            cancelled.set()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if manager:
+            manager.shutdown()
+
+    def _start(self) -> tuple[ProcessPoolExecutor, SyncManager]:
+        with self._lock:
+            if self._executor is None or self._manager is None:
+                # Spawned workers do not inherit the parent's database connections or threads.
+                context = multiprocessing.get_context("spawn")
+                self._manager = context.Manager()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.import_parse_workers, mp_context=context
+                )
+            return self._executor, self._manager
+
+    def _split(self, path: Path, shards: int) -> list[ByteRange]:
+        if not path.stat().st_size:
+            raise ExportParseError("Failed to parse XML: file is empty")
+        with path.open("rb") as raw, mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return split_export(data, shards)
+
+    def _next_message(self, queue: Any, futures: list[Future]) -> Any:
+        while True:
+            try:
+                return queue.get(timeout=QUEUE_POLL_SECONDS)
+            except Empty:
+                for future in futures:
+                    if future.done() and future.exception():
+                        raise future.exception()  # type: ignore[misc]
+                if all(future.done() for future in futures):
+                    try:
+                        return queue.get_nowait()
+                    except Empty:
+                        raise RuntimeError(
+                            "Parse worker exited before finishing the export"
+                        ) from None
+
+
+parse_pool = ParsePool()
@@ -0,0 +1,240 @@
+"""Drop unwanted Records from an Apple Health export before they are parsed.
+
+Most of an export is record types the importer does not map (active energy,
+distance, stand hours, audio exposure). Building an element for each only to
+throw it away dominates parse time, so ``FilteredExport`` checks the ``type``
+and ``startDate`` attributes in the raw bytes and cuts whole ``<Record>``
+elements out of the stream before the XML parser sees them.
+"""
+
+import json
+import re
+from collections.abc import Iterable, Mapping
+from datetime import UTC, datetime
+from typing import IO
+
+# ElementTree's iterparse reads 16 KiB at a time; much larger reads parse slower.
+READ_SIZE = 16 * 1024
+
+RECORD_END = b"</Record>"
+# A start tag up to its closing ">", for the rare tag with a ">" in a quoted value.
+RECORD_TAG = re.compile(rb"""<Record[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>""")
+NAME_END = b" \t\r\n/>"
+QUOTE = ord('"')
+EQUALS = ord("=")
+SLASH = ord("/")
+# Wall time of the start date; the offset is ignored, as everywhere else in imports.
+WALL_TIME = re.compile(rb"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _attribute(data: bytes, name: bytes, start: int, end: int) -> bytes | None:
+    """Raw value of a double-quoted attribute in the start tag at ``data[start:end]``."""
+    # Apple separates attributes with single spaces, but XML allows any whitespace.
+    for separator in (b" ", b"\n", b"\t", b"\r"):
+        at = data.find(separator + name + b'="', start, end)
+        if at >= 0:
+            at += len(name) + 3
+            return data[at : data.find(b'"', at, end)]
+    return None
+
+
+def _tag_end(data: bytes, start: int) -> int:
+    """Offset just past the start tag at ``start``, or 0 if it is not complete."""
+    end = data.find(b">", start) + 1
+    # A start tag normally ends in '"' followed by '>' or '/>'. Anything else may be
+    # a ">" inside a quoted value, so match the tag properly.
+    if end and not (
+        data[end - 2] == QUOTE and data[end - 3] != EQUALS or data[end - 3 : end] == b'"/>'
+    ):
+        match = RECORD_TAG.match(data, start)
+        end = match.end() if match else 0
+    return end
+
+
+def _wall_time(value: datetime) -> bytes:
+    """``value`` in the byte form of an export's start dates, as UTC wall time."""
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC)
+    return value.strftime(DATE_FORMAT).encode()
+
+
+class RecordFilter:
+    """Which Records of an export to parse: a set of record types and a date window.
+
+    ``since`` is inclusive and ``until`` exclusive, both compared to the wall
+    time of a Record's startDate read as UTC, to the second. Records whose
+    startDate has another shape are left for the parser to judge.
+    ``since_by_type`` moves ``since`` later for single record types.
+    """
+
+    __slots__ = (
+        "record_types",
+        "since",
+        "until",
+        "since_by_type",
+        "starts",
+        "_types",
+        "_since",
+        "_until",
+        "_since_by_type",
+    )
+
+    def __init__(
+        self,
+        record_types: Iterable[str],
+        since: datetime | None = None,
+        until: datetime | None = None,
+        since_by_type: Mapping[str, datetime] | None = None,
+    ):
+        self.record_types = frozenset(record_types)
+        self.since = since
+        self.until = until
+        self.since_by_type = dict(since_by_type or {})
+        self._types = frozenset(t.encode() for t in self.record_types)
+        self._since = _wall_time(since) if since else None
+        self._until = _wall_time(until) if until else None
+        if self._since and self._until and self._since >= self._until:
+            raise ValueError("since must be earlier than until")
+        self._since_by_type = {
+            record_type.encode(): max(_wall_time(value), self._since or b"")
+            for record_type, value in self.since_by_type.items()
+        }
+
+        # Record starts that need a closer look. Apple writes the type first, so
+        # group 1 marks a Record rejected by type alone and, without a date window,
+        # Records of a wanted type never leave the regex engine.
+        wanted = b"|".join(re.escape(t) for t in sorted(self._types))
+        if since or until or since_by_type:
+            pattern = rb'<Record(\s+type="(?!(?:%s)"))?' % wanted
+        else:
+            pattern = rb'<Record(?!\s+type="(?:%s)")(\s+type=")?' % wanted
+        self.starts = re.compile(pattern)
+
+    @classmethod
+    def from_json(cls, text: str) -> "RecordFilter":
+        data = json.loads(text)
+        return cls(
+            data["types"],
+            datetime.fromisoformat(data["since"]) if data.get("since") else None,
+            datetime.fromisoformat(data["until"]) if data.get("until") else None,
+            {
+                record_type: datetime.fromisoformat(value)
+                for record_type, value in data.get("since_by_type", {}).items()
+            },
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "types": sorted(self.record_types),
+                "since": self.since.isoformat() if self.since else None,
+                "until": self.until.isoformat() if self.until else None,
+                "since_by_type": {
+                    record_type: value.isoformat()
+                    for record_type, value in sorted(self.since_by_type.items())
+                },
+            }
+        )
+
+    def keeps(self, data: bytes, start: int = 0, end: int | None = None) -> bool:
+        """Whether the Record with the start tag at ``data[start:end]`` should be parsed."""
+        end = len(data) if end is None else end
+        record_type = _attribute(data, b"type", start, end)
+        if record_type not in self._types:
+            return False
+        since = self._since_by_type.get(record_type, self._since)
+        if since is None and self._until is None:
+            return True
+        date = _attribute(data, b"startDate", start, end)
+        if date is None or not WALL_TIME.match(date):
+            return True
+        date = date[:19]
+        if since is not None and date < since:
+            return False
+        return self._until is None or date < self._until
+
+    def __getstate__(self) -> tuple:
+        return self.record_types, self.since, self.until, self.since_by_type
+
+    def __setstate__(self, state: tuple) -> None:
+        self.__init__(*state)  # type: ignore[misc]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RecordFilter):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self) -> str:
+        return (
+            f"RecordFilter({sorted(self.record_types)!r}, {self.since!r}, {self.until!r}, "
+            f"{self.since_by_type!r})"
+        )
+
+
+class FilteredExport:
+    """File-like view of an export with the Records ``record_filter`` rejects cut out.
+
+    Everything else, including the Records it keeps, passes through byte for
+    byte. A Record cut short by the end of one read is held back until the next.
+    """
+
+    def __init__(self, source: IO[bytes], record_filter: RecordFilter):
+        self._source = source
+        self._filter = record_filter
+        self._pending = b""
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof:
+            chunk = self._source.read(READ_SIZE)
+            self._eof = not chunk
+            data = self._cut(self._pending + chunk)
+            if data:
+                return data
+        pending, self._pending = self._pending, b""
+        return pending
+
+    def _cut(self, data: bytes) -> bytes:
+        """Kept bytes of ``data``; an unfinished tail is left in ``_pending``.
+
+        Only the Records ``starts`` matches reach Python, and each costs a few
+        C-level scans; anything heavier costs about as much as the parse it saves.
+        """
+        record_filter = self._filter
+        kept = []
+        copied = 0
+        # A "<Record" split across reads may not match yet, so hold back its prefix.
+        hold = len(data) if self._eof else len(data) - len(RECORD_END)
+        for match in record_filter.starts.finditer(data):
+            start = match.start()
+            rejected = match[1] is not None
+            if not rejected:
+                name_end = data[match.end() : match.end() + 1]
+                if name_end and name_end not in NAME_END:
+                    # Another element whose name starts with "Record".
+                    continue
+            end = _tag_end(data, start)
+            if not end:
+                if not self._eof:
+                    hold = start
+                    break
+                # Malformed; let the parser report it.
+                continue
+            if not rejected and record_filter.keeps(data, start, end):
+                continue
+            if data[end - 2] != SLASH:
+                close = data.find(RECORD_END, end)
+                if close < 0:
+                    if not self._eof:
+                        hold = start
+                        break
+                    continue
+                end = close + len(RECORD_END)
+            kept.append(data[copied:start])
+            copied = end
+        hold = max(hold, copied)
+        kept.append(data[copied:hold])
+        self._pending = data[hold:]
+        return b"".join(kept)
@@ -0,0 +1,163 @@
+"""Decoding of compressed and MessagePack request bodies for the import webhooks.
+
+Phones post webhook payloads over cellular, so bodies may be sent with
+``Content-Encoding: gzip`` (or ``zstd`` when a Zstandard module is installed)
+and as MessagePack instead of JSON. Bodies are decompressed chunk by chunk as
+they are received, and a body that decompresses past the route's limit is
+refused before it is held whole.
+"""
+
+import json
+import zlib
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+import msgpack
+from starlette.requests import Request
+
+try:  # Python 3.14+
+    from compression import zstd as _zstd
+except ImportError:  # pragma: no cover - depends on the interpreter
+    _zstd = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+JSON_TYPES = frozenset(("application/json", ""))
+MSGPACK_TYPES = frozenset(
+    ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+)
+# Most bytes one decompress call may return, so a few KB of input cannot inflate to
+# gigabytes before the size limit is checked.
+OUTPUT_STEP = 1024 * 1024
+# The zstandard package has no output limit; feeding it input this small bounds each
+# call instead (a zstd block header of 3 bytes can stand for 128 KiB of output).
+ZSTANDARD_INPUT_STEP = 64
+
+
+class UnsupportedBodyError(ValueError):
+    """A body in a content encoding or type the webhooks do not accept."""
+
+
+class BodyTooLargeError(ValueError):
+    """A body that decompresses to more than the route accepts."""
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self._inflate = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while data:
+                yield self._inflate.decompress(data, OUTPUT_STEP)
+                data = self._inflate.unconsumed_tail
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip body: {e}") from e
+
+    def finish(self) -> bytes:
+        if not self._inflate.eof:
+            raise ValueError("Truncated gzip body")
+        return self._inflate.flush()
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        if _zstd is not None:
+            self._decompressor = _zstd.ZstdDecompressor()
+            self._errors: tuple[type[Exception], ...] = (_zstd.ZstdError,)
+        else:
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+            self._errors = (zstandard.ZstdError,)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        try:
+            if _zstd is None:
+                for start in range(0, len(data), ZSTANDARD_INPUT_STEP):
+                    yield self._decompressor.decompress(data[start : start + ZSTANDARD_INPUT_STEP])
+                return
+            yield self._decompressor.decompress(data, OUTPUT_STEP)
+            while not self._decompressor.needs_input and not self._decompressor.eof:
+                yield self._decompressor.decompress(b"", OUTPUT_STEP)
+        except self._errors as e:
+            raise ValueError(f"Invalid zstd body: {e}") from e
+
+    def finish(self) -> bytes:
+        if not self._decompressor.eof:
+            raise ValueError("Truncated zstd body")
+        return b""
+
+
+def content_encodings() -> list[str]:
+    """Content encodings the webhooks accept besides identity."""
+    encodings = ["gzip"]
+    if _zstd is not None or zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def _decompressor(encoding: str) -> _Gzip | _Zstd | None:
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return _Gzip()
+    if encoding == "zstd" and "zstd" in content_encodings():
+        return _Zstd()
+    raise UnsupportedBodyError(
+        f"Unsupported Content-Encoding {encoding!r}; use one of "
+        + ", ".join(["identity", *content_encodings()])
+    )
+
+
+async def iter_body(request: Request, max_bytes: int) -> AsyncIterator[bytes]:
+    """The request body as received, decompressed as it arrives.
+
+    Raises:
+        UnsupportedBodyError: For an unknown ``Content-Encoding``.
+        BodyTooLargeError: Once the decompressed body passes ``max_bytes``.
+        ValueError: If the compressed body is corrupt or truncated.
+    """
+    decompressor = _decompressor(request.headers.get("content-encoding", ""))
+    received = 0
+    async for chunk in request.stream():
+        pieces = [chunk] if decompressor is None else decompressor.decompress(chunk)
+        for piece in pieces:
+            received += len(piece)
+            if received > max_bytes:
+                raise BodyTooLargeError(f"Body is larger than {max_bytes} bytes decompressed")
+            yield piece
+    if decompressor is not None:
+        yield decompressor.finish()
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """The whole decompressed request body, refused past ``max_bytes``."""
+    return b"".join([chunk async for chunk in iter_body(request, max_bytes)])
+
+
+def media_type(request: Request) -> str:
+    return request.headers.get("content-type", "").partition(";")[0].strip().lower()
+
+
+def decode_payload(body: bytes, content_type: str) -> Any:
+    """A JSON or MessagePack body as Python objects.
+
+    Raises:
+        UnsupportedBodyError: For a content type other than JSON or MessagePack.
+        ValueError: If the body does not decode.
+    """
+    if content_type in MSGPACK_TYPES:
+        try:
+            return msgpack.unpackb(body)
+        except (msgpack.UnpackException, ValueError) as e:
+            raise ValueError(f"Invalid MessagePack body: {e}") from e
+    if content_type in JSON_TYPES or content_type.endswith("+json"):
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON body: {e}") from e
+    raise UnsupportedBodyError(
+        f"Unsupported Content-Type {content_type!r}; use application/json or application/msgpack"
+    )
@@ -0,0 +1,342 @@
+"""Retention policy for high-frequency metrics: raw recent rows, coarser buckets for older ones.
+
+A policy maps metric types to tiers such as "5-minute buckets after 7 days,
+hourly after 90, daily after 365". Each bucket is stored as one row timestamped
+at the bucket's midpoint (so a daily bucket sits at noon UTC) holding the mean,
+or the sum for ``SUM_METRICS``, plus the sample count, min and max.
+
+The policy is stored as JSON in ``app_config`` under ``RETENTION_POLICY_KEY``::
+
+    {"heart_rate": [{"after_days": 7, "bucket": "5m"},
+                    {"after_days": 90, "bucket": "1h"},
+                    {"after_days": 365, "bucket": "1d"}]}
+
+Imports apply it while parsing, and ``RetentionCompactor`` applies it to rows
+already stored. Metric types without tiers are kept raw, and manual entries are
+never compacted.
+"""
+
+import asyncio
+import json
+import logging
+import re
+from collections.abc import Iterable, Mapping
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import AppConfig
+from app.models.health_metric import UNIQUE_KEY_CONSTRAINT
+from app.schemas import CompactionResult
+from app.services.metric_rollups import SKIP_ROLLUPS
+
+logger = logging.getLogger(__name__)
+
+RETENTION_POLICY_KEY = "metric_retention_policy"
+
+# Metrics rolled up to daily values by the legacy ``aggregate_days`` setting.
+AGGREGATE_METRICS = {"heart_rate", "steps", "hrv", "respiratory_rate", "walking_heart_rate"}
+# Buckets of these hold the sum of their samples rather than the mean.
+SUM_METRICS = {"steps"}
+
+DAY_SECONDS = 86_400
+BUCKET_PATTERN = re.compile(r"(\d+)([smhd])")
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": DAY_SECONDS}
+
+
+class Tier(NamedTuple):
+    after_days: int
+    bucket_seconds: int
+
+
+def parse_bucket(bucket: str) -> int:
+    """Seconds in a bucket size such as "5m", "1h" or "1d"; must divide a day evenly."""
+    match = BUCKET_PATTERN.fullmatch(bucket)
+    if not match:
+        raise ValueError(f"Invalid bucket size {bucket!r}, expected e.g. '5m', '1h' or '1d'")
+    seconds = int(match[1]) * BUCKET_UNITS[match[2]]
+    if not seconds or DAY_SECONDS % seconds:
+        raise ValueError(f"Bucket size {bucket!r} must divide a day evenly")
+    return seconds
+
+
+def format_bucket(seconds: int) -> str:
+    for unit, size in sorted(BUCKET_UNITS.items(), key=lambda item: -item[1]):
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    raise ValueError(f"Invalid bucket size {seconds}s")
+
+
+class RetentionPolicy:
+    """Tiers per metric type, each coarser and older than the one before."""
+
+    def __init__(self, tiers: Mapping[str, Iterable[Tier]]):
+        self._tiers: dict[str, tuple[Tier, ...]] = {}
+        for metric_type, metric_tiers in tiers.items():
+            ordered = sorted(metric_tiers)
+            for tier in ordered:
+                if tier.after_days <= 0:
+                    raise ValueError(f"{metric_type}: after_days must be positive")
+            for newer, older in zip(ordered, ordered[1:]):
+                if older.after_days == newer.after_days or (
+                    older.bucket_seconds <= newer.bucket_seconds
+                ):
+                    raise ValueError(
+                        f"{metric_type}: each tier must be older and coarser than the last"
+                    )
+                # Midpoints of the coarser buckets then never land on a finer bucket's.
+                ratio, remainder = divmod(older.bucket_seconds, newer.bucket_seconds)
+                if remainder or ratio % 2:
+                    raise ValueError(
+                        f"{metric_type}: each bucket must be an even multiple of the last"
+                    )
+            if ordered:
+                # Oldest first, which is the order records are matched in.
+                self._tiers[metric_type] = tuple(reversed(ordered))
+
+    @classmethod
+    def daily(cls, aggregate_days: int) -> "RetentionPolicy":
+        """The legacy policy: daily values for ``AGGREGATE_METRICS`` (0 keeps all raw)."""
+        if aggregate_days <= 0:
+            return cls({})
+        return cls({metric: [Tier(aggregate_days, DAY_SECONDS)] for metric in AGGREGATE_METRICS})
+
+    @classmethod
+    def from_json(cls, value: str) -> "RetentionPolicy":
+        """Parse the ``app_config`` representation; raises ValueError if it is invalid."""
+        try:
+            data = json.loads(value)
+            return cls(
+                {
+                    metric_type: [
+                        Tier(int(tier["after_days"]), parse_bucket(tier["bucket"]))
+                        for tier in tiers
+                    ]
+                    for metric_type, tiers in data.items()
+                }
+            )
+        except (AttributeError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid retention policy: {e}") from e
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                metric_type: [
+                    {"after_days": tier.after_days, "bucket": format_bucket(tier.bucket_seconds)}
+                    for tier in reversed(tiers)
+                ]
+                for metric_type, tiers in self._tiers.items()
+            }
+        )
+
+    def tiers(self, metric_type: str) -> tuple[Tier, ...]:
+        """Tiers for ``metric_type``, oldest (and coarsest) first."""
+        return self._tiers.get(metric_type, ())
+
+    @property
+    def metric_types(self) -> list[str]:
+        return list(self._tiers)
+
+    def __bool__(self) -> bool:
+        return bool(self._tiers)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RetentionPolicy) and self._tiers == other._tiers
+
+    def __repr__(self) -> str:
+        return f"RetentionPolicy({self.to_json()})"
+
+
+def load_retention_policy(db: Session) -> RetentionPolicy | None:
+    """The policy stored in ``app_config``, or None if unset or invalid."""
+    value = db.scalars(select(AppConfig.value).where(AppConfig.key == RETENTION_POLICY_KEY)).first()
+    if value is None:
+        return None
+    try:
+        return RetentionPolicy.from_json(value)
+    except ValueError:
+        logger.exception("Ignoring invalid %s in app_config", RETENTION_POLICY_KEY)
+        return None
+
+
+def import_policy(db: Session, aggregate_days: int) -> RetentionPolicy:
+    """The policy an import applies: the configured one, else daily after ``aggregate_days``.
+
+    ``aggregate_days=0`` always keeps every record raw.
+    """
+    if aggregate_days <= 0:
+        return RetentionPolicy({})
+    configured = load_retention_policy(db)
+    return configured if configured is not None else RetentionPolicy.daily(aggregate_days)
+
+
+def _midpoint(bucket: str) -> str:
+    return (
+        f"timestamp '1970-01-01' + ({bucket} * :step_us + :step_us / 2) * interval '1 microsecond'"
+    )
+
+
+# Moves non-manual rows older than the cutoff and finer than the tier into a
+# temporary table of per-bucket statistics. Buckets whose timestamp is taken by
+# a manual entry are left alone rather than overwriting it.
+ROLL_UP_ROWS = text(
+    f"""
+    WITH src AS (
+        SELECT id, measured_at, owner,
+               floor(extract(epoch FROM measured_at) * 1000000 / :step_us)::bigint AS bucket
+        FROM health_metrics
+        WHERE metric_type = :metric_type
+          AND measured_at < :cutoff
+          AND resolution_seconds < :seconds
+          AND source <> 'manual'
+    ), open_buckets AS (
+        SELECT DISTINCT owner, bucket FROM src
+        WHERE NOT EXISTS (
+            SELECT 1 FROM health_metrics m
+            WHERE m.owner = src.owner
+              AND m.metric_type = :metric_type
+              AND m.source = 'manual'
+              AND m.measured_at = {_midpoint("src.bucket")}
+        )
+    ), removed AS (
+        DELETE FROM health_metrics h
+        USING src JOIN open_buckets USING (owner, bucket)
+        WHERE h.id = src.id AND h.measured_at = src.measured_at
+        RETURNING src.owner, src.bucket, h.unit, h.source, h.value,
+                  coalesce(h.sample_count, 1) AS n, h.value_min, h.value_max
+    ), rolled AS (
+        INSERT INTO health_metrics_rollup
+        SELECT owner, bucket, max(unit), max(source), sum(n), sum(value), sum(value * n),
+               min(coalesce(value_min, value)), max(coalesce(value_max, value))
+        FROM removed
+        GROUP BY owner, bucket
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM removed), (SELECT count(*) FROM rolled)
+    """
+)
+
+CREATE_ROLLUP_TABLE = text(
+    """
+    CREATE TEMP TABLE health_metrics_rollup (
+        owner varchar(100) NOT NULL,
+        bucket bigint NOT NULL,
+        unit varchar(50) NOT NULL,
+        source varchar(50) NOT NULL,
+        sample_count bigint NOT NULL,
+        total double precision NOT NULL,
+        weighted double precision NOT NULL,
+        value_min double precision NOT NULL,
+        value_max double precision NOT NULL
+    ) ON COMMIT DROP
+    """
+)
+
+# Writes one row per bucket. A bucket row of the same size left by an earlier
+# run absorbs the new samples.
+WRITE_ROLLUP_ROWS = text(
+    f"""
+    INSERT INTO health_metrics (
+        owner, metric_type, measured_at, value, unit, notes, is_active, source,
+        resolution_seconds, sample_count, value_min, value_max, created_at, updated_at
+    )
+    SELECT owner, :metric_type, {_midpoint("bucket")},
+           round((CASE WHEN :is_sum THEN total ELSE weighted / sample_count END)::numeric, 2),
+           unit, NULL, true, source, :seconds, sample_count, value_min, value_max,
+           now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+    FROM health_metrics_rollup
+    ON CONFLICT ON CONSTRAINT {UNIQUE_KEY_CONSTRAINT} DO UPDATE
+    SET value = round((
+            CASE WHEN :is_sum THEN health_metrics.value + EXCLUDED.value
+            ELSE (health_metrics.value * coalesce(health_metrics.sample_count, 1)
+                  + EXCLUDED.value * EXCLUDED.sample_count)
+                 / (coalesce(health_metrics.sample_count, 1) + EXCLUDED.sample_count)
+            END)::numeric, 2),
+        sample_count = coalesce(health_metrics.sample_count, 1) + EXCLUDED.sample_count,
+        value_min = least(coalesce(health_metrics.value_min, health_metrics.value),
+                          EXCLUDED.value_min),
+        value_max = greatest(coalesce(health_metrics.value_max, health_metrics.value),
+                             EXCLUDED.value_max),
+        updated_at = EXCLUDED.updated_at
+    WHERE health_metrics.source <> 'manual'
+    """
+)
+
+
+# Compaction writes with the rollup triggers off. Rebuilding the buckets it
+# touched from the rows now stored keeps them in step with what later edits and
+# deletes of the bucket rows take out of them.
+REBUILD_TOUCHED_ROLLUPS = text(
+    """
+    SELECT health_metric_rollups_rebuild_range(
+        owner, :metric_type,
+        timestamp '1970-01-01' + min(bucket) * :step_us * interval '1 microsecond',
+        timestamp '1970-01-01' + (max(bucket) + 1) * :step_us * interval '1 microsecond'
+    )
+    FROM health_metrics_rollup
+    GROUP BY owner
+    """
+)
+
+
+class RetentionCompactor:
+    """Rolls rows already in ``health_metrics`` up to the configured policy."""
+
+    def compact(
+        self, db: Session, policy: RetentionPolicy | None = None, now: datetime | None = None
+    ) -> CompactionResult:
+        """Apply ``policy`` (the configured one by default) to stored rows.
+
+        Each metric type and tier is one transaction, oldest tier first, so rows
+        skip straight to the coarsest bucket they qualify for.
+        """
+        policy = policy if policy is not None else load_retention_policy(db)
+        result = CompactionResult(rows_compacted=0, buckets_written=0)
+        if not policy:
+            return result
+        now_utc = (now or datetime.now(UTC)).astimezone(UTC).replace(tzinfo=None)
+        for metric_type in policy.metric_types:
+            for tier in policy.tiers(metric_type):
+                params = {
+                    "metric_type": metric_type,
+                    "cutoff": now_utc - timedelta(days=tier.after_days),
+                    "seconds": tier.bucket_seconds,
+                    "step_us": tier.bucket_seconds * 1_000_000,
+                    "is_sum": metric_type in SUM_METRICS,
+                }
+                db.execute(SKIP_ROLLUPS)
+                db.execute(CREATE_ROLLUP_TABLE)
+                removed, buckets = db.execute(ROLL_UP_ROWS, params).one()
+                db.execute(WRITE_ROLLUP_ROWS, params)
+                db.execute(REBUILD_TOUCHED_ROLLUPS, params)
+                db.commit()
+                result.rows_compacted += removed
+                result.buckets_written += buckets
+        return result
+
+    def compact_configured(self) -> CompactionResult:
+        with SessionLocal() as db:
+            return self.compact(db)
+
+    async def run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.retention_compaction_seconds)
+            try:
+                result = await run_in_threadpool(self.compact_configured)
+            except Exception:
+                logger.exception("Retention compaction failed")
+            else:
+                if result.rows_compacted:
+                    logger.info(
+                        "Compacted %d rows into %d buckets",
+                        result.rows_compacted,
+                        result.buckets_written,
+                    )
+
+
+retention_compactor = RetentionCompactor()
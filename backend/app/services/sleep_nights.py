@@ -0,0 +1,173 @@
+"""Nightly sleep totals from the sleep analysis Records of an export.
+
+Apple Health stores sleep as ``HKCategoryTypeIdentifierSleepAnalysis``
+Records: one per stretch of a stage (InBed, Awake, Core, Deep, REM, or plain
+Asleep from older watches and third-party apps), from every source that
+tracks sleep, so the stretches of one night overlap. ``SleepNights`` merges
+each night's stretches per stage with a sort-and-sweep and yields the hours
+asleep (``sleep_hours``, the union of every asleep stage) and per stage.
+
+A night runs from noon to noon and is dated by the day it ends on (wall time
+read as UTC, as everywhere else in imports); its rows are timestamped at the
+midnight that starts that day. Exports list Records by date, so a night is
+merged once Records ``OPEN_NIGHTS`` nights later arrive and only its stretches
+are ever held.
+"""
+
+from collections.abc import Iterable, Iterator
+from datetime import UTC, date, datetime, timedelta
+from typing import NamedTuple
+
+from app.services.metric_batch import epoch_us
+from app.services.record_filter import RecordFilter
+
+SLEEP_ANALYSIS = "HKCategoryTypeIdentifierSleepAnalysis"
+STAGE_PREFIX = "HKCategoryValueSleepAnalysis"
+
+# Metric type per stage; stages without one only count toward sleep_hours.
+STAGE_METRICS: dict[str, str | None] = {
+    "InBed": "sleep_in_bed_hours",
+    "Awake": "sleep_awake_hours",
+    "AsleepCore": "sleep_core_hours",
+    "AsleepDeep": "sleep_deep_hours",
+    "AsleepREM": "sleep_rem_hours",
+    "Asleep": None,
+    "AsleepUnspecified": None,
+}
+ASLEEP_STAGES = frozenset(stage for stage in STAGE_METRICS if stage.startswith("Asleep"))
+
+# A night is merged once a Record this many nights later has been read.
+OPEN_NIGHTS = 2
+NIGHT_OFFSET = timedelta(hours=12)
+US_PER_HOUR = 3_600_000_000
+
+Fields = tuple[str, float, str, datetime]
+
+
+class Stretch(NamedTuple):
+    """One stage Record of a night: its span in wall microseconds."""
+
+    night: date
+    stage: str
+    start: int
+    end: int
+
+
+def merged_length(spans: Iterable[tuple[int, int]]) -> int:
+    """Length of the union of ``spans``: sorted by start, then swept once."""
+    total = 0
+    current_start = current_end = None
+    for start, end in sorted(spans):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        elif end > current_end:
+            current_end = end
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def _wall_time(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+class SleepNights:
+    """Holds the stage stretches of the nights still open and totals each closed night.
+
+    Nights not entirely inside the ``since``/``until`` window (e.g. an
+    incremental import that re-reads from some midnight) are dropped rather
+    than totalled from part of their Records.
+
+    A parse of one byte range of an export sets ``hold_first``: its first
+    night may continue in the range before, so it stays open with the last
+    ones and ``held`` hands them to the parent to ``merge``.
+    """
+
+    def __init__(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        hold_first: bool = False,
+    ):
+        self._since = _wall_time(since)
+        self._until = _wall_time(until)
+        self._hold_first = hold_first
+        self._nights: dict[date, list[Stretch]] = {}
+        self._latest: date | None = None
+        self._first: date | None = None
+
+    @classmethod
+    def within(cls, record_filter: RecordFilter | None, hold_first: bool = False) -> "SleepNights":
+        """Nights for the window ``record_filter`` reads sleep Records in."""
+        if record_filter is None:
+            return cls(hold_first=hold_first)
+        since = record_filter.since
+        by_type = record_filter.since_by_type.get(SLEEP_ANALYSIS)
+        if by_type is not None and (since is None or _wall_time(by_type) > _wall_time(since)):
+            since = by_type
+        return cls(since, record_filter.until, hold_first)
+
+    def add(self, stage: str, start: datetime, end: datetime) -> list[Fields]:
+        """Hold a stretch of ``stage`` (without the prefix); returns the nights it closes."""
+        start = start.replace(tzinfo=None)
+        end = max(start, end.replace(tzinfo=None))
+        night = (start + NIGHT_OFFSET).date()
+        self._nights.setdefault(night, []).append(
+            Stretch(night, stage, epoch_us(start), epoch_us(end))
+        )
+        if self._first is None:
+            self._first = night
+        if self._latest is not None and night <= self._latest:
+            return []
+        self._latest = night
+        cutoff = night - timedelta(days=OPEN_NIGHTS - 1)
+        return self._total(
+            n for n in self._nights if n < cutoff and not (self._hold_first and n == self._first)
+        )
+
+    def close(self) -> list[Fields]:
+        """Total every night still open."""
+        return self._total(list(self._nights))
+
+    def held(self) -> list[Stretch]:
+        """The stretches of the nights still open, for ``merge`` into another instance."""
+        held = [stretch for stretches in self._nights.values() for stretch in stretches]
+        self._nights.clear()
+        return held
+
+    def merge(self, stretches: Iterable[Stretch]) -> None:
+        for stretch in stretches:
+            self._nights.setdefault(stretch.night, []).append(stretch)
+
+    def _total(self, nights: Iterable[date]) -> list[Fields]:
+        totals: list[Fields] = []
+        for night in sorted(nights):
+            stretches = self._nights.pop(night)
+            if self._complete(night):
+                totals.extend(self._night_totals(night, stretches))
+        return totals
+
+    def _complete(self, night: date) -> bool:
+        day = datetime(night.year, night.month, night.day)
+        if self._since is not None and day - NIGHT_OFFSET < self._since:
+            return False
+        return self._until is None or day + NIGHT_OFFSET <= self._until
+
+    def _night_totals(self, night: date, stretches: list[Stretch]) -> Iterator[Fields]:
+        by_stage: dict[str, list[tuple[int, int]]] = {}
+        for stretch in stretches:
+            by_stage.setdefault(stretch.stage, []).append((stretch.start, stretch.end))
+        measured_at = datetime(night.year, night.month, night.day, tzinfo=UTC)
+        asleep = merged_length(span for stage in ASLEEP_STAGES for span in by_stage.get(stage, ()))
+        if asleep:
+            yield "sleep_hours", round(asleep / US_PER_HOUR, 2), "hours", measured_at
+        for stage, metric_type in STAGE_METRICS.items():
+            if metric_type is None or stage not in by_stage:
+                continue
+            hours = round(merged_length(by_stage[stage]) / US_PER_HOUR, 2)
+            if hours:
+                yield metric_type, hours, "hours", measured_at
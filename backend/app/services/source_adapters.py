@@ -0,0 +1,177 @@
+"""Source adapters: one import pipeline for every kind of upload.
+
+An adapter turns one kind of file (an Apple Health export, a CSV, a Garmin
+FIT file) into a stream of readings normalized to the importer's metric types
+and units. Everything after that is shared: ``SourceAdapter.iter_batches``
+rolls old readings up to the retention policy and batches the rest, and the
+importer deduplicates and bulk writes the batches. Adapters read their file
+as a stream, so memory follows the batch size for every source.
+"""
+
+import csv
+import io
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import AbstractContextManager
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Literal
+
+from app.schemas.health_metric import SourceType
+from app.services.apple_health_parser import RollupAggregator, apple_health_parser
+from app.services.fit_reader import iter_messages
+from app.services.metric_batch import MetricBatch
+from app.services.overlap_resolver import Fields
+from app.services.record_filter import RecordFilter
+from app.services.retention import RetentionPolicy
+
+# Sources uploaded through the generic import route; Apple Health has its own.
+UploadSource = Literal["csv", "fit"]
+
+CSV_COLUMNS = ("metric_type", "value", "measured_at")
+
+# Metric type, unit and scale of the FIT fields imported, by message and field number.
+FIT_FIELDS: dict[int, dict[int, tuple[str, str, int]]] = {
+    # record: a reading during an activity.
+    20: {3: ("heart_rate", "bpm", 1)},
+    # weight_scale
+    30: {0: ("weight", "kg", 100), 1: ("body_fat_percentage", "%", 100)},
+    # blood_pressure
+    51: {0: ("blood_pressure_systolic", "mmHg", 1), 1: ("blood_pressure_diastolic", "mmHg", 1)},
+    # monitoring: all-day readings.
+    55: {27: ("heart_rate", "bpm", 1)},
+}
+FIT_WANTED = {number: frozenset(fields) for number, fields in FIT_FIELDS.items()}
+
+
+class SourceAdapter(ABC):
+    """Reads one kind of file into normalized readings.
+
+    Subclasses set ``name`` (as used in routes), the ``source`` their rows are
+    stored with, the file ``suffixes`` they accept, and implement ``iter_fields``.
+    """
+
+    name: str
+    source: SourceType
+    suffixes: tuple[str, ...]
+    # How upload errors refer to the file, e.g. "a CSV file".
+    file_kind: str
+
+    def open(self, path: Path) -> AbstractContextManager[IO[bytes]]:
+        return path.open("rb")
+
+    @abstractmethod
+    def iter_fields(self, stream: IO[bytes], now: datetime) -> Iterator[Fields]:
+        """Metric type, value, unit and time of each reading in ``stream``.
+
+        Readings later than ``now`` or of types that are not imported are skipped.
+
+        Raises:
+            ValueError: If the file is not of this adapter's kind.
+        """
+
+    def iter_batches(
+        self,
+        stream: IO[bytes],
+        owner: str,
+        policy: RetentionPolicy,
+        now: datetime,
+        batch_size: int = 5000,
+    ) -> Iterator[MetricBatch]:
+        """Batches of the readings ``policy`` keeps raw, then one per bucket size."""
+        aggregator = RollupAggregator(policy, now)
+        yield from apple_health_parser.batch_fields(
+            self.iter_fields(stream, now), owner, aggregator, batch_size, self.source
+        )
+        yield from aggregator.batches(owner, self.source)
+
+
+class AppleHealthExportAdapter(SourceAdapter):
+    """An Apple Health export.xml, parsed with ``record_filter``."""
+
+    name = "apple-health"
+    source = "apple_health_import"
+    suffixes = (".xml", ".zip")
+    file_kind = "an XML or ZIP file"
+
+    def __init__(self, record_filter: RecordFilter | None = None):
+        self.record_filter = record_filter
+
+    def iter_fields(self, stream: IO[bytes], now: datetime) -> Iterator[Fields]:
+        return apple_health_parser.iter_export_fields(stream, now, self.record_filter)
+
+
+class CsvAdapter(SourceAdapter):
+    """A CSV with a header row and one reading per line.
+
+    Needs ``metric_type``, ``value`` and ``measured_at`` (ISO 8601) columns;
+    an optional ``unit`` column gives the value's unit, which is converted as
+    for Apple Health imports (the stored unit is assumed without it). Other
+    columns are ignored, as are rows that do not parse.
+    """
+
+    name = "csv"
+    source = "csv_import"
+    suffixes = (".csv",)
+    file_kind = "a CSV file"
+
+    def iter_fields(self, stream: IO[bytes], now: datetime) -> Iterator[Fields]:
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if header is None:
+                raise ValueError("CSV file is empty")
+            columns = {name.strip().lower(): i for i, name in enumerate(header)}
+            missing = [name for name in CSV_COLUMNS if name not in columns]
+            if missing:
+                raise ValueError(f"CSV file has no {', '.join(missing)} column")
+            type_at, value_at, time_at = (columns[name] for name in CSV_COLUMNS)
+            unit_at = columns.get("unit")
+            for row in reader:
+                try:
+                    value = float(row[value_at])
+                    measured_at = datetime.fromisoformat(
+                        row[time_at].strip().replace("Z", "+00:00")
+                    )
+                    unit = row[unit_at].strip() if unit_at is not None else ""
+                    metric_type = row[type_at].strip()
+                except (IndexError, ValueError):
+                    continue
+                fields = apple_health_parser.metric_fields(
+                    metric_type, value, unit or None, measured_at, now
+                )
+                if fields:
+                    yield fields
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV: {e}") from e
+        finally:
+            # Leave ``stream`` open for its owner.
+            text.detach()
+
+
+class FitAdapter(SourceAdapter):
+    """A Garmin FIT activity, monitoring or health file (see ``FIT_FIELDS``)."""
+
+    name = "fit"
+    source = "fit_import"
+    suffixes = (".fit",)
+    file_kind = "a FIT file"
+
+    def iter_fields(self, stream: IO[bytes], now: datetime) -> Iterator[Fields]:
+        for message in iter_messages(stream, FIT_WANTED):
+            if message.timestamp is None:
+                continue
+            mapping = FIT_FIELDS[message.number]
+            for field, value in message.fields.items():
+                metric_type, unit, scale = mapping[field]
+                fields = apple_health_parser.metric_fields(
+                    metric_type, round(value / scale, 2), unit, message.timestamp, now
+                )
+                if fields:
+                    yield fields
+
+
+SOURCE_ADAPTERS: dict[str, SourceAdapter] = {
+    adapter.name: adapter for adapter in (AppleHealthExportAdapter(), CsvAdapter(), FitAdapter())
+}
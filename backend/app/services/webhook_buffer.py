@@ -0,0 +1,177 @@
+"""In-process buffer that acknowledges webhook payloads and writes them in bulk.
+
+Health Auto Export posts a handful of rows per device every few minutes, and a
+transaction per post keeps the database busy with tiny commits. The webhook
+puts each validated batch here and answers 202; a writer task flushes what has
+piled up every ``settings.webhook_flush_ms`` or once
+``settings.webhook_flush_rows`` rows wait, one coalesced batch per owner with
+repeated keys collapsed (the latest payload wins).
+
+Acknowledged rows are only in memory until the next flush. A flush that cannot
+reach the database, including the final one at shutdown, pickles its batches
+into ``settings.webhook_spool_dir``; spooled files are written on the next
+successful flush and whenever a process starts, by whichever worker locks them
+first.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import pickle
+import threading
+from uuid import uuid4
+
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.schemas import ImportResult
+from app.services.crud import health_metric
+from app.services.metric_batch import MetricBatch
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = ".spool"
+
+
+class BufferFullError(Exception):
+    """The buffer already holds ``settings.webhook_buffer_max_rows`` unwritten rows."""
+
+
+class WebhookBuffer:
+    """Queues webhook batches per owner and writes them in coalesced flushes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: dict[str, list[MetricBatch]] = {}
+        # Rows accepted and not yet written or spooled, including a running flush.
+        self._rows = 0
+        self._spooled = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def put(self, batch: MetricBatch) -> ImportResult:
+        """Accept a batch for writing; returns what was accepted.
+
+        ``imported`` counts the valid rows queued and ``errors`` the rows
+        dropped by validation; nothing is skipped until the rows are written.
+
+        Raises:
+            BufferFullError: If the rows would not fit; the batch is not kept.
+            ValueError: If the owner is invalid.
+        """
+        valid, invalid = batch.validated()
+        with self._lock:
+            # An empty buffer takes any batch, so oversized payloads still get through.
+            if self._rows and self._rows + len(valid) > settings.webhook_buffer_max_rows:
+                raise BufferFullError("Webhook buffer is full, retry later")
+            if valid:
+                self._pending.setdefault(valid.owner, []).append(valid)
+                self._rows += len(valid)
+            due = self._rows >= settings.webhook_flush_rows
+        if due and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return ImportResult(
+            total_records=len(batch), imported=len(valid), skipped=0, errors=invalid
+        )
+
+    def flush(self) -> ImportResult:
+        """Write everything pending now; batches the database refuses are spooled."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                rows = sum(len(batch) for batches in pending.values() for batch in batches)
+            result = ImportResult(total_records=0, imported=0, skipped=0, errors=0)
+            try:
+                if pending:
+                    batches = [MetricBatch.concat(b).deduplicated()[0] for b in pending.values()]
+                    result.skipped += rows - sum(len(batch) for batch in batches)
+                    if self._write(batches, result):
+                        if self._spooled:
+                            self._spooled = False
+                            self.replay_spool()
+                    else:
+                        self._spool(batches)
+            finally:
+                with self._lock:
+                    self._rows -= rows
+            return result
+
+    def replay_spool(self) -> int:
+        """Write spooled batches not locked by another worker; returns the rows written."""
+        written = 0
+        if not settings.webhook_spool_dir.is_dir():
+            return written
+        for path in sorted(settings.webhook_spool_dir.glob(f"*{SPOOL_SUFFIX}")):
+            try:
+                spool = path.open("rb")
+            except FileNotFoundError:
+                continue
+            with spool:
+                try:
+                    fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                if not path.exists():
+                    # Written and removed by another worker while this one waited.
+                    continue
+                batches: list[MetricBatch] = pickle.load(spool)
+                result = ImportResult(total_records=0, imported=0, skipped=0, errors=0)
+                if not self._write(batches, result):
+                    self._spooled = True
+                    break
+                path.unlink()
+                written += result.total_records
+        return written
+
+    async def run_forever(self) -> None:
+        """Flush on a timer or when enough rows wait; write earlier spools first."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await run_in_threadpool(self.replay_spool)
+        interval = settings.webhook_flush_ms / 1000
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), interval)
+            self._wake.clear()
+            try:
+                await run_in_threadpool(self.flush)
+            except Exception:
+                logger.exception("Webhook buffer flush failed")
+
+    def shutdown(self) -> None:
+        """Write or spool whatever is still pending."""
+        self._loop = self._wake = None
+        self.flush()
+
+    def _write(self, batches: list[MetricBatch], result: ImportResult) -> bool:
+        try:
+            with SessionLocal() as db:
+                health_metric.bulk_upsert_batches(db, batches, result=result)
+        except SQLAlchemyError:
+            logger.exception("Could not write %d buffered webhook batches", len(batches))
+            return False
+        return True
+
+    def _spool(self, batches: list[MetricBatch]) -> None:
+        settings.webhook_spool_dir.mkdir(parents=True, exist_ok=True)
+        name = uuid4().hex
+        partial = settings.webhook_spool_dir / f".{name}.tmp"
+        with partial.open("wb") as out:
+            pickle.dump(batches, out, pickle.HIGHEST_PROTOCOL)
+            out.flush()
+            os.fsync(out.fileno())
+        partial.replace(settings.webhook_spool_dir / f"{name}{SPOOL_SUFFIX}")
+        self._spooled = True
+        logger.warning("Spooled %d webhook batches to %s", len(batches), name)
+
+
+webhook_buffer = WebhookBuffer()
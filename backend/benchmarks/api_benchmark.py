@@ -0,0 +1,229 @@
+"""Compare sync and async API routes under many concurrent clients.
+
+Run from ``backend/`` with ``DATABASE_URL`` pointing at a migrated database::
+
+    python -m benchmarks.api_benchmark --clients 200 --requests 5000
+
+Each variant is served by uvicorn in its own process: the app as it is, whose
+hot routes are ``async def`` on asyncpg, and ``legacy`` below, the same routes
+as the sync ``def`` they were, run in Starlette's threadpool on psycopg2. The
+clients hit the metric listing, the dashboard, the downsampled chart series
+over every seeded row and the webhook (``--samples`` readings per payload, with
+a fresh ``Idempotency-Key`` each time) for a throwaway owner whose rows are
+deleted afterwards. The series and the webhook payloads are big enough to show
+whether their CPU work stalls the event loop.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+import httpx
+from fastapi import Depends, FastAPI, Header, Query, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, get_db
+from app.main import lifespan
+from app.models import HealthGoal, LabResult, Medication, Supplement
+from app.schemas import (
+    HealthAutoExportPayload,
+    HealthMetricCreate,
+    HealthMetricResponse,
+    SeriesPoint,
+)
+from app.services.apple_health_parser import apple_health_parser
+from app.services.crud import health_metric
+from app.services.import_digests import idempotency_digest, import_digest_service
+from app.services.metric_series import metric_series_service
+from app.services.webhook_buffer import webhook_buffer
+
+legacy = FastAPI(lifespan=lifespan)
+
+
+@legacy.get("/api/health-metrics", response_model=list[HealthMetricResponse])
+def list_health_metrics(
+    owner: str, metric_type: str, limit: int = 100, db: Session = Depends(get_db)
+):
+    return health_metric.get_multi(db, limit=limit, owner=owner, metric_type=metric_type)
+
+
+@legacy.get("/api/health-metrics/series", response_model=list[SeriesPoint])
+def health_metric_series(
+    owner: str, metric_type: str, points: int = 600, db: Session = Depends(get_db)
+):
+    return metric_series_service.series(db, owner, metric_type, points)
+
+
+@legacy.get("/api/dashboard/")
+def get_dashboard_data(owner: str, db: Session = Depends(get_db)):
+    return {
+        "latest_metrics": health_metric.latest(db, owner, limit=10),
+        "active_medications": db.query(Medication)
+        .filter(Medication.owner == owner, Medication.is_active.is_(True))
+        .all(),
+        "active_supplements": db.query(Supplement)
+        .filter(Supplement.owner == owner, Supplement.is_active.is_(True))
+        .all(),
+        "recent_lab_results": db.query(LabResult)
+        .filter(LabResult.owner == owner)
+        .order_by(LabResult.test_date.desc())
+        .limit(3)
+        .all(),
+        "active_goals": db.query(HealthGoal)
+        .filter(HealthGoal.owner == owner, HealthGoal.is_completed.is_(False))
+        .all(),
+    }
+
+
+@legacy.post("/api/import/apple-health/webhook", status_code=202)
+def import_apple_health_webhook(
+    response: Response,
+    payload: HealthAutoExportPayload,
+    owner: str = Query(...),
+    idempotency_key: str = Header(...),
+    db: Session = Depends(get_db),
+):
+    digest = idempotency_digest("apple-health/webhook", idempotency_key)
+    if replayed := import_digest_service.get(db, owner, digest):
+        return replayed
+    batch = apple_health_parser.parse_auto_export_batch({"data": payload.data}, owner)
+    result = webhook_buffer.put(batch)
+    import_digest_service.record(db, owner, digest, result)
+    return result
+
+
+def seed(owner: str, rows: int) -> None:
+    start = datetime.now(UTC) - timedelta(minutes=rows)
+    metrics = [
+        HealthMetricCreate(
+            metric_type="heart_rate",
+            value=60 + i % 40,
+            unit="bpm",
+            measured_at=start + timedelta(minutes=i),
+            owner=owner,
+            source="apple_health_import",
+        )
+        for i in range(rows)
+    ]
+    with SessionLocal() as db:
+        health_metric.bulk_upsert(db, metrics)
+
+
+def clean_up(owner: str) -> None:
+    with SessionLocal() as db:
+        for table in ("health_metrics", "import_digests"):
+            db.execute(text(f"DELETE FROM {table} WHERE owner = :owner"), {"owner": owner})
+        db.commit()
+
+
+def webhook_body(i: int, samples: int) -> dict:
+    start = datetime(2024, 1, 1, tzinfo=UTC) + timedelta(seconds=i * samples)
+    readings = [
+        {"date": (start + timedelta(seconds=s)).isoformat(), "qty": 60 + s % 40}
+        for s in range(samples)
+    ]
+    # Steps, so the readings the first variant posts don't grow the series the second one reads.
+    return {"data": {"metrics": [{"name": "step_count", "units": "count", "data": readings}]}}
+
+
+async def load(
+    base_url: str, owner: str, clients: int, requests: int, samples: int
+) -> dict[str, float]:
+    """Successful requests per second per route, ``requests`` of each from ``clients`` at once."""
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        calls = {
+            "list": lambda i: client.get(
+                "/api/health-metrics",
+                params={"owner": owner, "metric_type": "heart_rate", "limit": 50},
+            ),
+            "dashboard": lambda i: client.get("/api/dashboard/", params={"owner": owner}),
+            "series": lambda i: client.get(
+                "/api/health-metrics/series",
+                params={"owner": owner, "metric_type": "heart_rate", "points": 600},
+            ),
+            "webhook": lambda i: client.post(
+                "/api/import/apple-health/webhook",
+                params={"owner": owner},
+                headers={"Idempotency-Key": uuid.uuid4().hex},
+                json=webhook_body(i, samples),
+            ),
+        }
+        rates = {}
+        for name, call in calls.items():
+            pending = iter(range(requests))
+            failed = 0
+
+            async def client_loop() -> None:
+                nonlocal failed
+                for i in pending:
+                    try:
+                        response = await call(i)
+                    except httpx.TimeoutException:
+                        failed += 1
+                    else:
+                        failed += response.is_error
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop() for _ in range(clients)))
+            rates[name] = (requests - failed) / (time.perf_counter() - started)
+            if failed:
+                print(f"  {name}: {failed} requests failed or timed out", file=sys.stderr)
+        return rates
+
+
+async def wait_until_up(base_url: str, server: subprocess.Popen) -> None:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while server.poll() is None:
+            try:
+                await client.get("/api/health-metrics", params={"owner": "-", "metric_type": "-"})
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("server exited during startup")
+
+
+def run(name: str, target: str, port: int, args: argparse.Namespace, owner: str) -> None:
+    base_url = f"http://127.0.0.1:{port}"
+    # Clients idle between routes; the server must not close their connections meanwhile.
+    command = [sys.executable, "-m", "uvicorn", target, "--port", str(port)]
+    command += ["--log-level", "critical", "--timeout-keep-alive", "300"]
+    server = subprocess.Popen(command, env=os.environ)
+    try:
+        asyncio.run(wait_until_up(base_url, server))
+        rates = asyncio.run(load(base_url, owner, args.clients, args.requests, args.samples))
+    finally:
+        server.terminate()
+        server.wait()
+    print(
+        f"{name:<7} {args.clients:>4} clients  "
+        + "  ".join(f"{route} {rate:>7.0f} req/s" for route, rate in rates.items())
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    owner = f"bench-{uuid.uuid4().hex[:8]}"
+    seed(owner, args.rows)
+    try:
+        run("sync", "benchmarks.api_benchmark:legacy", args.port, args, owner)
+        run("async", "app.main:app", args.port + 1, args, owner)
+    finally:
+        clean_up(owner)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare health metric import write paths against a local Postgres.
+
+Run from ``backend/`` with ``DATABASE_URL`` pointing at a migrated database::
+
+    python -m benchmarks.import_benchmark --rows 200000
+
+Synthetic heart rate samples for a throwaway owner are written through the
+legacy row-by-row ORM loop (on a small sample, it is very slow), the batched
+``ON CONFLICT`` upsert and the ``COPY`` staging merge. Each path runs twice: a
+cold insert and a re-import that updates every row. Rows are deleted afterwards.
+"""
+
+import argparse
+import time
+import uuid
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+
+from app.core.database import SessionLocal
+from app.models import HealthMetric
+from app.schemas import HealthMetricCreate, ImportResult
+from app.services.base import CRUDBase
+from app.services.crud import health_metric
+
+
+def synthetic_metrics(owner: str, rows: int) -> list[HealthMetricCreate]:
+    start = datetime(2020, 1, 1, tzinfo=UTC)
+    return [
+        HealthMetricCreate(
+            metric_type="heart_rate",
+            value=60 + i % 40,
+            unit="bpm",
+            measured_at=start + timedelta(minutes=i),
+            owner=owner,
+            source="apple_health_import",
+        )
+        for i in range(rows)
+    ]
+
+
+def orm_row_by_row(db, metrics: list[HealthMetricCreate]) -> ImportResult:
+    """The import loop as it was before bulk upserts: query, write, commit per row."""
+    crud = CRUDBase(HealthMetric)
+    for metric in metrics:
+        existing = (
+            db.query(HealthMetric)
+            .filter(
+                HealthMetric.owner == metric.owner,
+                HealthMetric.metric_type == metric.metric_type,
+                HealthMetric.measured_at == metric.measured_at,
+            )
+            .first()
+        )
+        if existing:
+            existing.value = metric.value
+            db.commit()
+        else:
+            crud.create(db=db, obj_in=metric)
+    return ImportResult(total_records=len(metrics), imported=len(metrics), skipped=0, errors=0)
+
+
+def run(name: str, rows: int, write: Callable[..., ImportResult]) -> None:
+    owner = f"bench-{uuid.uuid4().hex[:8]}"
+    metrics = synthetic_metrics(owner, rows)
+    db = SessionLocal()
+    try:
+        for label in ("insert", "update"):
+            started = time.perf_counter()
+            result = write(db, metrics)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:<14} {label:<7} {rows:>9} rows {elapsed:8.2f} s "
+                f"{rows / elapsed:>10.0f} rows/s  imported={result.imported}"
+            )
+    finally:
+        db.query(HealthMetric).filter(HealthMetric.owner == owner).delete()
+        db.commit()
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--orm-rows", type=int, default=5_000)
+    args = parser.parse_args()
+
+    run("orm-per-row", args.orm_rows, orm_row_by_row)
+    run(
+        "batched-upsert",
+        args.rows,
+        lambda db, m: health_metric.bulk_upsert(db, m, copy_threshold=0),
+    )
+    run(
+        "copy-merge",
+        args.rows,
+        lambda db, m: health_metric.bulk_upsert(db, m, copy_threshold=1),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+# TestClient runs each request in a new event loop, and a pooled asyncpg
+# connection only works in the loop that opened it.
+os.environ.setdefault("DATABASE_ASYNC_POOL_SIZE", "0")
+
+
+@pytest.fixture
+def unreachable_session():
+    """A session factory whose database refuses every connection, as during an outage."""
+    engine = create_engine("postgresql://postgres@127.0.0.1:1/healthbuddy", poolclass=NullPool)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
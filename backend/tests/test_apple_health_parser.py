@@ -1,8 +1,22 @@
 """Tests for Apple Health parser service."""
 
+import io
+import zipfile
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+
 import pytest
+from defusedxml import DefusedXmlException
 
+from app.core.config import settings
+from app.schemas import HealthMetricCreate
 from app.services.apple_health_parser import AppleHealthParser
+from app.services.health_metric_service import to_db_timestamp
+from app.services.metric_batch import MetricBatch
+from app.services.parse_pool import ExportParseError, iter_export, parse_pool, split_export
+from app.services.retention import RetentionPolicy
+
+DAILY = RetentionPolicy.daily(30)
 
 
 @pytest.fixture
@@ -10,6 +24,10 @@ def parser():
     return AppleHealthParser()
 
 
+def _unbatch(batches: Iterable[MetricBatch]) -> list[HealthMetricCreate]:
+    return [metric for batch in batches for metric in batch.to_models()]
+
+
 class TestParseXml:
     """Tests for XML parsing."""
 
@@ -119,6 +137,269 @@ class TestParseXml:
         assert len(metrics) == 0
 
 
+class TestIterXml:
+    """Tests for streaming XML parsing."""
+
+    def test_streams_from_file_object(self, parser: AppleHealthParser):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="70"
+                    unit="count/min"
+                    startDate="2024-01-15 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="75.5"
+                    unit="kg"
+                    startDate="2024-01-15 11:00:00 +0000" />
+        </HealthData>"""
+
+        metrics = parser.iter_xml(io.BytesIO(xml_content), "test_user", aggregate_days=0)
+
+        assert next(metrics).metric_type == "heart_rate"
+        assert next(metrics).metric_type == "weight"
+        assert next(metrics, None) is None
+
+    def test_matches_parse_xml_with_aggregation(self, parser: AppleHealthParser):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierStepCount"
+                    value="1000" unit="count" startDate="2020-03-01 08:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierStepCount"
+                    value="2500" unit="count" startDate="2020-03-01 18:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="60" unit="count/min" startDate="2020-03-01 08:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="81" unit="count/min" startDate="2020-03-01 09:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="75.5" unit="kg" startDate="2020-03-01 07:00:00 +0000" />
+        </HealthData>"""
+
+        streamed = list(parser.iter_xml(io.BytesIO(xml_content), "test_user"))
+        parsed = parser.parse_xml(xml_content, "test_user")
+
+        assert streamed == parsed
+        by_type = {m.metric_type: m for m in streamed}
+        assert by_type["steps"].value == 3500.0
+        assert by_type["heart_rate"].value == 70.5
+        assert by_type["weight"].value == 75.5
+
+    def test_includes_records_nested_in_correlations(self, parser: AppleHealthParser):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <!DOCTYPE HealthData [
+        <!ELEMENT HealthData (Record|Correlation)*>
+        ]>
+        <HealthData>
+            <Correlation type="HKCorrelationTypeIdentifierBloodPressure"
+                         startDate="2024-01-15 10:00:00 +0000">
+                <Record type="HKQuantityTypeIdentifierBloodPressureSystolic"
+                        value="120" unit="mmHg" startDate="2024-01-15 10:00:00 +0000" />
+                <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic"
+                        value="80" unit="mmHg" startDate="2024-01-15 10:00:00 +0000" />
+            </Correlation>
+        </HealthData>"""
+
+        metrics = list(parser.iter_xml(io.BytesIO(xml_content), "test_user", aggregate_days=0))
+
+        assert [m.metric_type for m in metrics] == [
+            "blood_pressure_systolic",
+            "blood_pressure_diastolic",
+        ]
+
+    def test_rejects_entity_expansion(self, parser: AppleHealthParser):
+        xml_content = b"""<?xml version="1.0"?>
+        <!DOCTYPE HealthData [<!ENTITY lol "lol">]>
+        <HealthData><Record type="&lol;" /></HealthData>"""
+
+        with pytest.raises(DefusedXmlException):
+            list(parser.iter_xml(io.BytesIO(xml_content), "test_user"))
+
+
+class TestOpenExportZip:
+    """Tests for reading export.xml out of export.zip."""
+
+    xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+    <HealthData>
+        <Record type="HKQuantityTypeIdentifierHeartRate"
+                value="72" unit="count/min" startDate="2024-01-15 10:00:00 +0000" />
+    </HealthData>"""
+
+    def _zip(self, members: dict[str, bytes]) -> io.BytesIO:
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        archive.seek(0)
+        return archive
+
+    def test_reads_export_member_only(self, parser: AppleHealthParser):
+        archive = self._zip(
+            {
+                "apple_health_export/export_cda.xml": b"<ClinicalDocument/>",
+                "apple_health_export/export.xml": self.xml_content,
+                "apple_health_export/workout-routes/route_2024-01-15.gpx": b"<gpx/>",
+            }
+        )
+
+        with parser.open_export_zip(archive) as source:
+            metrics = list(parser.iter_xml(source, "test_user", aggregate_days=0))
+
+        assert len(metrics) == 1
+        assert metrics[0].metric_type == "heart_rate"
+
+    def test_falls_back_to_renamed_folder(self, parser: AppleHealthParser):
+        archive = self._zip({"Export/export.xml": self.xml_content})
+
+        with parser.open_export_zip(archive) as source:
+            assert source.read() == self.xml_content
+
+    def test_missing_export_member(self, parser: AppleHealthParser):
+        archive = self._zip({"apple_health_export/export_cda.xml": b"<ClinicalDocument/>"})
+
+        with pytest.raises(ValueError):
+            parser.open_export_zip(archive)
+
+
+class TestParsePool:
+    """Tests for parsing exports in worker processes."""
+
+    xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+    <HealthData>
+        <Record type="HKQuantityTypeIdentifierStepCount"
+                value="1000" unit="count" startDate="2020-03-01 08:00:00 +0100" />
+        <Record type="HKQuantityTypeIdentifierStepCount"
+                value="2500" unit="count" startDate="2020-03-01 18:00:00 +0100" />
+        <Record type="HKQuantityTypeIdentifierBodyMass"
+                value="165" unit="lb" startDate="2024-01-15 07:30:00 +0100" />
+    </HealthData>"""
+
+    def test_matches_in_process_parse(self, tmp_path):
+        path = tmp_path / "export.xml"
+        path.write_bytes(self.xml_content)
+
+        pooled = _unbatch(parse_pool.iter_export(path, "test_user", DAILY))
+        local = _unbatch(iter_export(path, "test_user", DAILY))
+
+        assert len(pooled) == len(local) == 2
+        for got, expected in zip(pooled, local, strict=True):
+            assert got.model_dump(exclude={"measured_at"}) == expected.model_dump(
+                exclude={"measured_at"}
+            )
+            assert to_db_timestamp(got.measured_at) == to_db_timestamp(expected.measured_at)
+
+    def test_reads_zip_exports(self, tmp_path):
+        path = tmp_path / "export.zip"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("apple_health_export/export.xml", self.xml_content)
+
+        metrics = _unbatch(parse_pool.iter_export(path, "test_user", RetentionPolicy({})))
+
+        # Steps are held until their days are resolved against other devices.
+        assert [m.metric_type for m in metrics] == ["weight", "steps", "steps"]
+
+    def test_worker_parse_errors(self, tmp_path):
+        path = tmp_path / "export.xml"
+        path.write_bytes(b"<HealthData><Record")
+
+        with pytest.raises(ExportParseError, match="Failed to parse XML"):
+            list(parse_pool.iter_export(path, "test_user", DAILY))
+
+    def test_parses_in_thread_without_workers(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "import_parse_workers", 0)
+        path = tmp_path / "export.zip"
+        path.write_bytes(b"not a zip")
+
+        with pytest.raises(ExportParseError, match="Invalid export archive"):
+            list(parse_pool.iter_export(path, "test_user", DAILY))
+
+
+class TestShardedParse:
+    """Tests for parsing one export.xml in parallel byte ranges."""
+
+    def _export(self) -> bytes:
+        recent = datetime.now(UTC) - timedelta(days=2)
+        records = []
+        for i in range(300):
+            day = datetime(2020, 3, 1 + i % 20, 6 + i % 12, i % 60, tzinfo=UTC)
+            records.append(
+                f'<Record type="HKQuantityTypeIdentifierStepCount" value="{i * 7 % 900}" '
+                f'unit="count" startDate="{day:%Y-%m-%d %H:%M:%S} +0000" />'
+            )
+            records.append(
+                f'<Record type="HKQuantityTypeIdentifierHeartRate" value="{55 + i % 40}.3" '
+                f'unit="count/min" startDate="{day:%Y-%m-%d %H:%M:%S} +0000">'
+                f'<MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="1"/></Record>'
+            )
+            if i % 10 == 0:
+                stamp = f"{recent + timedelta(minutes=i):%Y-%m-%d %H:%M:%S} +0000"
+                records.append(
+                    f'<Correlation type="HKCorrelationTypeIdentifierBloodPressure" '
+                    f'startDate="{stamp}">'
+                    f'<Record type="HKQuantityTypeIdentifierBloodPressureSystolic" '
+                    f'value="12{i % 10}" unit="mmHg" startDate="{stamp}" />'
+                    f'<Record type="HKQuantityTypeIdentifierBloodPressureDiastolic" value="80" '
+                    f'unit="mmHg" startDate="{stamp}" /></Correlation>'
+                )
+                records.append(
+                    f'<Record type="HKQuantityTypeIdentifierBodyMass" value="{160 + i / 10}" '
+                    f'unit="lb" startDate="{stamp}" />'
+                )
+        body = "\n".join(records)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            "<!DOCTYPE HealthData [\n<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation)*)>\n"
+            "<!ATTLIST Record type CDATA #REQUIRED>\n]>\n"
+            '<HealthData locale="en_US">\n<ExportDate value="2024-01-01 00:00:00 +0000"/>\n'
+            f"{body}\n</HealthData>\n"
+        ).encode()
+
+    @staticmethod
+    def _key(metric) -> tuple:
+        return (
+            metric.metric_type,
+            to_db_timestamp(metric.measured_at),
+            metric.value,
+            metric.unit,
+            metric.source,
+        )
+
+    def test_ranges_start_at_top_level_records(self):
+        content = self._export()
+
+        ranges = split_export(content, 7)
+
+        assert len(ranges) == 7
+        assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+        for start, _ in ranges[1:]:
+            assert content.startswith(b"<Record", start)
+            assert content.rfind(b"<Correlation", 0, start) < content.rfind(
+                b"</Correlation>", 0, start
+            )
+
+    def test_matches_parse_xml(self, parser: AppleHealthParser, tmp_path):
+        content = self._export()
+        path = tmp_path / "export.xml"
+        path.write_bytes(content)
+
+        sharded = _unbatch(parse_pool.iter_export(path, "test_user", DAILY, shards=4))
+        expected = parser.parse_xml(content, "test_user")
+
+        assert sorted(map(self._key, sharded)) == sorted(map(self._key, expected))
+        assert {m.metric_type for m in sharded} == {
+            "steps",
+            "heart_rate",
+            "weight",
+            "blood_pressure_systolic",
+            "blood_pressure_diastolic",
+        }
+
+    def test_shard_parse_errors(self, tmp_path):
+        path = tmp_path / "export.xml"
+        path.write_bytes(b"<HealthData><Record type='x'><Record></HealthData>")
+
+        with pytest.raises(ExportParseError):
+            list(parse_pool.iter_export(path, "test_user", DAILY, shards=2))
+
+
 class TestParseAutoExportJson:
     """Tests for Health Auto Export JSON parsing."""
 
@@ -219,6 +500,49 @@ class TestParseAutoExportJson:
         assert metrics[0].value == 72.0
 
 
+class TestParseAppleDate:
+    """Tests for the Apple Health date fast path."""
+
+    now = datetime(2024, 6, 1, 12, 0, tzinfo=UTC)
+    samples = [
+        "2024-01-15 10:00:00 +0000",
+        "2024-01-15 10:00:00 +0130",
+        "2024-01-15 23:59:59 -0800",
+        "2024-01-15 10:00:00 -0000",
+        "2024-01-15 10:00:00",
+        "2024-1-5 9:00:00 +0000",
+        "2024-01-15 10:00:00 +00:00",
+        "2024-01-15  10:00:00 +0000",
+        "2024-02-30 10:00:00 +0000",
+        "2024-13-01 10:00:00 +0000",
+        "2024-01-15 24:00:00 +0000",
+        "2024-01-15 10:00:60 +0000",
+        "2024-01-15 10:00:00 +2500",
+        "2024-01-15 10:00:00 +0075",
+        "2024-06-01 12:00:00 +0000",
+        "2024-06-01 12:00:01 +0000",
+        "2024-06-01 13:00:00 +0200",
+        "2030-01-01 00:00:00 +0000",
+        "not a date",
+        "",
+    ]
+
+    def test_matches_strptime(self, parser: AppleHealthParser):
+        for date_str in self.samples:
+            fast = parser._parse_apple_date(date_str, self.now)
+            slow = parser._strptime_apple_date(date_str, self.now)
+
+            assert fast == slow, date_str
+            assert getattr(fast, "tzinfo", None) == getattr(slow, "tzinfo", None), date_str
+
+    def test_reuses_tzinfo_per_offset(self, parser: AppleHealthParser):
+        first = parser._parse_apple_date("2024-01-15 10:00:00 +0100", self.now)
+        second = parser._parse_apple_date("2024-03-02 08:30:00 +0100", self.now)
+
+        assert first.tzinfo is second.tzinfo
+        assert first.utcoffset() == timedelta(hours=1)
+
+
 class TestUnitConversion:
     """Tests for unit conversion."""
 
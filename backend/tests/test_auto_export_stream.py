@@ -0,0 +1,83 @@
+"""Tests for incremental parsing of Health Auto Export JSON."""
+
+import json
+
+import pytest
+
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.auto_export_stream import AutoExportStream
+
+PAYLOAD = {
+    "data": {
+        "metrics": [
+            {
+                "name": "heart_rate",
+                "units": "bpm",
+                "data": [
+                    {"date": "2024-01-15T10:00:00Z", "qty": 72, "source": {"name": "Watch"}},
+                    {"date": "2024-01-15T11:00:00Z", "value": "73"},
+                    {"date": "2024-01-15T12:00:00Z"},
+                ],
+            },
+            # Data before name and units, and a unit to convert.
+            {
+                "data": [
+                    {"date": "2024-01-16T08:00:00Z", "qty": 180},
+                    {"date": "2024-01-17T08:00:00Z", "qty": 179},
+                ],
+                "units": "lb",
+                "name": "weight_body_mass",
+            },
+            {"name": "not_imported", "data": [{"date": "2024-01-15T10:00:00Z", "qty": 1}]},
+            {"name": "step_count", "data": [{"date": "2024-01-15T10:00:00Z", "qty": 5000}]},
+        ]
+    }
+}
+
+
+def _stream(body: bytes, chunk_size: int, batch_size: int = 2) -> list[list[tuple]]:
+    stream = AutoExportStream("stream_user", batch_size)
+    batches = []
+    for start in range(0, len(body), chunk_size):
+        batches += stream.feed(body[start : start + chunk_size])
+    batches += stream.close()
+    return [
+        [(row["metric_type"], row["value"], row["unit"], row["measured_at"]) for row in b.rows()]
+        for b in batches
+    ]
+
+
+class TestAutoExportStream:
+    """Tests for walking metrics and data points as the body arrives."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 13, 1 << 20])
+    def test_matches_buffered_parse(self, chunk_size):
+        body = json.dumps(PAYLOAD).encode()
+        expected = AppleHealthParser().parse_auto_export_batch(PAYLOAD, "stream_user")
+
+        batches = _stream(body, chunk_size)
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert [row for batch in batches for row in batch] == [
+            (row["metric_type"], row["value"], row["unit"], row["measured_at"])
+            for row in expected.rows()
+        ]
+        assert batches[1][1][:3] == ("weight", 81.19, "kg")
+
+    def test_metrics_at_root(self):
+        body = json.dumps({"metrics": PAYLOAD["data"]["metrics"][:1]}).encode()
+
+        assert len(_stream(body, 64, batch_size=10)[0]) == 2
+
+    @pytest.mark.parametrize(
+        "body, message",
+        [
+            (b'{"data": {"metrics": [{"name": "heart_rate", "data": [', "Invalid JSON"),
+            (b'{"data": {"metrics": [}}', "Invalid JSON"),
+            (b"{}", "No metrics data"),
+            (b'{"metrics": []}', "No metrics data"),
+        ],
+    )
+    def test_rejects_invalid_payloads(self, body, message):
+        with pytest.raises(ValueError, match=message):
+            _stream(body, 8)
@@ -0,0 +1,175 @@
+"""Tests for vectorized bucket statistics and import-time rollups."""
+
+import pickle
+import random
+from datetime import UTC, date, datetime, timedelta
+
+import pytest
+
+from app.services import bucket_stats
+from app.services.apple_health_parser import METRIC_UNITS, RollupAggregator
+from app.services.bucket_stats import BucketStats, BucketSummary
+from app.services.metric_batch import from_epoch_us
+from app.services.retention import RetentionPolicy, Tier
+
+START = date(2024, 1, 1).toordinal()
+NOW = datetime(2024, 6, 1, tzinfo=UTC)
+
+
+def _samples(buckets: int, per_bucket: int) -> list[tuple[int, float]]:
+    rng = random.Random(7)
+    return [
+        (START + bucket, round(rng.uniform(40, 180), 1))
+        for bucket in range(buckets)
+        for _ in range(per_bucket)
+    ]
+
+
+class TestBucketStats:
+    """Tests for grouping samples by bucket."""
+
+    def test_reduces_across_flushes(self, monkeypatch):
+        monkeypatch.setattr(bucket_stats, "FLUSH_SAMPLES", 7)
+        samples = _samples(buckets=4, per_bucket=10)
+        random.Random(1).shuffle(samples)
+        stats = BucketStats()
+
+        for bucket, value in samples:
+            stats.add(bucket, value)
+
+        expected = []
+        for bucket in range(START, START + 4):
+            values = [v for b, v in samples if b == bucket]
+            expected.append((bucket, len(values), round(sum(values), 2), min(values), max(values)))
+        assert [
+            (s.bucket, s.count, round(s.total, 2), s.minimum, s.maximum) for s in stats.summaries()
+        ] == expected
+
+    def test_buckets_in_order(self):
+        stats = BucketStats()
+        stats.add(5, 5.0)
+        stats.add(-3, 7.0)
+
+        assert stats.summaries() == [
+            BucketSummary(-3, 1, 7.0, 7.0, 7.0),
+            BucketSummary(5, 1, 5.0, 5.0, 5.0),
+        ]
+
+    def test_merge_and_pickle(self):
+        samples = _samples(buckets=3, per_bucket=5)
+        whole, first, second = BucketStats(), BucketStats(), BucketStats()
+        for i, (bucket, value) in enumerate(samples):
+            whole.add(bucket, value)
+            (first if i % 2 else second).add(bucket, value)
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+
+        assert [(s.bucket, s.count, s.minimum, s.maximum) for s in first.summaries()] == [
+            (s.bucket, s.count, s.minimum, s.maximum) for s in whole.summaries()
+        ]
+
+
+class TestRollupAggregator:
+    """Tests for folding old records into buckets while parsing."""
+
+    def test_daily_matches_per_day_python_rounding(self):
+        aggregator = RollupAggregator(RetentionPolicy.daily(30), NOW)
+        start = datetime(2024, 1, 1, tzinfo=UTC)
+        rng = random.Random(3)
+        by_day: dict[tuple[str, date], list[float]] = {}
+        for minute in range(0, 3 * 24 * 60, 7):
+            measured_at = start + timedelta(minutes=minute)
+            for metric_type in ("heart_rate", "steps"):
+                value = round(rng.uniform(0, 200), 1)
+                assert aggregator.add(metric_type, measured_at, value, METRIC_UNITS[metric_type])
+                by_day.setdefault((metric_type, measured_at.date()), []).append(value)
+
+        metrics = list(aggregator.metrics("u"))
+
+        assert {m.measured_at.time() for m in metrics} == {datetime(2024, 1, 1, 12).time()}
+        assert {(m.metric_type, m.measured_at.date()): m.value for m in metrics} == {
+            (metric_type, day): round(sum(v), 2)
+            if metric_type == "steps"
+            else round(sum(v) / len(v), 2)
+            for (metric_type, day), v in by_day.items()
+        }
+
+    def test_keeps_recent_and_unaggregated_records(self):
+        aggregator = RollupAggregator(RetentionPolicy.daily(30), NOW)
+
+        assert not aggregator.add("heart_rate", NOW - timedelta(days=1), 60.0, "bpm")
+        assert not aggregator.add("weight", NOW - timedelta(days=90), 75.0, "kg")
+        assert list(aggregator.summaries()) == []
+
+    def test_tiers_pick_coarsest_bucket(self):
+        policy = RetentionPolicy({"heart_rate": [Tier(7, 300), Tier(90, 3600), Tier(365, 86_400)]})
+        aggregator = RollupAggregator(policy, NOW)
+        for days_ago, value in ((1, 60.0), (10, 70.0), (100, 80.0), (400, 90.0)):
+            aggregator.add("heart_rate", NOW - timedelta(days=days_ago, minutes=1), value, "bpm")
+
+        batches = {batch.resolution_seconds: batch for batch in aggregator.batches("u")}
+
+        assert sorted(batches) == [300, 3600, 86_400]
+        five_minutes = next(batches[300].rows())
+        assert five_minutes["value"] == 70.0
+        assert five_minutes["sample_count"] == 1
+        assert from_epoch_us(batches[300].timestamps[0]).strftime("%M:%S") == "57:30"
+        assert next(batches[86_400].rows())["measured_at"].hour == 12
+
+    def test_batches_carry_min_max_count(self):
+        aggregator = RollupAggregator(RetentionPolicy.daily(30), NOW)
+        for hour, value in ((8, 60.0), (9, 90.0), (10, 75.0)):
+            aggregator.add("heart_rate", datetime(2024, 1, 1, hour, tzinfo=UTC), value, "bpm")
+
+        ((row,),) = [list(batch.rows()) for batch in aggregator.batches("u")]
+
+        assert row["value"] == 75.0
+        assert (row["sample_count"], row["value_min"], row["value_max"]) == (3, 60.0, 90.0)
+        assert row["resolution_seconds"] == 86_400
+
+    def test_rolls_up_types_the_apple_health_map_lacks(self):
+        policy = RetentionPolicy({"sleep_deep_hours": [Tier(30, 86_400)]})
+        aggregator = RollupAggregator(policy, NOW)
+        for day, value in ((100, 1.5), (101, 1.25)):
+            aggregator.add("sleep_deep_hours", NOW - timedelta(days=day), value, "hours")
+
+        metrics = list(aggregator.metrics("u"))
+
+        assert [(m.metric_type, m.value, m.unit) for m in metrics] == [
+            ("sleep_deep_hours", 1.25, "hours"),
+            ("sleep_deep_hours", 1.5, "hours"),
+        ]
+
+
+class TestRetentionPolicy:
+    """Tests for parsing and validating policies."""
+
+    def test_json_round_trip(self):
+        text = (
+            '{"heart_rate": [{"after_days": 7, "bucket": "5m"}, '
+            '{"after_days": 90, "bucket": "1h"}, {"after_days": 365, "bucket": "1d"}]}'
+        )
+
+        policy = RetentionPolicy.from_json(text)
+
+        assert policy.tiers("heart_rate") == (Tier(365, 86_400), Tier(90, 3600), Tier(7, 300))
+        assert RetentionPolicy.from_json(policy.to_json()) == policy
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "not json",
+            '{"heart_rate": [{"after_days": 7}]}',
+            '{"heart_rate": [{"after_days": 7, "bucket": "7m"}]}',
+            '{"heart_rate": [{"after_days": 0, "bucket": "5m"}]}',
+            # Finer buckets for older data.
+            '{"heart_rate": [{"after_days": 7, "bucket": "1h"},'
+            ' {"after_days": 9, "bucket": "5m"}]}',
+            # Noon is the midpoint of both an 8-hour and a daily bucket.
+            '{"heart_rate": [{"after_days": 7, "bucket": "8h"},'
+            ' {"after_days": 9, "bucket": "1d"}]}',
+        ],
+    )
+    def test_rejects_invalid_policies(self, text):
+        with pytest.raises(ValueError):
+            RetentionPolicy.from_json(text)
@@ -142,6 +142,28 @@ def test_update_health_metric():
     assert data["notes"] == "Updated measurement"
 
 
+def test_update_health_metric_time_with_offset():
+    create_response = client.post(
+        "/api/health-metrics",
+        json={
+            "metric_type": "temperature",
+            "value": 36.6,
+            "unit": "°C",
+            "measured_at": "2024-01-16T10:00:00Z",
+            "owner": "offset_user",
+        },
+    )
+    metric_id = create_response.json()["id"]
+
+    response = client.patch(
+        f"/api/health-metrics/{metric_id}",
+        json={"measured_at": "2024-02-01T01:30:00+02:00"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["measured_at"] == "2024-01-31T23:30:00"
+
+
 def test_update_health_metric_not_found():
     response = client.patch("/api/health-metrics/99999", json={"value": 100.0})
     assert response.status_code == 404
@@ -177,3 +199,74 @@ def test_delete_health_metric_not_found():
     response = client.delete("/api/health-metrics/99999")
     assert response.status_code == 404
     assert response.json()["detail"] == "Health metric not found"
+
+
+def test_create_health_metric_replaces_same_timestamp():
+    payload = {
+        "metric_type": "weight",
+        "value": 70.0,
+        "unit": "kg",
+        "measured_at": "2024-02-01T08:00:00Z",
+        "owner": "same_time_user",
+    }
+    first = client.post("/api/health-metrics", json=payload).json()
+    second = client.post("/api/health-metrics", json={**payload, "value": 70.5}).json()
+
+    assert second["id"] == first["id"]
+    assert second["value"] == 70.5
+    response = client.get("/api/health-metrics?owner=same_time_user")
+    assert len(response.json()) == 1
+
+
+def _create_series(owner: str, metric_types: list[str], days: int) -> None:
+    for day in range(1, days + 1):
+        for metric_type in metric_types:
+            client.post(
+                "/api/health-metrics",
+                json={
+                    "metric_type": metric_type,
+                    "value": float(day),
+                    "unit": "kg",
+                    "measured_at": f"2024-03-{day:02d}T08:00:00Z",
+                    "owner": owner,
+                },
+            )
+
+
+def test_list_health_metrics_pages_with_cursor():
+    # Two types share every timestamp, so pages also break ties on id.
+    _create_series("cursor_user", ["weight", "body_fat_percentage"], days=5)
+
+    pages = []
+    url = "/api/health-metrics?owner=cursor_user&limit=3"
+    cursor = None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    rows = [metric for page in pages for metric in page]
+    assert len({metric["id"] for metric in rows}) == 10
+    assert [metric["value"] for metric in rows] == [5, 5, 4, 4, 3, 3, 2, 2, 1, 1]
+
+
+def test_list_health_metrics_time_range():
+    _create_series("range_user", ["weight"], days=5)
+
+    response = client.get(
+        "/api/health-metrics?owner=range_user&metric_type=weight"
+        "&from=2024-03-02T00:00:00Z&to=2024-03-04T08:00:00Z"
+    )
+
+    assert [metric["value"] for metric in response.json()] == [3, 2]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_list_health_metrics_invalid_cursor():
+    response = client.get("/api/health-metrics?cursor=not-a-cursor")
+
+    assert response.status_code == 400
@@ -1,10 +1,23 @@
 """Tests for Apple Health import API endpoints."""
 
 import io
+import json
+import zipfile
+from datetime import UTC, datetime
 
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 
+from app.core.config import settings
+from app.core.database import SessionLocal
 from app.main import app
+from app.schemas import HealthMetricCreate
+from app.services import health_metric_service
+from app.services.crud import health_metric
+from app.services.import_watermarks import import_watermark_service
+from app.services.webhook_buffer import webhook_buffer
 
 client = TestClient(app)
 
@@ -49,6 +62,35 @@ class TestAppleHealthXmlImport:
 
         assert response.status_code == 200
 
+    def test_import_zip_archive(self):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="74"
+                    unit="kg"
+                    startDate="2024-01-16 10:00:00 +0000" />
+        </HealthData>"""
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("apple_health_export/export.xml", xml_content)
+            zf.writestr("apple_health_export/electrocardiograms/ecg_2024-01-16.csv", b"x")
+
+        response = client.post(
+            "/api/import/apple-health?owner=zip_user",
+            files={"file": ("export.zip", io.BytesIO(archive.getvalue()), "application/zip")},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["total_records"] == 1
+
+    def test_import_rejects_invalid_zip(self):
+        response = client.post(
+            "/api/import/apple-health",
+            files={"file": ("export.zip", io.BytesIO(b"not a zip"), "application/zip")},
+        )
+
+        assert response.status_code == 400
+
     def test_import_rejects_non_xml(self):
         response = client.post(
             "/api/import/apple-health",
@@ -67,6 +109,64 @@ class TestAppleHealthXmlImport:
         assert response.status_code == 400
         assert "empty" in response.json()["detail"].lower()
 
+    def test_import_filters_types_and_dates(self):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="61" unit="count/min" startDate="2024-03-01 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="62" unit="count/min" startDate="2024-03-05 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="75" unit="kg" startDate="2024-03-05 10:00:00 +0000" />
+        </HealthData>"""
+
+        response = client.post(
+            "/api/import/apple-health?owner=filtered_user&types=heart_rate&since=2024-03-02",
+            files={"file": ("export.xml", io.BytesIO(xml_content), "application/xml")},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["total_records"] == 1
+        metrics = client.get("/api/health-metrics?owner=filtered_user").json()
+        assert [(m["metric_type"], m["value"]) for m in metrics] == [("heart_rate", 62.0)]
+
+    def test_incremental_import_skips_records_before_watermark(self):
+        records = b"""
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="61" unit="count/min" startDate="2024-03-01 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="62" unit="count/min" startDate="2024-03-05 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="75" unit="kg" startDate="2024-03-01 10:00:00 +0000" />"""
+        newer = b"""
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="63" unit="count/min" startDate="2024-03-06 10:00:00 +0000" />"""
+        url = "/api/import/apple-health?owner=incremental_user&aggregate_days=0"
+
+        first = client.post(
+            url,
+            files={"file": ("export.xml", b"<HealthData>" + records + b"</HealthData>")},
+        )
+        second = client.post(
+            url + "&incremental=true",
+            files={"file": ("export.xml", b"<HealthData>" + records + newer + b"</HealthData>")},
+        )
+
+        assert first.json()["total_records"] == 3
+        # The heart rate from March 1st is before the day of its watermark, less a day.
+        assert second.json()["total_records"] == 3
+        metrics = client.get("/api/health-metrics?owner=incremental_user").json()
+        assert sorted(m["value"] for m in metrics) == [61.0, 62.0, 63.0, 75.0]
+
+    def test_import_rejects_unknown_type_filter(self):
+        response = client.post(
+            "/api/import/apple-health?types=active_energy",
+            files={"file": ("export.xml", io.BytesIO(b"<HealthData/>"), "application/xml")},
+        )
+
+        assert response.status_code == 400
+        assert "active_energy" in response.json()["detail"]
+
     def test_import_handles_invalid_xml(self):
         response = client.post(
             "/api/import/apple-health",
@@ -94,7 +194,7 @@ class TestAppleHealthWebhook:
 
         response = client.post("/api/import/apple-health/webhook", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert data["total_records"] == 1
 
@@ -111,11 +211,9 @@ class TestAppleHealthWebhook:
             }
         }
 
-        response = client.post(
-            "/api/import/apple-health/webhook?owner=webhook_user", json=payload
-        )
+        response = client.post("/api/import/apple-health/webhook?owner=webhook_user", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
 
     def test_webhook_with_api_key(self):
         payload = {
@@ -130,11 +228,9 @@ class TestAppleHealthWebhook:
             }
         }
 
-        response = client.post(
-            "/api/import/apple-health/webhook?key=my_api_key", json=payload
-        )
+        response = client.post("/api/import/apple-health/webhook?key=my_api_key", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
 
     def test_webhook_with_metrics_at_root(self):
         payload = {
@@ -149,13 +245,31 @@ class TestAppleHealthWebhook:
 
         response = client.post("/api/import/apple-health/webhook", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
 
     def test_webhook_rejects_empty_payload(self):
         response = client.post("/api/import/apple-health/webhook", json={})
 
         assert response.status_code == 400
 
+    def test_webhook_counts_invalid_units_as_errors(self):
+        payload = {
+            "data": {
+                "metrics": [
+                    {
+                        "name": "heart_rate",
+                        "units": "beats per minute as measured by a very verbose device",
+                        "data": [{"date": "2024-01-15T10:00:00Z", "qty": 72}],
+                    }
+                ]
+            }
+        }
+
+        response = client.post("/api/import/apple-health/webhook", json=payload)
+
+        assert response.status_code == 202
+        assert response.json() == {"total_records": 1, "imported": 0, "skipped": 0, "errors": 1}
+
     def test_webhook_handles_multiple_metrics(self):
         payload = {
             "data": {
@@ -179,11 +293,58 @@ class TestAppleHealthWebhook:
 
         response = client.post("/api/import/apple-health/webhook", json=payload)
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert data["total_records"] == 3
 
 
+class TestAppleHealthWebhookStream:
+    """Tests for the streaming webhook endpoint."""
+
+    def test_streams_large_payload_in_batches(self, monkeypatch):
+        monkeypatch.setattr(settings, "import_batch_size", 10)
+        points = [{"date": f"2024-05-01T{hour:02d}:00:00Z", "qty": 60 + hour} for hour in range(24)]
+        payload = {"data": {"metrics": [{"name": "heart_rate", "units": "bpm", "data": points}]}}
+
+        response = client.post(
+            "/api/import/apple-health/webhook/stream?owner=stream_user",
+            content=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"total_records": 24, "imported": 24, "skipped": 0, "errors": 0}
+        metrics = client.get("/api/health-metrics?owner=stream_user&limit=100").json()
+        assert sorted(m["value"] for m in metrics) == [60.0 + hour for hour in range(24)]
+
+    def test_replays_repeated_payloads_and_idempotency_keys(self):
+        def payload(qty: int) -> str:
+            points = [{"date": f"2024-05-02T{qty}:00:00Z", "qty": qty}]
+            return json.dumps({"metrics": [{"name": "heart_rate", "units": "bpm", "data": points}]})
+
+        url = "/api/import/apple-health/webhook/stream?owner=stream_replay"
+        first = client.post(url, content=payload(10))
+        repeated = client.post(url, content=payload(10))
+        keyed = client.post(url, content=payload(11), headers={"Idempotency-Key": "sync-1"})
+        retried = client.post(url, content=payload(12), headers={"Idempotency-Key": "sync-1"})
+
+        assert first.json() == repeated.json() == keyed.json() == retried.json()
+        assert "Idempotent-Replayed" not in first.headers
+        assert repeated.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in keyed.headers
+        assert retried.headers["Idempotent-Replayed"] == "true"
+        metrics = client.get("/api/health-metrics?owner=stream_replay").json()
+        assert sorted(m["value"] for m in metrics) == [10.0, 11.0]
+
+    def test_rejects_truncated_payload(self):
+        response = client.post(
+            "/api/import/apple-health/webhook/stream",
+            content=b'{"data": {"metrics": [{"name": "heart_rate", "data": [',
+        )
+
+        assert response.status_code == 400
+
+
 class TestDeduplication:
     """Tests for import deduplication logic."""
 
@@ -210,4 +371,251 @@ class TestDeduplication:
         assert response2.status_code == 200
         second_import = response2.json()
 
-        assert second_import["total_records"] == first_import["total_records"]
+        assert second_import == first_import
+        assert "Idempotent-Replayed" not in response1.headers
+        assert response2.headers["Idempotent-Replayed"] == "true"
+
+    def test_repeated_webhook_payload_replays_result(self, monkeypatch):
+        payload = {
+            "metrics": [
+                {
+                    "name": "heart_rate",
+                    "units": "bpm",
+                    "data": [{"date": "2024-02-02T10:00:00Z", "qty": 64}],
+                }
+            ]
+        }
+        url = "/api/import/apple-health/webhook?owner=replay_user"
+
+        first = client.post(url, json=payload)
+        second = client.post(url, json=payload)
+        other_owner = client.post(
+            "/api/import/apple-health/webhook?owner=replay_other", json=payload
+        )
+        monkeypatch.setattr(settings, "import_digest_ttl_seconds", 0)
+        disabled = client.post(url, json=payload)
+
+        assert (
+            first.json()
+            == second.json()
+            == {
+                "total_records": 1,
+                "imported": 1,
+                "skipped": 0,
+                "errors": 0,
+            }
+        )
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in other_owner.headers
+        assert "Idempotent-Replayed" not in disabled.headers
+
+    def test_webhook_honors_idempotency_key(self):
+        def payload(qty: int) -> dict:
+            return {
+                "metrics": [
+                    {
+                        "name": "heart_rate",
+                        "units": "bpm",
+                        "data": [{"date": f"2024-02-03T{qty}:00:00Z", "qty": qty}],
+                    }
+                ]
+            }
+
+        url = "/api/import/apple-health/webhook?owner=idempotent_user"
+        headers = {"Idempotency-Key": "retry-1"}
+
+        first = client.post(url, json=payload(10), headers=headers)
+        retried = client.post(url, json=payload(11), headers=headers)
+
+        assert retried.json() == first.json()
+        assert retried.headers["Idempotent-Replayed"] == "true"
+        webhook_buffer.flush()
+        metrics = client.get("/api/health-metrics?owner=idempotent_user").json()
+        assert [m["value"] for m in metrics] == [10.0]
+
+    def test_manual_entry_not_overwritten(self):
+        client.post(
+            "/api/health-metrics",
+            json={
+                "metric_type": "heart_rate",
+                "value": 65.0,
+                "unit": "bpm",
+                "measured_at": "2024-03-01T10:00:00Z",
+                "owner": "manual_wins",
+            },
+        )
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="99"
+                    unit="count/min"
+                    startDate="2024-03-01 10:00:00 +0000" />
+        </HealthData>"""
+
+        response = client.post(
+            "/api/import/apple-health?owner=manual_wins&aggregate_days=0",
+            files={"file": ("export.xml", io.BytesIO(xml_content), "application/xml")},
+        )
+
+        assert response.json() == {"total_records": 1, "imported": 0, "skipped": 1, "errors": 0}
+        metrics = client.get("/api/health-metrics?owner=manual_wins").json()
+        assert [m["value"] for m in metrics] == [65.0]
+        assert metrics[0]["source"] == "manual"
+
+    def test_repeated_keys_in_one_import(self):
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="70"
+                    unit="count/min"
+                    startDate="2024-03-02 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="75"
+                    unit="count/min"
+                    startDate="2024-03-02 10:00:00 +0000" />
+        </HealthData>"""
+
+        response = client.post(
+            "/api/import/apple-health?owner=repeat_user&aggregate_days=0",
+            files={"file": ("export.xml", io.BytesIO(xml_content), "application/xml")},
+        )
+
+        assert response.json() == {"total_records": 2, "imported": 2, "skipped": 0, "errors": 0}
+        metrics = client.get("/api/health-metrics?owner=repeat_user").json()
+        assert [m["value"] for m in metrics] == [75.0]
+
+    def test_reimport_updates_imported_rows(self):
+        def xml(value: int) -> bytes:
+            return f"""<?xml version="1.0" encoding="UTF-8"?>
+            <HealthData>
+                <Record type="HKQuantityTypeIdentifierBodyMass"
+                        value="{value}"
+                        unit="kg"
+                        startDate="2024-03-03 10:00:00 +0000" />
+            </HealthData>""".encode()
+
+        for value in (80, 81):
+            response = client.post(
+                "/api/import/apple-health?owner=reimport_user",
+                files={"file": ("export.xml", io.BytesIO(xml(value)), "application/xml")},
+            )
+            assert response.json()["imported"] == 1
+
+        metrics = client.get("/api/health-metrics?owner=reimport_user").json()
+        assert [m["value"] for m in metrics] == [81.0]
+
+    def test_copy_path_keeps_counts(self, monkeypatch):
+        monkeypatch.setattr(settings, "import_batch_size", 1)
+        monkeypatch.setattr(settings, "import_copy_threshold", 1)
+        client.post(
+            "/api/health-metrics",
+            json={
+                "metric_type": "heart_rate",
+                "value": 60.0,
+                "unit": "bpm",
+                "measured_at": "2024-03-04T11:00:00Z",
+                "owner": "copy_user",
+            },
+        )
+        xml_content = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="70" unit="count/min" startDate="2024-03-04 10:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="71" unit="count/min" startDate="2024-03-04 11:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="72" unit="count/min" startDate="2024-03-04 12:00:00 +0000" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="73" unit="count/min" startDate="2024-03-04 12:00:00 +0000" />
+        </HealthData>"""
+
+        response = client.post(
+            "/api/import/apple-health?owner=copy_user&aggregate_days=0",
+            files={"file": ("export.xml", io.BytesIO(xml_content), "application/xml")},
+        )
+
+        assert response.json() == {"total_records": 4, "imported": 3, "skipped": 1, "errors": 0}
+        metrics = client.get("/api/health-metrics?owner=copy_user").json()
+        assert [(m["value"], m["source"]) for m in metrics] == [
+            (73.0, "apple_health_import"),
+            (60.0, "manual"),
+            (70.0, "apple_health_import"),
+        ]
+
+    def test_copy_fallback_reports_only_committed_rows(self, monkeypatch):
+        # A staging table that cannot be created makes every COPY chunk fall back.
+        monkeypatch.setattr(health_metric_service, "CREATE_STAGING_TABLE", text("SELECT nope"))
+        metrics = [
+            HealthMetricCreate(
+                metric_type="heart_rate",
+                value=70 + i,
+                unit="bpm",
+                measured_at=datetime(2024, 3, 5, 10 + i, tzinfo=UTC),
+                owner="copy_fallback_user",
+                source="apple_health_import",
+            )
+            for i in range(4)
+        ]
+        progress = []
+
+        with SessionLocal() as db:
+            result = health_metric.bulk_upsert(
+                db,
+                metrics,
+                batch_size=1,
+                copy_threshold=1,
+                on_batch=lambda r: progress.append(r.total_records),
+            )
+
+        # Progress is what a resumed job skips, so it never runs ahead of the commits.
+        assert progress == [1, 2, 3, 4]
+        assert (result.total_records, result.imported) == (4, 4)
+
+    def test_lost_connection_fails_the_write(self, unreachable_session):
+        metric = HealthMetricCreate(
+            metric_type="heart_rate",
+            value=70,
+            unit="bpm",
+            measured_at=datetime(2024, 3, 5, 10, tzinfo=UTC),
+            owner="unreachable_user",
+            source="apple_health_import",
+        )
+
+        # Only bad rows are isolated; an outage must not turn every row into an error.
+        with unreachable_session() as db, pytest.raises(OperationalError):
+            health_metric.bulk_upsert(db, [metric])
+
+    # One batched upsert, or one row batched and the rest through COPY.
+    @pytest.mark.parametrize(("batch_size", "copy_threshold"), [(3, 0), (1, 1)])
+    def test_watermark_only_covers_written_rows(self, batch_size, copy_threshold):
+        owner = f"watermark_user_{copy_threshold}"
+        client.post(
+            "/api/health-metrics",
+            json={
+                "metric_type": "heart_rate",
+                "value": 60.0,
+                "unit": "bpm",
+                "measured_at": "2024-03-07T10:00:00Z",
+                "owner": owner,
+            },
+        )
+        metrics = [
+            HealthMetricCreate(
+                metric_type="heart_rate",
+                value=70 + day,
+                unit="bpm",
+                measured_at=datetime(2024, 3, day, 10, tzinfo=UTC),
+                owner=owner,
+                source="apple_health_import",
+            )
+            for day in (5, 6, 7)
+        ]
+
+        with SessionLocal() as db:
+            health_metric.bulk_upsert(
+                db, metrics, batch_size=batch_size, copy_threshold=copy_threshold
+            )
+            # The manual entry on the 7th wins, so the mark stays at the last row written.
+            marks = import_watermark_service.get(db, owner, "apple_health_import")
+
+        assert marks == {"heart_rate": datetime(2024, 3, 6, 10)}
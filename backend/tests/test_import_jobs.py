@@ -0,0 +1,187 @@
+"""Tests for background Apple Health import jobs."""
+
+import io
+import time
+from datetime import UTC, datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.main import app
+from app.models import HealthMetric, ImportJob
+from app.services.import_jobs import import_job_runner
+
+client = TestClient(app)
+
+XML_CONTENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<HealthData>
+    <Record type="HKQuantityTypeIdentifierBodyMass" value="80" unit="kg"
+            startDate="2024-03-01 08:00:00 +0000" />
+    <Record type="HKQuantityTypeIdentifierBodyMass" value="79.5" unit="kg"
+            startDate="2024-03-02 08:00:00 +0000" />
+    <Record type="HKQuantityTypeIdentifierBodyMass" value="79" unit="kg"
+            startDate="2024-03-03 08:00:00 +0000" />
+</HealthData>"""
+
+
+def _wait_for(job_id: int, timeout: float = 10.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/import/jobs/{job_id}").json()
+        if job["phase"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Import job {job_id} did not finish")
+
+
+class TestImportJobs:
+    """Tests for the import job endpoints."""
+
+    def test_submit_and_poll(self):
+        response = client.post(
+            "/api/import/apple-health/jobs?owner=job_user",
+            files={"file": ("export.xml", io.BytesIO(XML_CONTENT), "application/xml")},
+        )
+
+        assert response.status_code == 202
+        assert response.json()["phase"] in ("queued", "running", "completed")
+
+        job = _wait_for(response.json()["id"])
+        assert job["phase"] == "completed"
+        assert job["rows_parsed"] == 3
+        assert job["rows_written"] == 3
+        assert job["batches_committed"] >= 1
+        assert job["error"] is None
+
+        status = client.get("/api/import/status?owner=job_user").json()
+        assert status["last_import_source"] == "export.xml"
+        assert status["last_import_count"] == 3
+
+    def test_invalid_xml_fails_job(self):
+        response = client.post(
+            "/api/import/apple-health/jobs",
+            files={"file": ("export.xml", io.BytesIO(b"<HealthData><Record"), "application/xml")},
+        )
+
+        job = _wait_for(response.json()["id"])
+        assert job["phase"] == "failed"
+        assert job["error"]
+
+    def test_rejects_non_xml_file(self):
+        response = client.post(
+            "/api/import/apple-health/jobs",
+            files={"file": ("data.txt", io.BytesIO(b"hello"), "text/plain")},
+        )
+
+        assert response.status_code == 400
+
+    def test_unknown_job(self):
+        response = client.get("/api/import/jobs/999999")
+
+        assert response.status_code == 404
+
+    def test_status_without_imports(self):
+        response = client.get("/api/import/status?owner=nobody")
+
+        assert response.status_code == 200
+        assert response.json()["last_import_at"] is None
+
+    def test_resumes_after_last_committed_batch(self):
+        settings.import_job_dir.mkdir(parents=True, exist_ok=True)
+        path = settings.import_job_dir / "resume-test.xml"
+        path.write_bytes(XML_CONTENT)
+        now = datetime.now(UTC).replace(tzinfo=None)
+        stale = now - timedelta(seconds=settings.import_job_stale_seconds + 60)
+
+        # A job that crashed after committing the first row.
+        with SessionLocal() as db:
+            job = ImportJob(
+                owner="resume_user",
+                filename="export.xml",
+                file_path=str(path),
+                aggregate_days=30,
+                reference_time=now,
+                phase="running",
+                rows_parsed=1,
+                rows_written=1,
+                batches_committed=1,
+                started_at=stale,
+                heartbeat_at=stale,
+            )
+            db.add(job)
+            db.commit()
+            job_id = job.id
+
+        import_job_runner.run(job_id)
+
+        with SessionLocal() as db:
+            job = db.get(ImportJob, job_id)
+            values = db.query(HealthMetric.value).filter(HealthMetric.owner == "resume_user")
+            written = sorted(value for (value,) in values)
+        assert job.phase == "completed"
+        assert job.rows_parsed == 3
+        assert job.rows_written == 3
+        # Only rows after the committed batch were parsed into the database again.
+        assert written == [79.0, 79.5]
+        assert not path.exists()
+
+    def test_fails_when_the_upload_is_gone(self):
+        now = datetime.now(UTC).replace(tzinfo=None)
+        with SessionLocal() as db:
+            job = ImportJob(
+                owner="lost_upload_user",
+                filename="export.xml",
+                file_path=str(settings.import_job_dir / "never-written.xml"),
+                aggregate_days=30,
+                reference_time=now,
+                phase="queued",
+            )
+            db.add(job)
+            db.commit()
+            job_id = job.id
+
+        import_job_runner.run(job_id)
+
+        job = client.get(f"/api/import/jobs/{job_id}").json()
+        assert job["phase"] == "failed"
+        assert "no longer exists" in job["error"]
+
+    def test_requeues_when_the_database_goes_away(self, monkeypatch):
+        monkeypatch.setattr(settings, "import_batch_size", 1)
+        monkeypatch.setattr(settings, "import_copy_threshold", 0)
+        settings.import_job_dir.mkdir(parents=True, exist_ok=True)
+        path = settings.import_job_dir / "outage-test.xml"
+        path.write_bytes(XML_CONTENT)
+        with SessionLocal() as db:
+            job = ImportJob(
+                owner="outage_user",
+                filename="export.xml",
+                file_path=str(path),
+                aggregate_days=30,
+                reference_time=datetime.now(UTC).replace(tzinfo=None),
+                phase="queued",
+            )
+            db.add(job)
+            db.commit()
+            job_id = job.id
+
+        record_progress = import_job_runner._record_progress
+
+        def drop_after_first_batch(db, job_id, result):
+            if result.total_records > 1:
+                raise OperationalError("UPDATE", {}, Exception("server closed the connection"))
+            record_progress(db, job_id, result)
+
+        with monkeypatch.context() as patched:
+            patched.setattr(import_job_runner, "_record_progress", drop_after_first_batch)
+            import_job_runner.run(job_id)
+        interrupted = client.get(f"/api/import/jobs/{job_id}").json()
+        import_job_runner.run(job_id)
+
+        assert (interrupted["phase"], interrupted["rows_parsed"]) == ("queued", 1)
+        assert interrupted["error"] is None
+        job = client.get(f"/api/import/jobs/{job_id}").json()
+        assert (job["phase"], job["rows_parsed"], job["rows_written"]) == ("completed", 3, 3)
+        assert not path.exists()
@@ -0,0 +1,158 @@
+"""Tests for columnar metric batches."""
+
+import io
+import pickle
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+
+from app.schemas import HealthMetricCreate
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.health_metric_service import to_db_timestamp
+from app.services.metric_batch import MetricBatch, epoch_us, from_epoch_us, skip_rows
+
+
+def _metric(minute: int, **overrides) -> HealthMetricCreate:
+    fields = {
+        "metric_type": "heart_rate",
+        "value": 60.0 + minute,
+        "unit": "bpm",
+        "measured_at": datetime(2024, 1, 15, 10, minute, tzinfo=timezone(timedelta(hours=1))),
+        "owner": "batch_user",
+        "source": "apple_health_import",
+    }
+    return HealthMetricCreate(**(fields | overrides))
+
+
+class TestMetricBatch:
+    """Tests for packing and unpacking batches."""
+
+    def test_epoch_round_trip(self):
+        aware = datetime(2024, 1, 15, 10, 30, 15, 123456, tzinfo=timezone(timedelta(hours=-8)))
+
+        assert from_epoch_us(epoch_us(aware)) == to_db_timestamp(aware)
+        assert epoch_us(datetime(1970, 1, 1, 0, 0, 1)) == 1_000_000
+
+    def test_rows_match_models(self):
+        metrics = [_metric(i) for i in range(5)]
+
+        (batch,) = MetricBatch.from_models(metrics, size=10)
+
+        assert len(batch) == 5
+        assert batch.labels == ["heart_rate", "bpm", "apple_health_import"]
+        for row, metric in zip(batch.rows(), metrics, strict=True):
+            assert row["measured_at"] == to_db_timestamp(metric.measured_at)
+            assert row["value"] == metric.value
+            assert row["owner"] == "batch_user"
+
+    def test_one_owner_per_batch(self):
+        metrics = [_metric(0), _metric(1, owner="other"), _metric(2, owner="other")]
+
+        batches = list(MetricBatch.from_models(metrics, size=10))
+
+        assert [(b.owner, len(b)) for b in batches] == [("batch_user", 1), ("other", 2)]
+
+    def test_rejects_notes(self):
+        with pytest.raises(ValueError):
+            list(MetricBatch.from_models([_metric(0, notes="hello")], size=10))
+
+    def test_pickles_smaller_than_models(self):
+        metrics = [_metric(i % 60) for i in range(1000)]
+        (batch,) = MetricBatch.from_models(metrics, size=1000)
+
+        restored = pickle.loads(pickle.dumps(batch))
+
+        assert list(restored.rows()) == list(batch.rows())
+        assert len(pickle.dumps(batch)) * 5 < len(pickle.dumps(metrics))
+
+    def test_split_and_skip(self):
+        (batch,) = MetricBatch.from_models([_metric(i) for i in range(10)], size=10)
+
+        parts = list(batch.split(4))
+        remaining = list(skip_rows(parts, 6))
+
+        assert [len(p) for p in parts] == [4, 4, 2]
+        assert [len(p) for p in remaining] == [2, 2]
+        assert [row["value"] for p in remaining for row in p.rows()] == [66.0, 67.0, 68.0, 69.0]
+
+    def test_validated_drops_rows_with_bad_labels(self):
+        batch = MetricBatch("batch_user")
+        batch.append("heart_rate", 60.0, "bpm", 0, "apple_health_import")
+        batch.append("heart_rate", 61.0, "x" * 51, 1, "apple_health_import")
+        batch.append("heart_rate", 62.0, "bpm", 2, "somewhere_else")
+
+        valid, dropped = batch.validated()
+
+        assert dropped == 2
+        assert [row["value"] for row in valid.rows()] == [60.0]
+
+    def test_latest_per_type_and_source(self):
+        batch = MetricBatch("batch_user")
+        batch.append("heart_rate", 60.0, "bpm", 5_000_000, "apple_health_import")
+        batch.append("steps", 10.0, "count", 9_000_000, "apple_health_import")
+        batch.append("heart_rate", 61.0, "bpm", 7_000_000, "apple_health_import")
+        batch.append("heart_rate", 62.0, "bpm", 3_000_000, "apple_health_import")
+        batch.append("heart_rate", 63.0, "bpm", 8_000_000, "apple_health_webhook")
+
+        assert batch.latest() == {
+            ("heart_rate", "apple_health_import"): from_epoch_us(7_000_000),
+            ("steps", "apple_health_import"): from_epoch_us(9_000_000),
+            ("heart_rate", "apple_health_webhook"): from_epoch_us(8_000_000),
+        }
+        assert MetricBatch("batch_user").latest() == {}
+
+    def test_csv_quotes_labels(self):
+        batch = MetricBatch('owner "a", b')
+        batch.append("weight", 75.5, "k,g", 1_000_000, "apple_health_import")
+
+        assert batch.csv() == (
+            '"owner ""a"", b","weight",1000000,75.5,"k,g","apple_health_import",0,,,\n'
+        )
+
+    def test_rollup_rows_carry_statistics(self):
+        batch = MetricBatch("batch_user", resolution_seconds=3600)
+        batch.append_rollup(
+            "heart_rate", 70.0, "bpm", 1_800_000_000, "apple_health_import", 3, 60.0, 80.0
+        )
+
+        (row,) = batch.rows()
+        restored = pickle.loads(pickle.dumps(batch))
+
+        assert (row["resolution_seconds"], row["sample_count"]) == (3600, 3)
+        assert (row["value_min"], row["value_max"]) == (60.0, 80.0)
+        assert batch.csv().endswith(',"apple_health_import",3600,3,60.0,80.0\n')
+        assert list(restored.rows()) == [row]
+
+
+class TestXmlBatches:
+    """Tests for parsing exports straight into batches."""
+
+    def test_matches_iter_xml(self):
+        parser = AppleHealthParser()
+        now = datetime.now(UTC)
+        recent = now - timedelta(days=1)
+        xml_content = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <HealthData>
+            <Record type="HKQuantityTypeIdentifierStepCount"
+                    value="1000" unit="count" startDate="2020-03-01 08:00:00 +0100" />
+            <Record type="HKQuantityTypeIdentifierStepCount"
+                    value="2500" unit="count" startDate="2020-03-01 18:00:00 +0100" />
+            <Record type="HKQuantityTypeIdentifierBodyMass"
+                    value="165" unit="lb" startDate="{recent:%Y-%m-%d %H:%M:%S} -0500" />
+            <Record type="HKQuantityTypeIdentifierHeartRate"
+                    value="72" unit="count/min" startDate="{recent:%Y-%m-%d %H:%M:%S} +0000" />
+        </HealthData>""".encode()
+
+        batches = list(
+            parser.iter_xml_batches(io.BytesIO(xml_content), "test_user", now=now, batch_size=1)
+        )
+        metrics = list(parser.iter_xml(io.BytesIO(xml_content), "test_user", now=now))
+
+        rows = [row for batch in batches for row in batch.rows()]
+        assert len(batches) == 3
+        assert [
+            (r["metric_type"], r["value"], r["unit"], r["measured_at"], r["source"]) for r in rows
+        ] == [
+            (m.metric_type, m.value, m.unit, to_db_timestamp(m.measured_at), m.source)
+            for m in metrics
+        ]
@@ -0,0 +1,106 @@
+"""Tests for the monthly partitions of health_metrics."""
+
+from datetime import UTC, date, datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.main import app
+from app.services.crud import health_metric
+from app.services.metric_partitions import add_months, metric_partitions, month_start
+
+client = TestClient(app)
+
+
+def _create(owner: str, measured_at: str) -> None:
+    response = client.post(
+        "/api/health-metrics",
+        json={
+            "metric_type": "weight",
+            "value": 70.0,
+            "unit": "kg",
+            "measured_at": measured_at,
+            "owner": owner,
+        },
+    )
+    assert response.status_code == 200
+
+
+def _in_default(owner: str) -> int:
+    with SessionLocal() as db:
+        return db.execute(
+            text("SELECT count(*) FROM health_metrics_default WHERE owner = :owner"),
+            {"owner": owner},
+        ).scalar_one()
+
+
+class TestMetricPartitions:
+    """Tests for partition maintenance and pruning."""
+
+    def test_moves_rows_out_of_the_default_partition(self):
+        _create("partition_user", "2003-02-03T10:00:00Z")
+        assert _in_default("partition_user") == 1
+
+        response = client.post("/api/health-metrics/partitions")
+
+        assert response.status_code == 200
+        assert "health_metrics_p2003_02" in response.json()["created"]
+        assert response.json()["rows_moved"] >= 1
+        assert _in_default("partition_user") == 0
+        with SessionLocal() as db:
+            assert date(2003, 2, 1) in metric_partitions.months(db)
+        metrics = client.get(
+            "/api/health-metrics?owner=partition_user"
+            "&from=2003-02-01T00:00:00Z&to=2003-03-01T00:00:00Z"
+        ).json()
+        assert [m["measured_at"] for m in metrics] == ["2003-02-03T10:00:00"]
+
+    def test_creates_coming_months(self, monkeypatch):
+        monkeypatch.setattr(settings, "metric_partition_months_ahead", 2)
+
+        with SessionLocal() as db:
+            metric_partitions.maintain(db, now=datetime(2031, 11, 20, tzinfo=UTC))
+            months = metric_partitions.months(db)
+
+        assert {date(2031, 11, 1), date(2031, 12, 1), date(2032, 1, 1)} <= set(months)
+
+    def test_drops_expired_partitions(self, monkeypatch):
+        monkeypatch.setattr(settings, "metric_partition_months_ahead", 0)
+        monkeypatch.setattr(settings, "metric_partition_retention_months", 1)
+        monkeypatch.setattr(settings, "metric_partition_retention_drop", True)
+        _create("expired_user", "1960-01-10T08:00:00Z")
+
+        with SessionLocal() as db:
+            result = metric_partitions.maintain(db, now=datetime(1960, 3, 15, tzinfo=UTC))
+
+        assert result.detached == result.dropped == ["health_metrics_p1960_01"]
+        assert client.get("/api/health-metrics?owner=expired_user").json() == []
+
+    def test_bounded_list_scans_only_its_months(self):
+        month = month_start(datetime.now(UTC).date())
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            with SessionLocal() as db:
+                health_metric.get_multi(
+                    db,
+                    owner="partition_user",
+                    since=datetime(month.year, month.month, 1, tzinfo=UTC),
+                    until=datetime.combine(add_months(month, 1), datetime.min.time()),
+                )
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        statement, parameters = statements[-1]
+        with SessionLocal() as db:
+            plan = "\n".join(
+                db.connection().exec_driver_sql(f"EXPLAIN {statement}", parameters).scalars()
+            )
+        assert f"health_metrics_p{month:%Y_%m}" in plan
+        assert plan.count("on health_metrics_") == 1
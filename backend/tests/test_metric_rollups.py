@@ -0,0 +1,115 @@
+"""Tests for the hourly, daily and weekly rollups kept on every write."""
+
+import io
+
+from fastapi.testclient import TestClient
+
+from app.core.database import SessionLocal
+from app.main import app
+from app.services.metric_rollups import metric_rollup_service
+
+client = TestClient(app)
+
+
+def _create(owner: str, value: float, measured_at: str) -> int:
+    response = client.post(
+        "/api/health-metrics",
+        json={
+            "metric_type": "weight",
+            "value": value,
+            "unit": "kg",
+            "measured_at": measured_at,
+            "owner": owner,
+        },
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def _summary(owner: str, metric_type: str = "weight", period: str = "day") -> list[dict]:
+    response = client.get(
+        f"/api/health-metrics/summary?owner={owner}&metric_type={metric_type}&period={period}"
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def _import_csv(owner: str, content: str) -> None:
+    response = client.post(
+        f"/api/import/csv?owner={owner}&aggregate_days=0",
+        files={"file": ("readings.csv", io.BytesIO(content.encode()), "text/csv")},
+    )
+    assert response.status_code == 200
+
+
+class TestMetricRollups:
+    """Tests for rollups following writes to health_metrics."""
+
+    def test_follows_manual_writes(self):
+        first = _create("rollup_user", 70.0, "2024-04-03T07:00:00Z")
+        second = _create("rollup_user", 74.0, "2024-04-03T19:00:00Z")
+        _create("rollup_user", 71.0, "2024-04-04T07:00:00Z")
+
+        day = _summary("rollup_user")[0]
+        assert (day["bucket_start"], day["sample_count"], day["mean"]) == (
+            "2024-04-03T00:00:00",
+            2,
+            72.0,
+        )
+        assert (day["min"], day["max"], day["stddev"]) == (70.0, 74.0, 2.0)
+
+        # Raising the minimum leaves it to be recomputed from the day's rows.
+        client.patch(f"/api/health-metrics/{first}", json={"value": 75.0})
+        day = _summary("rollup_user")[0]
+        assert (day["sample_count"], day["min"], day["max"]) == (2, 74.0, 75.0)
+
+        client.delete(f"/api/health-metrics/{second}")
+        client.delete(f"/api/health-metrics/{first}")
+        assert [d["bucket_start"] for d in _summary("rollup_user")] == ["2024-04-04T00:00:00"]
+
+    def test_periods(self):
+        _create("rollup_periods", 70.0, "2024-04-03T07:10:00Z")
+        _create("rollup_periods", 72.0, "2024-04-07T07:50:00Z")
+
+        weeks = _summary("rollup_periods", period="week")
+        hours = _summary("rollup_periods", period="hour")
+
+        # Weeks start on Monday.
+        assert [(w["bucket_start"], w["sample_count"]) for w in weeks] == [
+            ("2024-04-01T00:00:00", 2)
+        ]
+        assert [h["bucket_start"] for h in hours] == ["2024-04-03T07:00:00", "2024-04-07T07:00:00"]
+
+    def test_follows_imports_that_replace_rows(self):
+        _import_csv(
+            "rollup_import",
+            "metric_type,value,measured_at\n"
+            "heart_rate,60,2024-04-03T07:00:00Z\n"
+            "heart_rate,80,2024-04-03T08:00:00Z\n",
+        )
+        _import_csv(
+            "rollup_import",
+            "metric_type,value,measured_at\n"
+            "heart_rate,90,2024-04-03T08:00:00Z\n"
+            "heart_rate,70,2024-04-03T09:00:00Z\n",
+        )
+
+        [day] = _summary("rollup_import", "heart_rate")
+        assert (day["sample_count"], day["total"], day["min"], day["max"]) == (3, 220.0, 60.0, 90.0)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        _create("rollup_rebuild", 70.0, "2024-04-03T07:00:00Z")
+        metric_id = _create("rollup_rebuild", 72.5, "2024-04-03T08:00:00Z")
+        client.patch(f"/api/health-metrics/{metric_id}", json={"value": 73.5})
+        kept = {period: _summary("rollup_rebuild", period=period) for period in ("hour", "week")}
+
+        with SessionLocal() as db:
+            assert metric_rollup_service.rebuild(db, "rollup_rebuild") == 4
+
+        for period, summary in kept.items():
+            assert _summary("rollup_rebuild", period=period) == summary
+
+    def test_unknown_period(self):
+        response = client.get("/api/health-metrics/summary?owner=a&metric_type=b&period=month")
+
+        assert response.status_code == 422
@@ -0,0 +1,91 @@
+"""Tests for the downsampled chart series."""
+
+import io
+
+from fastapi.testclient import TestClient
+
+from app.api.import_health import DEFAULT_OWNER
+from app.main import app
+from app.services import metric_series
+
+client = TestClient(app)
+
+
+def _import_minutes(owner: str, values: list[float]) -> None:
+    rows = "".join(
+        f"heart_rate,{value},2024-05-01T{i // 60:02d}:{i % 60:02d}:00Z\n"
+        for i, value in enumerate(values)
+    )
+    response = client.post(
+        f"/api/import/csv?owner={owner}&aggregate_days=0",
+        files={
+            "file": (
+                "readings.csv",
+                io.BytesIO(f"metric_type,value,measured_at\n{rows}".encode()),
+                "text/csv",
+            )
+        },
+    )
+    assert response.status_code == 200
+
+
+def _series(owner: str, query: str = "") -> list[dict]:
+    response = client.get(f"/api/health-metrics/series?owner={owner}&metric_type=heart_rate{query}")
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestMetricSeries:
+    """Tests for GET /api/health-metrics/series."""
+
+    def test_short_ranges_are_not_downsampled(self):
+        _import_minutes("series_short", [61, 62, 63])
+
+        series = _series("series_short", "&points=3")
+
+        assert [p["value"] for p in series] == [61.0, 62.0, 63.0]
+        assert series[0]["measured_at"] == "2024-05-01T00:00:00"
+
+    def test_keeps_each_buckets_extremes(self, monkeypatch):
+        monkeypatch.setattr(metric_series, "CHUNK_ROWS", 7)
+        values = [60 + i % 10 for i in range(120)]
+        values[55] = 150
+        _import_minutes("series_long", values)
+
+        series = _series("series_long", "&points=12")
+
+        # Six 20-minute buckets, each with its low and its high.
+        assert len(series) == 12
+        assert [p["value"] for p in series].count(60.0) == 6
+        assert {"measured_at": "2024-05-01T00:55:00", "value": 150.0} in series
+        timestamps = [p["measured_at"] for p in series]
+        assert timestamps == sorted(timestamps)
+
+    def test_from_and_to_bound_the_series(self):
+        _import_minutes("series_range", list(range(60, 120)))
+
+        series = _series(
+            "series_range", "&points=4&from=2024-05-01T00:10:00Z&to=2024-05-01T00:30:00Z"
+        )
+
+        assert [(p["measured_at"], p["value"]) for p in series] == [
+            ("2024-05-01T00:10:00", 70.0),
+            ("2024-05-01T00:19:00", 79.0),
+            ("2024-05-01T00:20:00", 80.0),
+            ("2024-05-01T00:29:00", 89.0),
+        ]
+
+    def test_defaults_to_the_default_owner(self):
+        _import_minutes("series_other_owner", [201, 202])
+        window = "&from=2024-05-01T00:00:00Z&to=2024-05-01T00:02:00Z"
+
+        response = client.get(f"/api/health-metrics/series?metric_type=heart_rate{window}")
+
+        assert response.status_code == 200
+        assert response.json() == _series(DEFAULT_OWNER, window)
+        assert not {201.0, 202.0} & {p["value"] for p in response.json()}
+
+    def test_needs_two_points(self):
+        response = client.get("/api/health-metrics/series?metric_type=heart_rate&points=1")
+
+        assert response.status_code == 422
@@ -0,0 +1,121 @@
+"""Tests for resolving overlapping step Records from several devices."""
+
+import io
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.overlap_resolver import OverlapResolver
+from app.services.parse_pool import parse_pool
+from app.services.retention import RetentionPolicy
+
+NOW = datetime(2024, 6, 1, tzinfo=UTC)
+WATCH = "Jan’s Apple Watch"
+PHONE = "Jan’s iPhone"
+
+
+def _steps(source: str, start: str, end: str, value: float) -> str:
+    return (
+        f'<Record type="HKQuantityTypeIdentifierStepCount" sourceName="{source}" '
+        f'unit="count" value="{value}" startDate="{start} +0000" endDate="{end} +0000"/>'
+    )
+
+
+def _export(*records: str) -> bytes:
+    return ("<HealthData>\n" + "\n".join(records) + "\n</HealthData>").encode()
+
+
+# Watch and phone both counting a morning walk, plus a phone-only stroll.
+DAY = [
+    _steps(PHONE, "2024-05-20 10:00:00", "2024-05-20 10:15:00", 600),
+    _steps(WATCH, "2024-05-20 10:00:00", "2024-05-20 10:10:00", 500),
+    _steps(PHONE, "2024-05-20 10:20:00", "2024-05-20 10:30:00", 350),
+    _steps(WATCH, "2024-05-20 10:20:00", "2024-05-20 10:30:00", 400),
+    _steps(PHONE, "2024-05-20 11:00:00", "2024-05-20 11:10:00", 300),
+]
+
+
+def _values(content: bytes, policy: RetentionPolicy) -> list[tuple[datetime, float]]:
+    metrics = AppleHealthParser().iter_xml(io.BytesIO(content), "test_user", now=NOW, policy=policy)
+    return [(m.measured_at.replace(tzinfo=None), m.value) for m in metrics]
+
+
+class TestOverlapResolver:
+    """Tests for keeping each stretch of time from the highest-ranked source."""
+
+    def test_watch_wins_over_phone(self):
+        values = _values(_export(*DAY), RetentionPolicy({}))
+
+        assert values == [
+            (datetime(2024, 5, 20, 10), 500),
+            # The 5 of its 15 minutes the watch did not count.
+            (datetime(2024, 5, 20, 10), 200),
+            (datetime(2024, 5, 20, 10, 20), 400),
+            (datetime(2024, 5, 20, 11), 300),
+        ]
+
+    def test_daily_sum_counts_each_step_once(self):
+        values = _values(_export(*DAY), RetentionPolicy.daily(7))
+
+        assert values == [(datetime(2024, 5, 20, 12), 1400)]
+
+    def test_configured_priority(self, monkeypatch):
+        monkeypatch.setattr("app.core.config.settings.import_source_priority", ["iphone"])
+
+        values = _values(_export(*DAY), RetentionPolicy.daily(7))
+
+        assert values == [(datetime(2024, 5, 20, 12), 600 + 350 + 300)]
+
+    def test_same_source_and_instants(self):
+        resolver = OverlapResolver(["watch"])
+        at = datetime(2024, 5, 20, 10, tzinfo=UTC)
+        records = [
+            (("steps", 10.0, "steps", at), None, WATCH),
+            (("steps", 11.0, "steps", at), None, PHONE),
+            (("steps", 20.0, "steps", at), at + timedelta(minutes=5), WATCH),
+            (("steps", 30.0, "steps", at + timedelta(minutes=1)), None, WATCH),
+            (("steps", 5.0, "steps", at + timedelta(minutes=2)), None, PHONE),
+        ]
+
+        resolved = [f for fields, end, source in records for f in resolver.add(fields, end, source)]
+        resolved += resolver.close()
+
+        assert [value for _, value, _, _ in resolved] == [10.0, 20.0, 30.0]
+        assert resolver.dropped == 2
+
+    def test_days_close_as_later_records_arrive(self):
+        resolver = OverlapResolver()
+        start = datetime(2024, 5, 1, 8, tzinfo=UTC)
+
+        closed = [
+            len(resolver.add(("steps", 1.0, "steps", start + timedelta(days=i)), None, PHONE))
+            for i in range(4)
+        ]
+
+        assert closed == [0, 0, 1, 1]
+        assert len(resolver.close()) == 2
+
+    @pytest.mark.parametrize("shards", [1, 3, 8])
+    def test_sharded_parse_matches_single_parse(self, tmp_path, shards):
+        records = []
+        for day in range(10):
+            for hour in range(0, 24, 3):
+                start = datetime(2024, 5, 10 + day, hour)
+                stop = start + timedelta(minutes=40)
+                records.append(_steps(PHONE, f"{start:%F %T}", f"{stop:%F %T}", 400))
+                start += timedelta(minutes=10)
+                records.append(_steps(WATCH, f"{start:%F %T}", f"{stop:%F %T}", 350))
+        path = tmp_path / "export.xml"
+        path.write_bytes(_export(*records))
+        policy = RetentionPolicy.daily(15)
+
+        sharded = parse_pool.iter_export(path, "test_user", policy, now=NOW, shards=shards)
+        values = sorted(
+            (row["measured_at"], row["value"]) for batch in sharded for row in batch.rows()
+        )
+
+        expected = _values(path.read_bytes(), policy)
+        assert [(at.replace(tzinfo=None), value) for at, value in values] == sorted(expected)
+        # Each 40-minute phone Record keeps the 10 minutes the watch missed.
+        assert sum(value for _, value in expected) == 10 * 8 * (100 + 350)
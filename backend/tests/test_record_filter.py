@@ -0,0 +1,154 @@
+"""Tests for skipping unwanted Records in the raw bytes of an export."""
+
+import io
+import pickle
+import xml.etree.ElementTree as ET
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+
+from app.services import record_filter as record_filter_module
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.record_filter import FilteredExport, RecordFilter
+from app.services.retention import RetentionPolicy
+
+HEART_RATE = "HKQuantityTypeIdentifierHeartRate"
+NOW = datetime(2024, 6, 1, tzinfo=UTC)
+
+EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (Record|Correlation|Workout)*>
+]>
+<HealthData locale="en_US">
+ <Record type="HKQuantityTypeIdentifierHeartRate" value="60" unit="count/min"
+  startDate="2024-01-10 08:00:00 +0100">
+  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>
+ </Record>
+ <Record type="HKQuantityTypeIdentifierActiveEnergyBurned" value="12" unit="kcal"
+  startDate="2024-01-10 08:00:00 +0100">
+  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="1"/>
+ </Record>
+ <Record sourceName="a > b" type="HKQuantityTypeIdentifierDistanceWalkingRunning"
+  value="0.3" unit="km" startDate="2024-01-11 08:00:00 +0100"/>
+ <Record
+  type="HKQuantityTypeIdentifierStepCount" value="900" unit="count"
+  startDate="2024-01-12 08:00:00 +0100"/>
+ <Correlation type="HKCorrelationTypeIdentifierBloodPressure"
+  startDate="2024-01-13 08:00:00 +0100">
+  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" value="120" unit="mmHg"
+   startDate="2024-01-13 08:00:00 +0100"/>
+  <Record type="HKQuantityTypeIdentifierBodyMassIndex" value="22" unit="count"
+   startDate="2024-01-13 08:00:00 +0100"/>
+ </Correlation>
+ <Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="30"/>
+ <Record type="HKQuantityTypeIdentifierHeartRate" value="70" unit="count/min"
+  startDate="2024-02-01 08:00:00 +0100"/>
+</HealthData>
+"""
+
+
+@pytest.fixture
+def parser():
+    return AppleHealthParser()
+
+
+def _read(source: FilteredExport) -> bytes:
+    chunks = []
+    while chunk := source.read():
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _parse(parser: AppleHealthParser, record_filter: RecordFilter | None) -> list[tuple]:
+    metrics = parser.iter_xml(
+        io.BytesIO(EXPORT), "u", now=NOW, policy=RetentionPolicy({}), record_filter=record_filter
+    )
+    return [(m.metric_type, m.value) for m in metrics]
+
+
+class TestFilteredExport:
+    """Tests for cutting Records out of the byte stream."""
+
+    def test_cuts_only_unwanted_records(self, parser: AppleHealthParser):
+        filtered = _read(FilteredExport(io.BytesIO(EXPORT), parser.record_filter()))
+
+        assert b"ActiveEnergyBurned" not in filtered
+        assert b"DistanceWalkingRunning" not in filtered
+        assert b"BodyMassIndex" not in filtered
+        # Everything else passes through byte for byte.
+        first_record = EXPORT[EXPORT.index(b"<Record") : EXPORT.index(b"</Record>") + 9]
+        assert first_record in filtered
+        assert b"<Workout" in filtered
+
+    @pytest.mark.parametrize("read_size", [1, 7, 64, 1000])
+    def test_same_result_for_any_read_size(self, parser, monkeypatch, read_size):
+        whole = _read(FilteredExport(io.BytesIO(EXPORT), parser.record_filter()))
+        monkeypatch.setattr(record_filter_module, "READ_SIZE", read_size)
+
+        assert _read(FilteredExport(io.BytesIO(EXPORT), parser.record_filter())) == whole
+
+    def test_parse_matches_unfiltered(self, parser: AppleHealthParser):
+        mapped_in_export = RecordFilter(
+            [
+                HEART_RATE,
+                "HKQuantityTypeIdentifierStepCount",
+                "HKQuantityTypeIdentifierBloodPressureSystolic",
+            ]
+        )
+
+        assert (
+            _parse(parser, None)
+            == _parse(parser, mapped_in_export)
+            == [
+                ("heart_rate", 60.0),
+                ("blood_pressure_systolic", 120.0),
+                ("heart_rate", 70.0),
+                ("steps", 900.0),
+            ]
+        )
+
+    def test_malformed_xml_still_fails(self, parser: AppleHealthParser):
+        with pytest.raises(ET.ParseError):
+            list(parser.iter_xml(io.BytesIO(b"<HealthData><Record type="), "u"))
+
+
+class TestRecordFilter:
+    """Tests for choosing Records by type and start time."""
+
+    def test_by_metric_type(self, parser: AppleHealthParser):
+        assert _parse(parser, parser.record_filter(["heart_rate"])) == [
+            ("heart_rate", 60.0),
+            ("heart_rate", 70.0),
+        ]
+
+    def test_by_date_window(self, parser: AppleHealthParser):
+        record_filter = parser.record_filter(
+            since=datetime(2024, 1, 12, 8), until=datetime(2024, 2, 1, 8)
+        )
+
+        assert _parse(parser, record_filter) == [
+            ("blood_pressure_systolic", 120.0),
+            ("steps", 900.0),
+        ]
+
+    def test_window_compares_wall_time_as_utc(self):
+        tag = f'<Record type="{HEART_RATE}" startDate="2024-01-10 08:00:00 +0100">'.encode()
+        utc_eight = datetime(2024, 1, 10, 8, tzinfo=UTC)
+        cest_eleven = datetime(2024, 1, 10, 11, tzinfo=timezone(timedelta(hours=2)))
+
+        assert RecordFilter([HEART_RATE], since=utc_eight).keeps(tag)
+        assert not RecordFilter([HEART_RATE], since=cest_eleven).keeps(tag)
+
+    def test_rejects_unknown_types_and_empty_windows(self, parser: AppleHealthParser):
+        with pytest.raises(ValueError, match="Unknown metric types: active_energy"):
+            parser.record_filter(["heart_rate", "active_energy"])
+        with pytest.raises(ValueError, match="earlier"):
+            parser.record_filter(since=datetime(2024, 2, 1), until=datetime(2024, 1, 1))
+
+    def test_json_and_pickle_round_trip(self, parser: AppleHealthParser):
+        record_filter = parser.record_filter(["steps"], since=datetime(2024, 1, 1, tzinfo=UTC))
+
+        assert RecordFilter.from_json(record_filter.to_json()) == record_filter
+        copy = pickle.loads(pickle.dumps(record_filter))
+        assert copy == record_filter
+        assert copy.keeps(b'<Record type="HKQuantityTypeIdentifierStepCount">')
@@ -0,0 +1,175 @@
+"""Tests for compressed and MessagePack webhook bodies."""
+
+import gzip
+import json
+
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.request_body import content_encodings
+from app.services.webhook_buffer import webhook_buffer
+
+client = TestClient(app)
+
+PAYLOAD = {
+    "data": {
+        "metrics": [
+            {
+                "name": "heart_rate",
+                "units": "bpm",
+                "data": [
+                    {"date": "2024-06-01T08:00:00Z", "qty": 58},
+                    {"date": "2024-06-01T08:05:00+02:00", "qty": 61.5},
+                ],
+            },
+            {
+                "name": "weight_body_mass",
+                "units": "lb",
+                "data": [{"date": "2024-06-01T07:00:00Z", "qty": 170}],
+            },
+        ]
+    }
+}
+
+SERIALIZERS = {
+    "application/json": lambda payload: json.dumps(payload).encode(),
+    "application/msgpack": msgpack.packb,
+}
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body)
+    if encoding == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        return zstandard.ZstdCompressor().compress(body)
+    return body
+
+
+def _post(path: str, payload: dict, content_type: str, encoding: str):
+    headers = {"Content-Type": content_type}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    body = _compress(SERIALIZERS[content_type](payload), encoding)
+    return client.post(path, content=body, headers=headers)
+
+
+def _stored(owner: str) -> list[tuple]:
+    metrics = client.get(f"/api/health-metrics?owner={owner}").json()
+    return sorted((m["metric_type"], m["value"], m["unit"], m["measured_at"]) for m in metrics)
+
+
+ENCODINGS = ["identity", "gzip", "zstd"]
+
+
+class TestWebhookBodies:
+    """Tests for decoding webhook bodies in every accepted encoding."""
+
+    @pytest.mark.parametrize("encoding", ENCODINGS)
+    @pytest.mark.parametrize("content_type", sorted(SERIALIZERS))
+    def test_same_metrics_for_every_encoding(self, content_type, encoding):
+        if encoding not in ["identity", *content_encodings()]:
+            pytest.skip(f"{encoding} is not available")
+        owner = f"body_{content_type.split('/')[1]}_{encoding}"
+        expected = AppleHealthParser().parse_auto_export_json(PAYLOAD, owner)
+        reference = "body_reference"
+        _post(
+            f"/api/import/apple-health/webhook?owner={reference}",
+            PAYLOAD,
+            "application/json",
+            "identity",
+        )
+
+        response = _post(
+            f"/api/import/apple-health/webhook?owner={owner}", PAYLOAD, content_type, encoding
+        )
+        webhook_buffer.flush()
+
+        assert response.status_code == 202
+        assert response.json()["imported"] == len(expected) == 3
+        assert _stored(owner) == _stored(reference)
+        assert [(m.metric_type, m.value, m.unit) for m in expected] == [
+            ("heart_rate", 58.0, "bpm"),
+            ("heart_rate", 61.5, "bpm"),
+            ("weight", 77.11, "kg"),
+        ]
+
+    def test_repeat_in_another_encoding_is_replayed(self):
+        url = "/api/import/apple-health/webhook?owner=body_replay"
+
+        first = _post(url, PAYLOAD, "application/json", "identity")
+        repeat = _post(url, PAYLOAD, "application/msgpack", "gzip")
+
+        assert repeat.json() == first.json()
+        assert repeat.headers["Idempotent-Replayed"] == "true"
+
+    def test_streaming_route_accepts_gzip(self):
+        response = _post(
+            "/api/import/apple-health/webhook/stream?owner=body_stream",
+            PAYLOAD,
+            "application/json",
+            "gzip",
+        )
+
+        assert response.status_code == 200
+        assert response.json()["imported"] == 3
+
+    @pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+    @pytest.mark.parametrize("truncated", [False, True])
+    def test_streaming_route_rejects_corrupt_bodies(self, encoding, truncated):
+        body = _compress(json.dumps(PAYLOAD).encode(), encoding)
+        body = body[: len(body) // 2] if truncated else b"garbage"
+
+        response = client.post(
+            "/api/import/apple-health/webhook/stream?owner=body_corrupt",
+            content=body,
+            headers={"Content-Encoding": encoding},
+        )
+
+        assert response.status_code == 400
+        assert _stored("body_corrupt") == []
+
+    @pytest.mark.parametrize("encoding", ENCODINGS)
+    @pytest.mark.parametrize(
+        "path, limit",
+        [
+            ("/api/import/apple-health/webhook", "webhook_max_body_bytes"),
+            ("/api/import/apple-health/webhook/stream", "webhook_stream_max_body_bytes"),
+        ],
+    )
+    def test_rejects_bodies_over_the_decompressed_limit(self, monkeypatch, path, limit, encoding):
+        body = json.dumps(PAYLOAD).encode()
+        monkeypatch.setattr(settings, limit, len(body))
+        headers = {} if encoding == "identity" else {"Content-Encoding": encoding}
+
+        fits = client.post(
+            f"{path}?owner=body_fits", content=_compress(body, encoding), headers=headers
+        )
+        # A few KB on the wire that inflate to 16 MiB.
+        bomb = _compress(b" " * (16 * 1024 * 1024) + body, encoding)
+        response = client.post(f"{path}?owner=body_bomb", content=bomb, headers=headers)
+        webhook_buffer.flush()
+
+        assert fits.status_code in (200, 202)
+        assert response.status_code == 413
+        assert _stored("body_bomb") == []
+
+    @pytest.mark.parametrize(
+        "headers, body, status",
+        [
+            ({"Content-Encoding": "br"}, b"{}", 415),
+            ({"Content-Type": "text/csv"}, b"a,b", 415),
+            ({"Content-Encoding": "gzip"}, b"not gzip", 400),
+            ({"Content-Encoding": "gzip"}, gzip.compress(b'{"metrics": []}')[:-8], 400),
+            ({"Content-Type": "application/msgpack"}, b"\xc1", 400),
+            ({"Content-Type": "application/msgpack"}, msgpack.packb([1, 2]), 422),
+        ],
+    )
+    def test_rejects_bad_bodies(self, headers, body, status):
+        response = client.post("/api/import/apple-health/webhook", content=body, headers=headers)
+
+        assert response.status_code == status
@@ -0,0 +1,197 @@
+"""Tests for the retention policy at import time and for compaction of stored rows."""
+
+import io
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.retention import RETENTION_POLICY_KEY
+
+client = TestClient(app)
+
+# walking_heart_rate is not used by other tests, so compaction here leaves their rows alone.
+POLICY = (
+    '{"walking_heart_rate": [{"after_days": 30, "bucket": "1h"},'
+    ' {"after_days": 365, "bucket": "1d"}]}'
+)
+
+NOW = datetime.now(UTC)
+OLD_DAY = (NOW - timedelta(days=400)).date()
+OLDER_HOUR = (NOW - timedelta(days=100)).replace(
+    hour=8, minute=0, second=0, microsecond=0, tzinfo=None
+)
+
+
+def _xml(samples: list[tuple[datetime, float]], offset: str = "+0000") -> bytes:
+    records = "".join(
+        f'<Record type="HKQuantityTypeIdentifierWalkingHeartRateAverage" value="{value}" '
+        f'unit="count/min" startDate="{at:%Y-%m-%d %H:%M:%S} {offset}" />'
+        for at, value in samples
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><HealthData>{records}</HealthData>'.encode()
+
+
+def _import(
+    owner: str,
+    samples: list[tuple[datetime, float]],
+    aggregate_days: int = 30,
+    offset: str = "+0000",
+) -> dict:
+    response = client.post(
+        f"/api/import/apple-health?owner={owner}&aggregate_days={aggregate_days}",
+        files={"file": ("export.xml", io.BytesIO(_xml(samples, offset)), "application/xml")},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def _rows(owner: str) -> list[dict]:
+    metrics = client.get(f"/api/health-metrics?owner={owner}").json()
+    return sorted(metrics, key=lambda m: m["measured_at"])
+
+
+def _at(hour: int, minute: int = 0) -> datetime:
+    return datetime.combine(OLD_DAY, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+@pytest.fixture
+def retention_policy():
+    config = client.post("/api/config/", json={"key": RETENTION_POLICY_KEY, "value": POLICY})
+    assert config.status_code == 200
+    yield
+    client.delete(f"/api/config/{config.json()['id']}")
+
+
+class TestImportRetention:
+    """Tests for applying the configured policy while importing."""
+
+    def test_import_buckets_by_tier(self, retention_policy):
+        samples = [
+            (_at(8), 60.0),
+            (_at(9), 90.0),
+            (_at(10), 75.0),
+            (OLDER_HOUR + timedelta(minutes=5), 100.0),
+            (OLDER_HOUR + timedelta(minutes=20), 110.0),
+            (NOW - timedelta(days=1), 95.0),
+        ]
+
+        result = _import("retention_import", samples)
+
+        assert result == {"total_records": 3, "imported": 3, "skipped": 0, "errors": 0}
+        daily, hourly, raw = _rows("retention_import")
+        assert daily["measured_at"] == f"{OLD_DAY}T12:00:00"
+        assert (daily["value"], daily["sample_count"]) == (75.0, 3)
+        assert (daily["value_min"], daily["value_max"], daily["resolution_seconds"]) == (
+            60.0,
+            90.0,
+            86_400,
+        )
+        assert hourly["measured_at"] == (OLDER_HOUR + timedelta(minutes=30)).isoformat()
+        assert (hourly["value"], hourly["resolution_seconds"]) == (105.0, 3600)
+        assert (raw["value"], raw["resolution_seconds"], raw["sample_count"]) == (95.0, 0, None)
+
+    def test_buckets_in_utc_like_compaction(self, retention_policy):
+        # 01:30 and 23:30 at UTC+2 fall on the previous day and the same day in UTC.
+        samples = [(_at(1, 30), 60.0), (_at(23, 30), 90.0)]
+
+        _import("retention_tz_import", samples, offset="+0200")
+        _import("retention_tz_compact", samples, aggregate_days=0, offset="+0200")
+        client.post("/api/health-metrics/compact")
+
+        previous_day = OLD_DAY - timedelta(days=1)
+        for owner in ("retention_tz_import", "retention_tz_compact"):
+            assert [(m["measured_at"], m["value"]) for m in _rows(owner)] == [
+                (f"{previous_day}T12:00:00", 60.0),
+                (f"{OLD_DAY}T12:00:00", 90.0),
+            ]
+
+    def test_aggregate_days_zero_keeps_raw(self, retention_policy):
+        _import("retention_raw", [(_at(8), 60.0), (_at(9), 90.0)], aggregate_days=0)
+
+        assert [m["resolution_seconds"] for m in _rows("retention_raw")] == [0, 0]
+
+
+class TestCompaction:
+    """Tests for rolling up rows already stored."""
+
+    def test_compacts_stored_rows(self, retention_policy):
+        owner = "retention_compact"
+        _import(owner, [(_at(8), 60.0), (_at(9), 90.0)], aggregate_days=0)
+        client.post(
+            "/api/health-metrics",
+            json={
+                "metric_type": "walking_heart_rate",
+                "value": 70.0,
+                "unit": "bpm",
+                "measured_at": _at(10).isoformat(),
+                "owner": owner,
+            },
+        )
+
+        first = client.post("/api/health-metrics/compact").json()
+        # A late import of more raw samples for the same day joins the bucket.
+        _import(owner, [(_at(11), 120.0)], aggregate_days=0)
+        second = client.post("/api/health-metrics/compact").json()
+
+        assert first["rows_compacted"] >= 2
+        assert second["rows_compacted"] >= 1
+        bucket, manual = sorted(_rows(owner), key=lambda m: m["source"])
+        assert (manual["value"], manual["source"], manual["resolution_seconds"]) == (
+            70.0,
+            "manual",
+            0,
+        )
+        assert bucket["measured_at"] == f"{OLD_DAY}T12:00:00"
+        assert (bucket["value"], bucket["sample_count"]) == (90.0, 3)
+        assert (bucket["value_min"], bucket["value_max"]) == (60.0, 120.0)
+
+    def test_skips_bucket_under_manual_entry(self, retention_policy):
+        owner = "retention_blocked"
+        _import(owner, [(_at(8), 60.0), (_at(9), 90.0)], aggregate_days=0)
+        client.post(
+            "/api/health-metrics",
+            json={
+                "metric_type": "walking_heart_rate",
+                "value": 70.0,
+                "unit": "bpm",
+                "measured_at": _at(12).isoformat(),
+                "owner": owner,
+            },
+        )
+
+        client.post("/api/health-metrics/compact")
+
+        # The daily bucket's noon slot is taken, so the rows fall through to the hourly tier.
+        assert [(m["value"], m["resolution_seconds"]) for m in _rows(owner)] == [
+            (60.0, 3600),
+            (90.0, 3600),
+            (70.0, 0),
+        ]
+
+    def test_rollups_follow_compacted_rows(self, retention_policy):
+        owner = "retention_rollups"
+        _import(owner, [(_at(8), 60.0), (_at(9), 90.0)], aggregate_days=0)
+
+        client.post("/api/health-metrics/compact")
+        hours = client.get(
+            f"/api/health-metrics/summary?owner={owner}&metric_type=walking_heart_rate&period=hour"
+        ).json()
+        [bucket] = _rows(owner)
+        client.delete(f"/api/health-metrics/{bucket['id']}")
+        after_delete = client.get(
+            f"/api/health-metrics/summary?owner={owner}&metric_type=walking_heart_rate&period=hour"
+        ).json()
+
+        # The day's samples now count in the hour of the bucket row, which a delete takes out.
+        assert [(h["bucket_start"], h["sample_count"], h["mean"]) for h in hours] == [
+            (f"{OLD_DAY}T12:00:00", 2, 75.0)
+        ]
+        assert after_delete == []
+
+    def test_without_policy_is_a_no_op(self):
+        assert client.post("/api/health-metrics/compact").json() == {
+            "rows_compacted": 0,
+            "buckets_written": 0,
+        }
@@ -0,0 +1,118 @@
+"""Tests for nightly sleep totals from sleep analysis Records."""
+
+import io
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.services.apple_health_parser import AppleHealthParser
+from app.services.parse_pool import parse_pool
+from app.services.retention import RetentionPolicy
+from app.services.sleep_nights import merged_length
+
+NOW = datetime(2024, 6, 1, tzinfo=UTC)
+NO_ROLLUPS = RetentionPolicy({})
+
+
+def _sleep(source: str, stage: str, start: str, end: str) -> str:
+    return (
+        f'<Record type="HKCategoryTypeIdentifierSleepAnalysis" sourceName="{source}" '
+        f'value="HKCategoryValueSleepAnalysis{stage}" '
+        f'startDate="{start} +0200" endDate="{end} +0200"/>'
+    )
+
+
+def _export(*records: str) -> bytes:
+    return ("<HealthData>\n" + "\n".join(records) + "\n</HealthData>").encode()
+
+
+# The phone logs time in bed, the watch stages and a sleep app plain "asleep".
+NIGHT = [
+    _sleep("iPhone", "InBed", "2024-05-19 22:30:00", "2024-05-20 07:00:00"),
+    _sleep("Watch", "AsleepCore", "2024-05-19 23:00:00", "2024-05-20 01:00:00"),
+    _sleep("Watch", "AsleepDeep", "2024-05-20 01:00:00", "2024-05-20 02:00:00"),
+    _sleep("Watch", "Awake", "2024-05-20 02:00:00", "2024-05-20 02:15:00"),
+    _sleep("Watch", "AsleepREM", "2024-05-20 02:15:00", "2024-05-20 03:15:00"),
+    _sleep("Watch", "AsleepCore", "2024-05-20 03:15:00", "2024-05-20 06:30:00"),
+    _sleep("Sleep App", "Asleep", "2024-05-20 03:00:00", "2024-05-20 06:45:00"),
+    # Next night; a late afternoon nap belongs to it as well.
+    _sleep("Watch", "AsleepCore", "2024-05-20 16:00:00", "2024-05-20 16:30:00"),
+    _sleep("Watch", "AsleepCore", "2024-05-20 23:00:00", "2024-05-21 06:00:00"),
+]
+
+
+def _totals(content: bytes, **kwargs) -> list[tuple[str, float, datetime]]:
+    metrics = AppleHealthParser().iter_xml(
+        io.BytesIO(content), "test_user", now=NOW, policy=NO_ROLLUPS, **kwargs
+    )
+    return [(m.metric_type, m.value, m.measured_at) for m in metrics]
+
+
+class TestSleepNights:
+    """Tests for merging the stretches of a night per stage."""
+
+    def test_nightly_totals(self):
+        first = datetime(2024, 5, 20, tzinfo=UTC)
+        second = datetime(2024, 5, 21, tzinfo=UTC)
+
+        assert _totals(_export(*NIGHT)) == [
+            # 23:00-02:00 and 02:15-06:45 asleep, whichever source said so.
+            ("sleep_hours", 7.5, first),
+            ("sleep_in_bed_hours", 8.5, first),
+            ("sleep_awake_hours", 0.25, first),
+            ("sleep_core_hours", 5.25, first),
+            ("sleep_deep_hours", 1.0, first),
+            ("sleep_rem_hours", 1.0, first),
+            ("sleep_hours", 7.5, second),
+            ("sleep_core_hours", 7.5, second),
+        ]
+
+    def test_drops_nights_partly_outside_the_window(self):
+        parser = AppleHealthParser()
+        record_filter = parser.record_filter(["sleep_hours"], since=datetime(2024, 5, 20))
+
+        assert _totals(_export(*NIGHT), record_filter=record_filter) == [
+            ("sleep_hours", 7.5, datetime(2024, 5, 21, tzinfo=UTC)),
+            ("sleep_core_hours", 7.5, datetime(2024, 5, 21, tzinfo=UTC)),
+        ]
+
+    def test_skips_unknown_stages_and_dates(self):
+        content = _export(
+            _sleep("Watch", "Dozing", "2024-05-19 23:00:00", "2024-05-20 01:00:00"),
+            _sleep("Watch", "AsleepCore", "2024-05-19 23:00:00", "not a date"),
+            _sleep("Watch", "AsleepDeep", "2024-05-19 23:00:00", "2024-05-19 23:30:00"),
+        )
+
+        assert _totals(content) == [
+            ("sleep_hours", 0.5, datetime(2024, 5, 20, tzinfo=UTC)),
+            ("sleep_deep_hours", 0.5, datetime(2024, 5, 20, tzinfo=UTC)),
+        ]
+
+    def test_merged_length(self):
+        assert merged_length([]) == 0
+        assert merged_length([(5, 9), (0, 2), (1, 3), (8, 10), (3, 4)]) == 9
+
+    @pytest.mark.parametrize("shards", [3, 8])
+    def test_sharded_parse_matches_single_parse(self, tmp_path, shards):
+        records = []
+        for night in range(12):
+            start = datetime(2024, 5, 1, 22) + timedelta(days=night)
+            for stretch in range(16):
+                stage = ("AsleepCore", "AsleepDeep", "AsleepREM", "Awake")[stretch % 4]
+                end = start + timedelta(minutes=35)
+                records.append(_sleep("Watch", stage, f"{start:%F %T}", f"{end:%F %T}"))
+                records.append(_sleep("iPhone", "InBed", f"{start:%F %T}", f"{end:%F %T}"))
+                start += timedelta(minutes=30)
+        path = tmp_path / "export.xml"
+        path.write_bytes(_export(*records))
+
+        sharded = parse_pool.iter_export(path, "test_user", NO_ROLLUPS, now=NOW, shards=shards)
+        rows = sorted(
+            (row["metric_type"], row["value"], row["measured_at"])
+            for batch in sharded
+            for row in batch.rows()
+        )
+
+        expected = _totals(path.read_bytes())
+        assert len(expected) == 12 * 6
+        assert rows == sorted((t, v, at.replace(tzinfo=None)) for t, v, at in expected)
@@ -0,0 +1,178 @@
+"""Tests for importing CSV and Garmin FIT files through source adapters."""
+
+import io
+import struct
+from datetime import UTC, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.fit_reader import FIT_EPOCH
+from app.services.source_adapters import CsvAdapter, FitAdapter
+
+client = TestClient(app)
+
+NOW = datetime(2024, 6, 1, tzinfo=UTC)
+
+UINT8, UINT16, UINT32 = 0x02, 0x84, 0x86
+
+
+def _seconds(value: datetime) -> int:
+    return int((value - FIT_EPOCH).total_seconds())
+
+
+def _definition(
+    local: int,
+    number: int,
+    fields: list[tuple[int, int, int]],
+    big_endian: bool = False,
+    developer: tuple[int, ...] = (),
+) -> bytes:
+    header = 0x40 | local | (0x20 if developer else 0)
+    order = ">" if big_endian else "<"
+    out = bytes([header, 0, int(big_endian)]) + struct.pack(order + "H", number)
+    out += bytes([len(fields)]) + b"".join(bytes(field) for field in fields)
+    if developer:
+        out += bytes([len(developer)]) + b"".join(
+            bytes([i, size, 0]) for i, size in enumerate(developer)
+        )
+    return out
+
+
+def _data(header: int, fmt: str, *values) -> bytes:
+    return bytes([header]) + struct.pack(fmt, *values)
+
+
+def _fit(*records: bytes) -> bytes:
+    data = b"".join(records)
+    return struct.pack("<BBHI4s", 12, 0x20, 2100, len(data), b".FIT") + data + b"\0\0"
+
+
+HR_AT = datetime(2024, 5, 20, 7, 0, tzinfo=UTC)
+
+ACTIVITY = _fit(
+    # record: timestamp, heart rate, and a field that is not imported.
+    _definition(0, 20, [(253, 4, UINT32), (3, 1, UINT8), (2, 2, UINT16)]),
+    _data(0, "<IBH", _seconds(HR_AT), 121, 500),
+    _data(0, "<IBH", _seconds(HR_AT) + 1, 0xFF, 500),  # no reading
+    # Compressed timestamp header: local type 1, 2 s after the last timestamp.
+    _definition(1, 20, [(3, 1, UINT8)], developer=(2,)),
+    _data(0x80 | 1 << 5 | (_seconds(HR_AT) + 3) & 0x1F, "<BH", 124, 0),
+    # weight_scale written big-endian.
+    _definition(2, 30, [(253, 4, UINT32), (0, 2, UINT16), (1, 2, UINT16)], big_endian=True),
+    _data(2, ">IHH", _seconds(HR_AT), 7510, 2150),
+    # monitoring with only the low 16 bits of its timestamp.
+    _definition(3, 55, [(26, 2, UINT16), (27, 1, UINT8)]),
+    _data(3, "<HB", (_seconds(HR_AT) + 60) & 0xFFFF, 58),
+)
+
+
+def _fields(adapter, content: bytes) -> list[tuple]:
+    return list(adapter.iter_fields(io.BytesIO(content), NOW))
+
+
+class TestFitAdapter:
+    """Tests for reading FIT messages as a stream."""
+
+    def test_reads_readings(self):
+        fields = _fields(FitAdapter(), ACTIVITY)
+
+        assert fields == [
+            ("heart_rate", 121.0, "bpm", HR_AT),
+            ("heart_rate", 124.0, "bpm", datetime(2024, 5, 20, 7, 0, 3, tzinfo=UTC)),
+            ("weight", 75.1, "kg", HR_AT),
+            ("body_fat_percentage", 21.5, "%", HR_AT),
+            ("heart_rate", 58.0, "bpm", datetime(2024, 5, 20, 7, 1, tzinfo=UTC)),
+        ]
+
+    def test_chained_files(self):
+        assert len(_fields(FitAdapter(), ACTIVITY + ACTIVITY)) == 10
+
+    @pytest.mark.parametrize(
+        "content, message",
+        [
+            (b"", "empty"),
+            (b"\x0c\x20\x34\x08\x00\x00\x00\x00.CSV", "signature"),
+            (ACTIVITY[:-5], "Truncated"),
+            (_fit(_data(0, "<B", 1)), "undefined local type"),
+        ],
+    )
+    def test_rejects_invalid_files(self, content, message):
+        with pytest.raises(ValueError, match=message):
+            _fields(FitAdapter(), content)
+
+
+class TestCsvAdapter:
+    """Tests for reading readings from a CSV."""
+
+    def test_reads_rows(self):
+        content = (
+            "﻿Measured_At,metric_type,value,unit,notes\n"
+            "2024-05-20T07:00:00Z,weight,165,lb,after run\n"
+            "2024-05-20T08:00:00+02:00,heart_rate,61,,\n"
+            "2024-05-20T08:00:00,not_a_metric,1,,\n"
+            "yesterday,heart_rate,60,,\n"
+            "2024-05-20T09:00:00,heart_rate,fast,,\n"
+            "2030-01-01T00:00:00,heart_rate,60,,\n"
+            "2024-05-20T09:00:00\n"
+        ).encode()
+
+        assert _fields(CsvAdapter(), content) == [
+            ("weight", 74.84, "kg", datetime(2024, 5, 20, 7, tzinfo=UTC)),
+            ("heart_rate", 61.0, "bpm", datetime.fromisoformat("2024-05-20T08:00:00+02:00")),
+        ]
+
+    @pytest.mark.parametrize(
+        "content, message",
+        [(b"", "empty"), (b"metric_type,value\n", "no measured_at column")],
+    )
+    def test_rejects_invalid_files(self, content, message):
+        with pytest.raises(ValueError, match=message):
+            _fields(CsvAdapter(), content)
+
+
+class TestImportSourceFile:
+    """Tests for the generic upload route."""
+
+    def _post(self, source: str, filename: str, content: bytes, owner: str):
+        return client.post(
+            f"/api/import/{source}?owner={owner}&aggregate_days=0",
+            files={"file": (filename, io.BytesIO(content), "application/octet-stream")},
+        )
+
+    def test_import_csv(self):
+        content = b"metric_type,value,measured_at\nheart_rate,64,2024-05-20T07:00:00Z\n"
+
+        response = self._post("csv", "readings.csv", content, "csv_user")
+        repeat = self._post("csv", "readings.csv", content, "csv_user")
+
+        assert response.status_code == 200
+        assert response.json()["imported"] == 1
+        assert repeat.headers["Idempotent-Replayed"] == "true"
+        metrics = client.get("/api/health-metrics?owner=csv_user").json()
+        assert [(m["metric_type"], m["value"], m["source"]) for m in metrics] == [
+            ("heart_rate", 64.0, "csv_import")
+        ]
+
+    def test_import_fit(self):
+        response = self._post("fit", "activity.fit", ACTIVITY, "fit_user")
+
+        assert response.status_code == 200
+        assert response.json()["imported"] == 5
+        metrics = client.get("/api/health-metrics?owner=fit_user").json()
+        assert {m["source"] for m in metrics} == {"fit_import"}
+
+    @pytest.mark.parametrize(
+        "source, filename, content, status",
+        [
+            ("fit", "activity.csv", ACTIVITY, 400),
+            ("fit", "activity.fit", b"not a fit file", 400),
+            ("csv", "readings.csv", b"value\n1\n", 400),
+            ("gpx", "route.gpx", b"<gpx/>", 422),
+        ],
+    )
+    def test_rejects_bad_uploads(self, source, filename, content, status):
+        response = self._post(source, filename, content, "source_user")
+
+        assert response.status_code == status
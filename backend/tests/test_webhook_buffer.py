@@ -0,0 +1,115 @@
+"""Tests for buffered, coalesced webhook writes."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.main import app
+from app.models import HealthMetric
+from app.services import webhook_buffer as webhook_buffer_module
+from app.services.metric_batch import MetricBatch
+from app.services.webhook_buffer import BufferFullError, WebhookBuffer, webhook_buffer
+
+client = TestClient(app)
+
+HOUR_US = 3_600_000_000
+
+
+def _batch(owner: str, *values: float, hour: int = 0) -> MetricBatch:
+    batch = MetricBatch(owner)
+    for i, value in enumerate(values):
+        batch.append("heart_rate", value, "bpm", (hour + i) * HOUR_US, "apple_health_webhook")
+    return batch
+
+
+def _stored(owner: str) -> list[float]:
+    with SessionLocal() as db:
+        values = db.query(HealthMetric.value).filter(HealthMetric.owner == owner)
+        return sorted(value for (value,) in values)
+
+
+class TestWebhookBuffer:
+    """Tests for queueing and flushing webhook batches."""
+
+    def test_coalesces_and_keeps_latest_payload(self):
+        buffer = WebhookBuffer()
+
+        accepted = buffer.put(_batch("buffer_a", 60.0, 61.0))
+        buffer.put(_batch("buffer_a", 70.0, hour=1))
+        buffer.put(_batch("buffer_b", 80.0))
+        assert buffer.rows == 4
+
+        result = buffer.flush()
+
+        assert accepted.model_dump() == {
+            "total_records": 2,
+            "imported": 2,
+            "skipped": 0,
+            "errors": 0,
+        }
+        assert (result.total_records, result.imported, result.skipped) == (3, 3, 1)
+        assert buffer.rows == 0
+        assert _stored("buffer_a") == [60.0, 70.0]
+        assert _stored("buffer_b") == [80.0]
+
+    def test_rejects_batches_when_full(self, monkeypatch):
+        monkeypatch.setattr(settings, "webhook_buffer_max_rows", 2)
+        buffer = WebhookBuffer()
+
+        buffer.put(_batch("buffer_full", 60.0, 61.0, 62.0))
+
+        with pytest.raises(BufferFullError):
+            buffer.put(_batch("buffer_full", 63.0, hour=5))
+        buffer.flush()
+        assert buffer.put(_batch("buffer_full", 63.0, hour=5)).imported == 1
+
+    def test_spools_when_database_is_down_and_replays(
+        self, monkeypatch, tmp_path, unreachable_session
+    ):
+        monkeypatch.setattr(settings, "webhook_spool_dir", tmp_path)
+        buffer = WebhookBuffer()
+        accepted = buffer.put(_batch("buffer_spool", 90.0, 91.0))
+
+        with monkeypatch.context() as patched:
+            patched.setattr(webhook_buffer_module, "SessionLocal", unreachable_session)
+            flushed = buffer.flush()
+
+        assert accepted.imported == 2
+        assert flushed.errors == 0
+        assert len(list(tmp_path.glob("*.spool"))) == 1
+        assert _stored("buffer_spool") == []
+
+        assert WebhookBuffer().replay_spool() == 2
+        assert list(tmp_path.iterdir()) == []
+        assert _stored("buffer_spool") == [90.0, 91.0]
+
+
+class TestWebhookBackpressure:
+    """Tests for the webhook's answers while the buffer is full."""
+
+    def test_answers_429_when_full(self, monkeypatch):
+        webhook_buffer.flush()
+        monkeypatch.setattr(settings, "webhook_buffer_max_rows", 1)
+        url = "/api/import/apple-health/webhook?owner=backpressure_user"
+
+        def post(day: int):
+            payload = {
+                "metrics": [
+                    {
+                        "name": "heart_rate",
+                        "units": "bpm",
+                        "data": [{"date": f"2024-04-{day:02d}T10:00:00Z", "qty": 60}],
+                    }
+                ]
+            }
+            return client.post(url, json=payload)
+
+        accepted = post(1)
+        rejected = post(2)
+        webhook_buffer.flush()
+
+        assert accepted.status_code == 202
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"]
+        assert _stored("backpressure_user") == [60.0]
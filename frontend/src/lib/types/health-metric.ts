@@ -1,4 +1,9 @@
-export type SourceType = 'manual' | 'apple_health_import' | 'apple_health_webhook';
+export type SourceType =
+	| 'manual'
+	| 'apple_health_import'
+	| 'apple_health_webhook'
+	| 'csv_import'
+	| 'fit_import';
 
 export interface HealthMetric {
 	id: number;
@@ -31,3 +36,8 @@ export interface HealthMetricUpdate {
 	notes?: string;
 	is_active?: boolean;
 }
+
+export interface SeriesPoint {
+	measured_at: string;
+	value: number;
+}
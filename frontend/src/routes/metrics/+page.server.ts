@@ -1,5 +1,5 @@
 import { get, post, put, del } from '$lib/utils/api';
-import type { HealthMetric } from '$lib/types/health-metric';
+import type { HealthMetric, SeriesPoint } from '$lib/types/health-metric';
 import type { Actions, PageServerLoad } from './$types';
 import { fail } from '@sveltejs/kit';
 
@@ -9,19 +9,24 @@ export const load: PageServerLoad = async ({ url }) => {
 	const endDate = url.searchParams.get('end_date');
 
 	try {
-		let endpoint = `/api/health-metrics?metric_type=${metricType}`;
-		if (startDate) endpoint += `&start_date=${startDate}`;
-		if (endDate) endpoint += `&end_date=${endDate}`;
+		let range = '';
+		if (startDate) range += `&from=${startDate}`;
+		if (endDate) range += `&to=${endDate}`;
 
-		const metrics = await get<HealthMetric[]>(endpoint);
+		const [metrics, series] = await Promise.all([
+			get<HealthMetric[]>(`/api/health-metrics?metric_type=${metricType}${range}`),
+			get<SeriesPoint[]>(`/api/health-metrics/series?metric_type=${metricType}${range}`)
+		]);
 		return {
 			metrics,
+			series,
 			selectedType: metricType
 		};
 	} catch (error) {
 		console.error('Failed to load metrics:', error);
 		return {
 			metrics: [],
+			series: [],
 			selectedType: metricType
 		};
 	}